@@ -22,6 +22,11 @@ setup(
             'attempts_scoreboard = xblock.problem:AttemptsScoreboardBlock',
             'slider = xblock.slider:Slider',
             'view_counter = xblock.view_counter:ViewCounter',
-        ]
+        ],
+        # The class tags of the blocks above, named by tag, so that blocks
+        # can be found by tag without importing them.  See XBlock.tag_entry_point.
+        'xblock.v1.tags': [
+            'checker = xblock.problem:EqualityCheckerBlock',
+        ],
     }
 )
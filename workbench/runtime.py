@@ -4,7 +4,6 @@ Code in this file is a mix of Runtime layer and Workbench layer.
 
 """
 
-import itertools
 import logging
 
 try:
@@ -12,11 +11,15 @@ try:
 except ImportError:
     import json
 
+from django.conf import settings
 from django.template import loader as django_template_loader, \
     Context as DjangoContext
 
+from xblock.core import XBlock
 from xblock.fields import Scope, ScopeIds
+from xblock.instrumentation import MultiInstrumentation, StatsCollector, Tracer
 from xblock.runtime import DbModel, KeyValueStore, Runtime, NoSuchViewError, UsageStore
+from xblock.structure_index import IndexingFieldData, StructureIndex
 from xblock.fragment import Fragment
 
 from .util import make_safe_for_html
@@ -102,19 +105,32 @@ class MemoryUsageStore(UsageStore):
     """A simple dict-based implementation of UsageStore."""
 
     def __init__(self):
-        self._ids = itertools.count()
+        self._id_count = 0
         self._usages = {}
         self._definitions = {}
 
     def _next_id(self):
         """Generate a new id."""
-        return str(next(self._ids))
+        self._id_count += 1
+        return str(self._id_count - 1)
 
     def clear(self):
         """Remove all entries."""
         self._usages.clear()
         self._definitions.clear()
 
+    def dump(self):
+        """The contents of the store, as plain dicts (see `load`)."""
+        return (self._id_count, dict(self._usages), dict(self._definitions))
+
+    def load(self, dumped):
+        """Add the contents of a store produced by `dump`."""
+        id_count, usages, definitions = dumped
+        # Don't hand out the loaded ids again.
+        self._id_count = max(self._id_count, id_count)
+        self._usages.update(usages)
+        self._definitions.update(definitions)
+
     def create_usage(self, def_id):
         """Make a usage, storing its definition id."""
         usage_id = self._next_id()
@@ -125,6 +141,12 @@ class MemoryUsageStore(UsageStore):
         """Get a definition_id by its usage id."""
         return self._usages[usage_id]
 
+    def set_definition_id(self, usage_id, def_id):
+        """Point the usage `usage_id` at the definition `def_id`."""
+        if usage_id not in self._usages:
+            raise KeyError(usage_id)
+        self._usages[usage_id] = def_id
+
     def create_definition(self, block_type):
         """Make a definition, storing its block type."""
         def_id = self._next_id()
@@ -146,8 +168,18 @@ class WorkbenchRuntime(Runtime):
     """
 
     def __init__(self, student_id=None):
-        super(WorkbenchRuntime, self).__init__(USAGE_STORE, DbModel(WORKBENCH_KVS))
+        super(WorkbenchRuntime, self).__init__(
+            USAGE_STORE, IndexingFieldData(DbModel(WORKBENCH_KVS), STRUCTURE_INDEX),
+            instrumentation=MultiInstrumentation(WORKBENCH_STATS, WORKBENCH_TRACER),
+        )
         self.student_id = student_id
+        self.structure_index = STRUCTURE_INDEX
+
+    def scope_ids(self, usage_id):
+        """The ScopeIds of the block `usage_id`, for the current student."""
+        def_id = self.usage_store.get_definition_id(usage_id)
+        block_type = self.usage_store.get_block_type(def_id)
+        return ScopeIds(self.student_id, block_type, def_id, usage_id)
 
     def get_block(self, usage_id):
         """
@@ -156,10 +188,8 @@ class WorkbenchRuntime(Runtime):
         The `usage_id` is used to find the XBlock class and data.
 
         """
-        def_id = self.usage_store.get_definition_id(usage_id)
-        block_type = self.usage_store.get_block_type(def_id)
-        keys = ScopeIds(self.student_id, block_type, def_id, usage_id)
-        block = self.construct_xblock(block_type, keys)
+        keys = self.scope_ids(usage_id)
+        block = self.construct_xblock(keys.block_type, keys)
         return block
 
     def render(self, block, view_name, context=None):
@@ -208,65 +238,204 @@ class WorkbenchRuntime(Runtime):
         )
 
     def query(self, block):
-        return _BlockSet(self, [block])
+        usage_id = block.scope_ids.usage_id
+        return _BlockSet(self, lambda: [usage_id], {usage_id: block})
+
+
+def _unique(usage_ids):
+    """Produce the distinct ids in `usage_ids`, in order."""
+    seen = set()
+    for usage_id in usage_ids:
+        if usage_id not in seen:
+            seen.add(usage_id)
+            yield usage_id
 
 
 class _BlockSet(object):
-    def __init__(self, runtime, blocks):
+    """
+    A set of blocks, by usage id, for the `query` interface.
+
+    A _BlockSet is lazy: each step makes a new _BlockSet that will produce
+    its usage ids from those of the last step as they are needed, so a
+    query does no work until it is iterated, and stops as soon as the
+    caller stops.  Iterating it again runs the query again.
+
+    The structure of the tree comes from the runtime's `StructureIndex`
+    where it can, so blocks are only constructed when their fields are
+    needed.  Blocks the index doesn't know are constructed and read.
+
+    """
+    def __init__(self, runtime, source, blocks=None):
         self.runtime = runtime
-        self.blocks = blocks
+        # A function producing an iterable of our usage ids, maybe repeated.
+        self._source = source
+        # The blocks already constructed, by usage id.
+        self._blocks = blocks if blocks is not None else {}
+
+    def _block(self, usage_id):
+        """Get the block for `usage_id`."""
+        block = self._blocks.get(usage_id)
+        if block is None:
+            block = self._blocks[usage_id] = self.runtime.get_block(usage_id)
+        return block
+
+    def _derive(self, step):
+        """
+        A new _BlockSet of the usage ids produced by `step` from our usage
+        ids, sharing our constructed blocks.
+        """
+        return _BlockSet(self.runtime, lambda: step(self.usage_ids()), self._blocks)
+
+    def _parent_id(self, usage_id):
+        """The usage id of the parent of `usage_id`, or None."""
+        index = self.runtime.structure_index
+        if index.knows(usage_id):
+            return index.parent(usage_id)
+        return self._block(usage_id).parent
+
+    def _child_ids(self, usage_id):
+        """The usage ids of the children of `usage_id`."""
+        index = self.runtime.structure_index
+        if index.knows(usage_id):
+            return index.children(usage_id)
+        return getattr(self._block(usage_id), "children", ())
+
+    def _has_tag(self, usage_id, tag, tagged_types):
+        """
+        Is `usage_id` tagged `tag`?  `tagged_types` are the block types
+        whose classes are tagged `tag`.
+        """
+        # Allow this method to access _class_tags for each block
+        # pylint: disable=W0212
+        index = self.runtime.structure_index
+        if index.knows(usage_id):
+            return index.has_tag(usage_id, tag)
+        if usage_id not in self._blocks:
+            # Blocks tagged by their class needn't be constructed.
+            usage_store = self.runtime.usage_store
+            if usage_store.get_block_type(usage_store.get_definition_id(usage_id)) in tagged_types:
+                return True
+        block = self._block(usage_id)
+        return block.name == tag or tag in (block.tags or ()) or tag in block._class_tags
+
+    def usage_ids(self):
+        """Produce the usage ids of the blocks in this set."""
+        return _unique(self._source())
 
     def __iter__(self):
-        return iter(self.blocks)
+        return (self._block(usage_id) for usage_id in self.usage_ids())
+
+    def first(self):
+        """The first block in this set, or None if it is empty."""
+        return next(iter(self), None)
+
+    def exists(self):
+        """Are there any blocks in this set?"""
+        return next(self.usage_ids(), None) is not None
 
     def parent(self):
-        them = set()
-        for block in self.blocks:
-            if block.parent:
-                parent = self.runtime.get_block(block.parent)
-                them.add(parent)
-        return _BlockSet(self.runtime, them)
+        def step(usage_ids):  # pylint: disable=C0111
+            for usage_id in usage_ids:
+                parent_id = self._parent_id(usage_id)
+                if parent_id:
+                    yield parent_id
+        return self._derive(step)
 
     def children(self):
-        them = set()
-        for block in self.blocks:
-            for child_id in getattr(block, "children", ()):
-                child = self.runtime.get_block(child_id)
-                them.add(child)
-        return _BlockSet(self.runtime, them)
+        def step(usage_ids):  # pylint: disable=C0111
+            for usage_id in usage_ids:
+                for child_id in self._child_ids(usage_id):
+                    yield child_id
+        return self._derive(step)
 
     def descendants(self):
-        them = set()
+        def step(usage_ids):  # pylint: disable=C0111
+            for usage_id in usage_ids:
+                stack = list(reversed(self._child_ids(usage_id)))
+                while stack:
+                    descendant = stack.pop()
+                    yield descendant
+                    stack.extend(reversed(self._child_ids(descendant)))
+        return self._derive(step)
 
-        def recur(block):
-            for child_id in getattr(block, "children", ()):
-                child = self.runtime.get_block(child_id)
-                them.add(child)
-                recur(child)
+    def tagged(self, tag):
+        def step(usage_ids):  # pylint: disable=C0111
+            tagged_types = frozenset(XBlock.tagged_plugin_names(tag))
+            for usage_id in usage_ids:
+                if self._has_tag(usage_id, tag, tagged_types):
+                    yield usage_id
+        return self._derive(step)
 
-        for block in self.blocks:
-            recur(block)
+    def attr(self, attr_name):
+        for block in self:
+            if hasattr(block, attr_name):
+                yield getattr(block, attr_name)
 
-        return _BlockSet(self.runtime, them)
+    # Aggregates.  These read the field `attr_name` of all the blocks that
+    # haven't read it yet with one `get_many_for_blocks` on their FieldData,
+    # rather than a read for each block.  Blocks whose class has no attribute
+    # `attr_name` don't count, and aren't constructed.
 
-    def tagged(self, tag):
-        # Allow this method to access _class_tags for each block
-        # pylint: disable=W0212
-        them = set()
-        for block in self.blocks:
-            if block.name == tag:
-                them.add(block)
-            if block.tags and tag in block.tags:
-                them.add(block)
-            elif tag in block._class_tags:
-                them.add(block)
-        return _BlockSet(self.runtime, them)
+    def _class_attr(self, block_type, attr_name):
+        """The class attribute `attr_name` of blocks of `block_type`, or None."""
+        block_class = self.runtime.block_class(block_type)
+        return getattr(block_class, attr_name, None)
 
-    def attr(self, attr_name):
-        for block in self.blocks:
+    def _field_values(self, attr_name):
+        """
+        Produce the values of `attr_name` for the blocks in this set that
+        have it, in no particular order.
+        """
+        class_attrs = {}
+        blocks = []
+        for usage_id in self.usage_ids():
+            if usage_id not in self._blocks:
+                block_type = self.runtime.scope_ids(usage_id).block_type
+                if block_type not in class_attrs:
+                    class_attrs[block_type] = self._class_attr(block_type, attr_name)
+                if class_attrs[block_type] is None:
+                    # Blocks whose class doesn't have the attribute are skipped.
+                    continue
+            blocks.append(self._block(usage_id))
+
+        # Nothing changes the blocks' fields while they are read, whatever their scope.
+        self.runtime.prefetch_fields(blocks, every_scope=True, names=[attr_name])
+        for block in blocks:
             if hasattr(block, attr_name):
                 yield getattr(block, attr_name)
 
+    def count(self, attr_name=None):
+        """
+        The number of blocks in this set, or if `attr_name` is given, the
+        number of them that have that attribute.
+        """
+        if attr_name is None:
+            return sum(1 for _ in self.usage_ids())
+        return sum(1 for _ in self._field_values(attr_name))
+
+    def sum(self, attr_name):
+        """The sum of `attr_name` over the blocks in this set that have it."""
+        return sum(self._field_values(attr_name))
+
+    def count_and_sum(self, attr_name):
+        """
+        The number of blocks in this set that have `attr_name`, and the sum
+        of it over them, with one walk of the set.
+        """
+        count = total = 0
+        for value in self._field_values(attr_name):
+            count += 1
+            total += value
+        return count, total
+
+    def any(self, attr_name):
+        """Is `attr_name` true for any of the blocks in this set that have it?"""
+        return any(self._field_values(attr_name))
+
+    def all(self, attr_name):
+        """Is `attr_name` true for all of the blocks in this set that have it?"""
+        return all(self._field_values(attr_name))
+
 
 # Our global state (the "database").
 WORKBENCH_KVS = WorkbenchKeyValueStore({})
@@ -274,6 +443,15 @@ WORKBENCH_KVS = WorkbenchKeyValueStore({})
 # Our global usage store
 USAGE_STORE = MemoryUsageStore()
 
+# Our global index of the structure of the blocks in the usage store
+STRUCTURE_INDEX = StructureIndex()
+
+# Our global profile of the work done for the blocks
+WORKBENCH_STATS = StatsCollector()
+
+# Our traces of slow requests
+WORKBENCH_TRACER = Tracer(settings.WORKBENCH_TRACE_DIR)
+
 
 def reset_global_state():
     """
@@ -286,4 +464,6 @@ def reset_global_state():
 
     WORKBENCH_KVS.clear()
     USAGE_STORE.clear()
+    STRUCTURE_INDEX.clear()
+    WORKBENCH_STATS.reset()
     init_scenarios()
@@ -8,6 +8,7 @@ from collections import namedtuple
 
 from xblock.core import XBlock
 
+from . import snapshot
 from .runtime import WorkbenchRuntime
 
 # Build the scenarios, which are named trees of usages.
@@ -34,24 +35,54 @@ def remove_scenario(scname):
     del SCENARIOS[scname]
 
 
+def class_scenarios(class_name, cls):
+    """
+    The scenarios of a class, as a list of (name, description, xml).
+    """
+    # Each XBlock class can provide scenarios to display in the workbench.
+    if not hasattr(cls, "workbench_scenarios"):
+        return []
+    return [
+        ("%s.%d" % (class_name, i), desc, xml)
+        for i, (desc, xml) in enumerate(cls.workbench_scenarios())
+    ]
+
+
 def add_class_scenarios(class_name, cls):
     """
     Add scenarios from a class to the global collection of scenarios.
     """
-    # Each XBlock class can provide scenarios to display in the workbench.
-    if hasattr(cls, "workbench_scenarios"):
-        for i, (desc, xml) in enumerate(cls.workbench_scenarios()):
-            scname = "%s.%d" % (class_name, i)
-            add_xml_scenario(scname, desc, xml)
+    for scname, desc, xml in class_scenarios(class_name, cls):
+        add_xml_scenario(scname, desc, xml)
 
 
-def init_scenarios():
+def init_scenarios(use_snapshot=True):
     """
     Create all the scenarios declared in all the XBlock classes.
+
+    If `use_snapshot` is set, and the workbench's stores are empty, the
+    scenarios are loaded from a snapshot (see :mod:`workbench.snapshot`)
+    if there is one for them, and otherwise saved to one once built.
+
     """
     # Clear any existing scenarios, since this is used repeatedly during testing.
     SCENARIOS.clear()
 
-    # Get all the XBlock classes, and add their scenarios.
-    for class_name, cls in XBlock.load_classes():
-        add_class_scenarios(class_name, cls)
+    # Get all the XBlock classes, and their scenarios.
+    classes = list(XBlock.load_classes())
+    scenarios = [scenario for class_name, cls in classes for scenario in class_scenarios(class_name, cls)]
+
+    use_snapshot = use_snapshot and snapshot.stores_are_empty()
+    if use_snapshot:
+        key = snapshot.snapshot_key(classes, scenarios)
+        loaded = snapshot.load_snapshot(key)
+        if loaded is not None:
+            for scname, (desc, usage_id) in loaded.iteritems():
+                SCENARIOS[scname] = Scenario(desc, usage_id)
+            return
+
+    for scname, desc, xml in scenarios:
+        add_xml_scenario(scname, desc, xml)
+
+    if use_snapshot:
+        snapshot.save_snapshot(key, dict((scname, tuple(scenario)) for scname, scenario in SCENARIOS.iteritems()))
@@ -1,5 +1,7 @@
 """Django settings for workbench project."""
 
+import os
+
 DEBUG = True
 TEMPLATE_DEBUG = DEBUG
 
@@ -134,6 +136,15 @@ INSTALLED_APPS = (
 
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 
+# The directory of the files the workbench keeps between runs.
+WORKBENCH_VAR_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'var')
+
+# The directory the traces of slow requests are saved in (see xblock.instrumentation.Tracer).
+WORKBENCH_TRACE_DIR = os.path.join(WORKBENCH_VAR_ROOT, 'traces')
+
+# The file the snapshot of the built scenarios is saved in (see workbench.snapshot).
+WORKBENCH_SNAPSHOT_FILE = os.path.join(WORKBENCH_VAR_ROOT, 'scenarios.snapshot')
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
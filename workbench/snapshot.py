@@ -0,0 +1,160 @@
+"""Snapshots of the workbench's scenarios.
+
+Building the scenarios means parsing the XML of every scenario of every
+XBlock class, each time the workbench starts, and each time its state is
+reset.  A snapshot records the usages, definitions, field values and
+structure the scenarios produced, as JSON, so that they can be loaded back
+much faster than they can be parsed.
+
+Snapshots are kept in the ``WORKBENCH_SNAPSHOT_FILE`` setting, and only
+loaded from a file that belongs to the user running the workbench, and that
+no one else can write to.
+
+A snapshot is only used by a workbench with the same XBlock classes, from
+the same unchanged source files, and the same scenario XML as the one that
+saved it (see :func:`snapshot_key`).
+
+This code is in the Workbench layer.
+
+"""
+
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from django.conf import settings
+
+from xblock.entry_point_index import _is_private  # pylint: disable=W0212
+
+from .runtime import STRUCTURE_INDEX, USAGE_STORE, WORKBENCH_KVS
+
+log = logging.getLogger(__name__)
+
+# Change this whenever the contents of a snapshot change.
+SNAPSHOT_FORMAT = 2
+
+SNAPSHOT_FILE = settings.WORKBENCH_SNAPSHOT_FILE
+
+
+def snapshot_key(classes, scenarios):
+    """
+    The key for a snapshot of `scenarios`, a list of (name, description, xml),
+    declared by `classes`, a list of (name, class) of the XBlock classes.
+    """
+    key = hashlib.sha1()
+    key.update("%d %s\n" % (SNAPSHOT_FORMAT, sys.version))
+    # The code that parses the scenarios, and the stores they are parsed into.
+    module_names = set(["xblock.runtime", "xblock.fields", "workbench.runtime", "workbench.scenarios", __name__])
+    for class_name, cls in classes:
+        key.update("%s=%s.%s\n" % (class_name, cls.__module__, cls.__name__))
+        module_names.update(base.__module__ for base in cls.__mro__)
+    for module_name in sorted(module_names):
+        key.update(_module_stamp(module_name))
+    for scenario in scenarios:
+        for part in scenario:
+            key.update(part.encode("utf8") if isinstance(part, unicode) else part)
+            key.update("\0")
+    return key.hexdigest()
+
+
+def save_snapshot(key, scenarios, filename=None):
+    """
+    Save a snapshot of the workbench's stores, as they are after building
+    `scenarios`, a dict mapping scenario names to their description and
+    usage id.  `filename` defaults to `SNAPSHOT_FILE`.
+    """
+    filename = filename or SNAPSHOT_FILE
+    state = [key, scenarios, USAGE_STORE.dump(), WORKBENCH_KVS.db_dict, STRUCTURE_INDEX.dump()]
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write the whole snapshot before it can be seen.
+        handle, temp_filename = tempfile.mkstemp(dir=directory)
+    except (IOError, OSError):
+        log.exception("Couldn't save a snapshot to %s", filename)
+        return
+    try:
+        with os.fdopen(handle, "wb") as snapshot_file:
+            json.dump(state, snapshot_file)
+        os.rename(temp_filename, filename)
+    except (IOError, OSError):
+        log.exception("Couldn't save a snapshot to %s", filename)
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+
+def load_snapshot(key, filename=None):
+    """
+    Load the snapshot with `key` from `filename` (by default, `SNAPSHOT_FILE`)
+    into the workbench's stores.
+
+    Returns the scenarios saved with it, or None if there is no such snapshot.
+
+    """
+    filename = filename or SNAPSHOT_FILE
+    try:
+        with open(filename, "rb") as snapshot_file:
+            if not _is_private(snapshot_file):
+                log.warning("Not loading the snapshot %s, which others could have written", filename)
+                return None
+            state = json.load(snapshot_file)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(state, list) or len(state) != 5 or state[0] != key:
+        return None
+
+    # JSON gives back every string as unicode, but parsing makes ids that are str.
+    _key, scenarios, usages, kvs, index = state
+    id_count, usage_defs, definitions = usages
+    USAGE_STORE.load((
+        id_count,
+        dict((_str(usage_id), _str(def_id)) for usage_id, def_id in usage_defs.iteritems()),
+        dict((_str(def_id), _str(block_type)) for def_id, block_type in definitions.iteritems()),
+    ))
+    WORKBENCH_KVS.db_dict.update(
+        (_str(key), dict((_str(name), value) for name, value in fields.iteritems()))
+        for key, fields in kvs.iteritems()
+    )
+    parents, children, tags = index
+    STRUCTURE_INDEX.load((
+        dict((_str(usage_id), _str(parent_id)) for usage_id, parent_id in parents.iteritems()),
+        dict((_str(usage_id), [_str(child) for child in child_ids]) for usage_id, child_ids in children.iteritems()),
+        dict((_str(usage_id), usage_tags) for usage_id, usage_tags in tags.iteritems()),
+    ))
+    return dict(
+        (_str(scname), (description, _str(usage_id)))
+        for scname, (description, usage_id) in scenarios.iteritems()
+    )
+
+
+def _str(value):
+    """`value` as a str, if it is a unicode string."""
+    return value.encode("utf8") if isinstance(value, unicode) else value
+
+
+def _module_stamp(module_name):
+    """A string that changes when the source of module `module_name` does."""
+    filename = getattr(sys.modules.get(module_name), "__file__", None)
+    if filename is None:
+        return "%s\n" % module_name
+    filename = os.path.splitext(filename)[0] + ".py"
+    try:
+        file_stat = os.stat(filename)
+    except OSError:
+        return "%s %s\n" % (module_name, filename)
+    return "%s %s %r %d\n" % (module_name, filename, file_stat.st_mtime, file_stat.st_size)
+
+
+def stores_are_empty():
+    """Is there nothing in the workbench's stores, so that a snapshot can be loaded, or saved?"""
+    # Allow this function to look into the usage store.
+    # pylint: disable=W0212
+    return not USAGE_STORE._usages and not WORKBENCH_KVS.db_dict
@@ -0,0 +1,28 @@
+"""
+Set up the tests' plugins to be found with an entry point index of their own,
+and keep the scenarios' snapshot out of the workbench's var directory.
+"""
+
+import os
+import shutil
+import tempfile
+
+from xblock.test import setup_package as setup_xblock, teardown_package as teardown_xblock
+
+from workbench import snapshot
+
+_SNAPSHOT_FILES = []
+
+
+def setup_package():
+    """Use a temporary entry point index and snapshot for the tests in this package."""
+    setup_xblock()
+    _SNAPSHOT_FILES.append(snapshot.SNAPSHOT_FILE)
+    snapshot.SNAPSHOT_FILE = os.path.join(tempfile.mkdtemp(), "scenarios.snapshot")
+
+
+def teardown_package():
+    """Go back to the usual entry point index and snapshot."""
+    shutil.rmtree(os.path.dirname(snapshot.SNAPSHOT_FILE))
+    snapshot.SNAPSHOT_FILE = _SNAPSHOT_FILES.pop()
+    teardown_xblock()
@@ -0,0 +1,159 @@
+"""Test the workbench runtime's query interface."""
+
+from mock import patch
+
+from xblock.core import XBlock
+from xblock.fields import Integer, Scope
+
+from xblock.test.tools import assert_equals, assert_false, assert_in, assert_true
+
+from workbench.runtime import WorkbenchRuntime, STRUCTURE_INDEX, WORKBENCH_KVS
+
+
+class Holder(XBlock):
+    """A container."""
+    has_children = True
+
+
+@XBlock.tag("counted")
+class Counter(XBlock):
+    """A leaf with a count."""
+    count = Integer(scope=Scope.settings, default=1)
+
+
+def make_tree(runtime):
+    """Parse TREE, and tag its second counter 'special'.  Returns the root block."""
+    root = runtime.get_block(runtime.parse_xml_string(TREE))
+    special = runtime.get_block(runtime.get_block(root.children[0]).children[1])
+    special.tags = ['special']
+    special.save()
+    return root
+
+
+TREE = """
+    <holder>
+        <holder name="left">
+            <counter/>
+            <counter/>
+        </holder>
+        <holder>
+            <holder><counter count="3"/></holder>
+        </holder>
+    </holder>
+"""
+
+
+@XBlock.register_temp_plugin(Holder)
+@XBlock.register_temp_plugin(Counter)
+def test_query_uses_the_index():
+    runtime = WorkbenchRuntime("student")
+    root = make_tree(runtime)
+    root_id = root.scope_ids.usage_id
+    left_id = runtime.get_block(root.children[0]).scope_ids.usage_id
+    assert_in(left_id, STRUCTURE_INDEX.tagged("left"))
+
+    with patch.object(WorkbenchRuntime, 'get_block', wraps=WorkbenchRuntime.get_block) as get_block:
+        counted = runtime.query(root).descendants().tagged("counted")
+        assert_equals(len(list(counted.usage_ids())), 3)
+        assert_equals(len(list(runtime.query(root).children().tagged("left").usage_ids())), 1)
+        assert_equals(len(list(runtime.query(root).descendants().tagged("special").usage_ids())), 1)
+        # The structure came from the index, without constructing blocks.
+        assert_equals(get_block.call_count, 0)
+
+        # Blocks are only constructed for their fields.
+        assert_equals(sorted(counted.attr("count")), [1, 1, 3])
+        assert_equals(get_block.call_count, 3)
+
+    # Going up from a leaf finds the holders again.
+    leaf = runtime.get_block(next(counted.usage_ids()))
+    assert_equals(list(runtime.query(leaf).parent().parent().usage_ids()), [root_id])
+
+
+@XBlock.register_temp_plugin(Holder)
+@XBlock.register_temp_plugin(Counter)
+def test_query_without_the_index():
+    runtime = WorkbenchRuntime("student")
+    root = make_tree(runtime)
+    STRUCTURE_INDEX.clear()
+
+    # The blocks themselves are read when the index doesn't know them.
+    assert_equals(sorted(runtime.query(root).descendants().tagged("counted").attr("count")), [1, 1, 3])
+    assert_equals(len(list(runtime.query(root).descendants().tagged("special").usage_ids())), 1)
+
+
+@XBlock.register_temp_plugin(Holder)
+@XBlock.register_temp_plugin(Counter)
+def test_query_tagged_by_class():
+    runtime = WorkbenchRuntime("student")
+    root = make_tree(runtime)
+    STRUCTURE_INDEX.clear()
+    left = runtime.get_block(root.children[0])
+
+    with patch.object(WorkbenchRuntime, 'get_block', wraps=WorkbenchRuntime.get_block) as get_block:
+        # Counters are tagged by their class, so aren't constructed to check their tags.
+        assert_equals(len(list(runtime.query(left).children().tagged("counted").usage_ids())), 2)
+        assert_equals(get_block.call_count, 0)
+        # Other tags are read from the blocks.
+        assert_equals(len(list(runtime.query(left).children().tagged("special").usage_ids())), 1)
+        assert_equals(get_block.call_count, 2)
+
+
+@XBlock.register_temp_plugin(Holder)
+@XBlock.register_temp_plugin(Counter)
+def test_query_is_lazy():
+    runtime = WorkbenchRuntime("student")
+    root = make_tree(runtime)
+
+    with patch.object(STRUCTURE_INDEX, 'children', wraps=STRUCTURE_INDEX.children) as children:
+        counted = runtime.query(root).descendants().tagged("counted")
+        # Nothing is done until the results are wanted...
+        assert_equals(children.call_count, 0)
+        # ...and then only as much as is needed.
+        assert_equals(counted.first().count, 1)
+        assert_equals(children.call_count, 2)
+        assert_true(counted.exists())
+        assert_false(runtime.query(root).children().tagged("counted").exists())
+        assert_equals(runtime.query(root).children().tagged("counted").first(), None)
+
+
+@XBlock.register_temp_plugin(Holder)
+@XBlock.register_temp_plugin(Counter)
+def test_query_dedupes_by_usage_id():
+    runtime = WorkbenchRuntime("student")
+    root = make_tree(runtime)
+
+    # Both counters on the left have the same parent, which is found once.
+    parents = runtime.query(root).children().tagged("left").children().parent()
+    assert_equals(len(list(parents.usage_ids())), 1)
+    assert_equals([block.name for block in parents], ["left"])
+    # Each block is constructed once, however often it is visited.
+    assert_equals(len(set(id(block) for block in parents)), 1)
+
+
+@XBlock.register_temp_plugin(Holder)
+@XBlock.register_temp_plugin(Counter)
+def test_query_aggregates():
+    runtime = WorkbenchRuntime("student")
+    root = make_tree(runtime)
+    everything = runtime.query(root).descendants()
+
+    with patch.object(WorkbenchRuntime, 'get_block', wraps=WorkbenchRuntime.get_block) as get_block:
+        with patch.object(WORKBENCH_KVS, 'get_many', wraps=WORKBENCH_KVS.get_many) as get_many:
+            assert_equals(everything.count(), 6)
+            assert_equals(everything.count("count"), 3)
+            assert_equals(everything.sum("count"), 5)
+            assert_equals(everything.count_and_sum("count"), (3, 5))
+            assert_true(everything.any("count"))
+            assert_true(everything.all("count"))
+            assert_false(runtime.query(root).children().any("count"))
+            # The field was read with one bulk read for all the counters, which
+            # the later aggregates reuse.  The holders, without the field,
+            # weren't constructed.
+            assert_equals(get_many.call_count, 1)
+            assert_equals(get_block.call_count, 3)
+
+    # Blocks already constructed are read from, including unsaved changes.
+    counter = everything.tagged("counted").first()
+    counter.count = 10
+    counted = runtime.query(counter).parent().parent().descendants().tagged("counted")
+    assert_equals(counted.sum("count"), 14)
@@ -1,12 +1,15 @@
 """Test that all scenarios render successfully."""
 
 import lxml.html
+from mock import patch
 
 from django.test.client import Client
 
 from xblock.core import XBlock
 from xblock.test.tools import assert_equals
 
+from workbench.runtime import WorkbenchRuntime
+
 
 def test_all_scenarios():
     """Load the home page, get every URL, make a test from it."""
@@ -16,7 +19,9 @@ def test_all_scenarios():
     html = lxml.html.fromstring(response.content)
     a_tags = list(html.xpath('//a'))
     for a_tag in a_tags:
-        yield try_scenario, a_tag.get('href'), a_tag.text
+        # Render each scenario both with and without prefetching the fields of children.
+        for prefetch in (True, False):
+            yield try_scenario, a_tag.get('href'), a_tag.text, prefetch
 
     # Load the scenarios from the classes.
     scenarios = []
@@ -39,19 +44,22 @@ def test_all_scenarios():
     assert all("<vertical/>" not in xml for xml in scenarios)
 
 
-def try_scenario(url, name):
+def try_scenario(url, name, prefetch=True):
     """Check that a scenario renders without error.
 
     `url`: the URL to the scenario to test.
 
     `name`: the name of the scenario, used in error messages.
 
+    `prefetch`: whether the runtime should prefetch the fields of children.
+
     """
     # This is a very shallow test.  We don't know enough about each scenario to
     # know what each should do.  So we load the scenario to see that the
     # workbench could successfully serve it.
     client = Client()
-    response = client.get(url, follow=True)
+    with patch.object(WorkbenchRuntime, 'prefetch_children', prefetch):
+        response = client.get(url, follow=True)
     assert response.status_code == 200, name
 
     # Be sure we got the whole scenario.  Again, we can't know what to expect
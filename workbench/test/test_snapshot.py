@@ -0,0 +1,113 @@
+"""Test snapshots of the workbench's scenarios."""
+
+import copy
+import os
+import shutil
+import tempfile
+
+from mock import patch
+
+from xblock.core import XBlock
+from xblock.test.tools import assert_equals, assert_is, assert_not_equals, assert_true
+
+from workbench import scenarios, snapshot
+from workbench.runtime import STRUCTURE_INDEX, USAGE_STORE, WORKBENCH_KVS, reset_global_state
+
+
+def clear_stores():
+    """Empty the workbench's stores."""
+    WORKBENCH_KVS.clear()
+    USAGE_STORE.clear()
+    STRUCTURE_INDEX.clear()
+
+
+def workbench_state():
+    """Everything the scenarios are built into."""
+    return (
+        dict(scenarios.SCENARIOS),
+        USAGE_STORE.dump()[1:],
+        copy.deepcopy(WORKBENCH_KVS.db_dict),
+        STRUCTURE_INDEX.dump(),
+    )
+
+
+class TestSnapshot(object):
+    """Tests of saving and loading snapshots."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "snapshot")
+        self.patcher = patch.object(snapshot, "SNAPSHOT_FILE", self.filename)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.directory)
+        reset_global_state()
+
+    def test_snapshot_is_the_same_as_parsing(self):
+        clear_stores()
+        scenarios.init_scenarios()
+        assert_true(os.path.exists(self.filename))
+        parsed = workbench_state()
+
+        clear_stores()
+        with patch.object(scenarios, "add_xml_scenario") as add_xml_scenario:
+            scenarios.init_scenarios()
+        assert_equals(add_xml_scenario.call_count, 0)
+        assert_equals(workbench_state(), parsed)
+
+    def test_snapshot_ids_are_str(self):
+        # Ids come back from JSON as unicode, but are loaded as the str that parsing makes.
+        clear_stores()
+        scenarios.init_scenarios()
+        clear_stores()
+        scenarios.init_scenarios()
+        usage_ids = [scenario.usage_id for scenario in scenarios.SCENARIOS.itervalues()]
+        _id_count, usages, definitions = USAGE_STORE.dump()
+        parents, children, _tags = STRUCTURE_INDEX.dump()
+        usage_ids.extend(usages.keys() + usages.values() + definitions.keys() + parents.keys())
+        usage_ids.extend(child for child_ids in children.itervalues() for child in child_ids)
+        usage_ids.extend(WORKBENCH_KVS.db_dict.keys())
+        assert_equals([usage_id for usage_id in usage_ids if not isinstance(usage_id, str)], [])
+
+    def test_snapshot_needs_empty_stores(self):
+        clear_stores()
+        scenarios.init_scenarios()
+        # The stores are full already.
+        with patch.object(snapshot, "load_snapshot") as load_snapshot:
+            scenarios.init_scenarios()
+        assert_equals(load_snapshot.call_count, 0)
+
+    def test_snapshot_key(self):
+        clear_stores()
+        scenarios.init_scenarios()
+        assert_is(snapshot.load_snapshot("not the key"), None)
+
+        classes = [("thing", TestSnapshot)]
+        key = snapshot.snapshot_key(classes, [("thing.0", "A thing", "<thing/>")])
+        assert_equals(key, snapshot.snapshot_key(classes, [("thing.0", "A thing", "<thing/>")]))
+        assert_not_equals(key, snapshot.snapshot_key(classes, [("thing.0", "A thing", "<thing></thing>")]))
+        assert_not_equals(key, snapshot.snapshot_key([("thing", TestSnapshot), ("other", object)], []))
+
+    def test_missing_snapshot(self):
+        assert_is(snapshot.load_snapshot("any key", os.path.join(self.directory, "nothing")), None)
+        with open(self.filename, "wb") as snapshot_file:
+            snapshot_file.write("not a snapshot")
+        assert_is(snapshot.load_snapshot("any key"), None)
+
+    def test_unsafe_snapshot(self):
+        clear_stores()
+        scenarios.init_scenarios()
+        key = snapshot.snapshot_key(list(XBlock.load_classes()), [])
+        snapshot.save_snapshot(key, {})
+        clear_stores()
+        assert_equals(snapshot.load_snapshot(key), {})
+
+        # A snapshot that others could have written isn't loaded.
+        clear_stores()
+        os.chmod(self.filename, 0666)
+        assert_is(snapshot.load_snapshot(key), None)
+        os.chmod(self.filename, 0600)
+        with patch("os.getuid", return_value=os.getuid() + 1):
+            assert_is(snapshot.load_snapshot(key), None)
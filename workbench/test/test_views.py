@@ -2,8 +2,12 @@
 
 import functools
 import json
+import shutil
+import tempfile
 
+import lxml.html
 from django.test.client import Client
+from mock import patch
 
 from xblock.test.tools import assert_equals, assert_in, assert_raises, assert_true
 
@@ -12,7 +16,7 @@ from xblock.fragment import Fragment
 from xblock.runtime import NoSuchHandlerError
 
 from workbench import scenarios
-from workbench.runtime import USAGE_STORE
+from workbench.runtime import WORKBENCH_STATS, WORKBENCH_TRACER
 
 
 def temp_scenario(temp_class, scenario_name='test_scenario'):
@@ -109,10 +113,9 @@ def test_xblock_without_handler():
     # when we try to hit a handler on it
     client = Client()
 
-    # Pick a random usage_id from the USAGE_STORE because we
-    # need to ensure the usage is a valid id.
-    # TODO: Make a usage in this test instead.
-    usage_id = USAGE_STORE._usages.keys()[0]
+    # Use the usage made by the temporary scenario, so that it is a valid
+    # id for a block whose class is available.
+    usage_id = scenarios.SCENARIOS['test_scenario'].usage_id
     # Plug that usage_id into a mock handler URL
     # /handler/[usage_id]/[handler_name]
     handler_url = "/handler/" + usage_id + "/does_not_exist/?student=student_doesntexist"
@@ -150,3 +153,69 @@ def test_xblock_no_student_view():
     client = Client()
     response = client.get("/view/xblockwithoutstudentview/")
     assert_true('No such view' in response.content)
+
+
+@temp_scenario(MultiViewXBlock, "multiview")
+def test_profile():
+    WORKBENCH_STATS.reset()
+    client = Client()
+    response = client.get("/scenario/multiview/")
+    html = lxml.html.fromstring(response.content)
+    rows = [
+        [td.text for td in tr.xpath('td')[:4]]
+        for tr in html.xpath('//table[@class="profile"]/tr')
+    ]
+    assert_in(['MultiViewXBlock', 'render', 'student_view', '1'], rows)
+    assert_in(['MultiViewXBlock', 'save', None, '1'], rows)
+
+
+def test_traces():
+    directory = tempfile.mkdtemp()
+    try:
+        with patch.multiple(WORKBENCH_TRACER, directory=directory, threshold=0):
+            client = Client()
+            assert_in("No slow requests", client.get("/traces/").content)
+
+            client.get("/view/problem.1/")
+            trace_id = WORKBENCH_TRACER.trace_ids()[0]
+            response = client.get("/traces/")
+            assert_in('href="/traces/%s/"' % trace_id, response.content)
+
+            html = lxml.html.fromstring(client.get("/traces/%s/" % trace_id).content)
+            labels = [td.text for td in html.xpath('//tr[@class="span"]/td[@class="label"]')]
+            assert_equals(labels[0].split()[0], "render")
+            assert_in("render_child", [label.split()[0] for label in labels])
+            assert_true(html.xpath('//tr[@class="field"]'))
+
+            assert_equals(client.get("/traces/%s1/" % trace_id).status_code, 404)
+    finally:
+        shutil.rmtree(directory)
+
+
+@temp_scenario(MultiViewXBlock, "multiview")
+def test_stream_scenario():
+    client = Client()
+
+    response = client.get("/stream/multiview/")
+    assert_in("This is student view!", response.content)
+
+    response = client.get("/stream/multiview/another_view/")
+    assert_in("This is another view!", response.content)
+    # Handlers posted to from the page need the CSRF cookie.
+    assert_in("csrftoken", response.cookies)
+
+    assert_equals(client.get("/stream/nosuchscenario/").status_code, 404)
+
+
+def test_streamed_page_matches_page():
+    client = Client()
+
+    def xblock_divs(url):
+        """Get the (usage, init) of the XBlock divs on the page at `url`."""
+        html = lxml.html.fromstring(client.get(url).content)
+        return [(div.get('data-usage'), div.get('data-init')) for div in html.xpath('//div[@class="xblock"]')]
+
+    # A scenario with a vertical holding problems and a sidebar.
+    rendered = xblock_divs("/view/problem.1/")
+    assert_true(len(rendered) > 10)
+    assert_equals(xblock_divs("/stream/problem.1/"), rendered)
@@ -20,6 +20,12 @@ urlpatterns = patterns(
     url(r'^view/(?P<scenario_id>[^/]+)/(?P<view_name>[^/]+)/$', 'show_scenario', {'template': 'blockview.html'}),
     url(r'^view/(?P<scenario_id>[^/]+)/$', 'show_scenario', {'template': 'blockview.html'}),
 
+    url(r'^stream/(?P<scenario_id>[^/]+)/(?P<view_name>[^/]+)/$', 'stream_scenario'),
+    url(r'^stream/(?P<scenario_id>[^/]+)/$', 'stream_scenario'),
+
+    url(r'^traces/$', 'list_traces', name='traces'),
+    url(r'^traces/(?P<trace_id>\d+-\d+-\d+)/$', 'show_trace', name='trace'),
+
     url(r'^handler/(?P<usage_id>[^/]+)/(?P<handler_slug>[^/]*)/$', 'handler', name='handler'),
     url(r'^resource/(?P<package>[^/]+)/(?P<resource>.*)$', 'package_resource', name='package_resource'),
 )
@@ -11,11 +11,13 @@ from StringIO import StringIO
 
 from django.http import HttpResponse, Http404
 from django.shortcuts import render_to_response
+from django.template.loader import render_to_string
 from django.views.decorators.csrf import ensure_csrf_cookie
 
 from xblock.django.request import webob_to_django_response, django_to_webob_request
+from xblock.fragment import Fragment
 
-from .runtime import WorkbenchRuntime, WORKBENCH_KVS
+from .runtime import WorkbenchRuntime, WORKBENCH_KVS, WORKBENCH_STATS, WORKBENCH_TRACER
 from .scenarios import SCENARIOS
 
 
@@ -88,10 +90,150 @@ def show_scenario(request, scenario_id, view_name='student_view', template='bloc
         'head_html': frag.head_html(),
         'foot_html': frag.foot_html(),
         'log': LOG_STREAM.getvalue(),
+        'profile': WORKBENCH_STATS.dump(),
         'student_id': student_id,
     })
 
 
+@ensure_csrf_cookie
+def stream_scenario(request, scenario_id, view_name='student_view'):
+    """
+    Render the given `scenario_id` for the given `view_name`, streaming the
+    page to the browser as the blocks are rendered.
+
+    The page is laid out as in `blockview.html`.
+
+    """
+    student_id = get_student_id(request)
+    log.info("Start stream_scenario %r for student %s", scenario_id, student_id)
+
+    try:
+        scenario = SCENARIOS[scenario_id]
+    except KeyError:
+        raise Http404
+
+    runtime = WorkbenchRuntime(student_id)
+    block = runtime.get_block(scenario.usage_id)
+    frags = runtime.render_stream(block, view_name)
+    return HttpResponse(_stream_page(frags, student_id))
+
+
+# Stand-ins for the parts of a page that are streamed, so that the page's
+# template can be split around them.
+_HEAD_MARKER = u"<!--stream-head-->"
+_BODY_MARKER = u"<!--stream-body-->"
+_FOOT_MARKER = u"<!--stream-foot-->"
+
+
+def _stream_page(frags, student_id):
+    """
+    Produce the HTML of a page, a piece at a time, from the fragments in `frags`.
+
+    Head resources that only turn up after the page's ``<head>`` has been sent
+    are put in the body, just before the HTML that needs them.
+
+    """
+    page = render_to_string('blockview.html', {
+        'student_id': student_id,
+        'head_html': _HEAD_MARKER,
+        'body': _BODY_MARKER,
+        'foot_html': _FOOT_MARKER,
+    })
+    page_start, _, page = page.partition(_HEAD_MARKER)
+    head_end, _, page = page.partition(_BODY_MARKER)
+    body_end, _, page_end = page.partition(_FOOT_MARKER)
+
+    seen = set()
+    all_resources = Fragment()
+    for i, frag in enumerate(frags):
+        all_resources.add_frag_resources(frag)
+        head_html = _new_resources(frag, 'head', seen).head_html()
+        if i == 0:
+            yield page_start + head_html + head_end
+        else:
+            yield head_html
+        yield frag.body_html()
+
+    yield body_end + all_resources.foot_html() + page_end
+    log.info("End stream_scenario")
+
+
+def _new_resources(frag, placement, seen):
+    """
+    Return a Fragment with the resources for `placement` in `frag` that
+    aren't in `seen`, and add them to `seen`.
+    """
+    fresh = Fragment()
+    for resource in frag.resources:
+        if resource.placement == placement and resource.data not in seen:
+            seen.add(resource.data)
+            fresh.resources.append(resource)
+    return fresh
+
+
+def list_traces(_request):
+    """Show a list of the saved traces of slow requests."""
+    traces = []
+    for trace_id in WORKBENCH_TRACER.trace_ids():
+        try:
+            traces.append(WORKBENCH_TRACER.load(trace_id))
+        except KeyError:
+            # Dropped from the ring since we listed it.
+            continue
+    return render_to_response('traces.html', {
+        'traces': traces,
+        'threshold': WORKBENCH_TRACER.threshold,
+    })
+
+
+def show_trace(_request, trace_id):
+    """Show the saved trace `trace_id` as a waterfall of its spans."""
+    try:
+        trace = WORKBENCH_TRACER.load(trace_id)
+    except KeyError:
+        raise Http404
+    return render_to_response('trace.html', {
+        'trace': trace,
+        'rows': _waterfall_rows(trace),
+    })
+
+
+def _waterfall_rows(trace):
+    """
+    Flatten the spans of `trace`, and their field accesses, into rows for
+    a waterfall: each a dict with the `depth`, `label` and `title` of the
+    row, and the `left` and `width` of its bar as percentages of the trace.
+    """
+    duration = trace['duration'] or 1
+
+    def make_row(record, depth, label, title):
+        """A row for `record`."""
+        return {
+            'depth': depth,
+            'label': label,
+            'title': title,
+            'left': 100.0 * record['start'] / duration,
+            'width': max(100.0 * record['duration'] / duration, 0.1),
+            'is_span': 'children' in record,
+            'duration': record['duration'],
+        }
+
+    rows = []
+    spans = [(trace['root'], 0)]
+    while spans:
+        span, depth = spans.pop()
+        rows.append(make_row(
+            span, depth,
+            u"%s %s %s" % (span['event'], span['usage_id'], span['name'] or u""),
+            u"%d field accesses, %d cache hits" % (len(span['fields']), span['cache_hits']),
+        ))
+        for access in span['fields']:
+            keys = [u"/".join(unicode(part) for part in key if part is not None) for key in access['keys']]
+            rows.append(make_row(access, depth + 1, access['op'], u", ".join(keys)))
+        spans.extend((child, depth + 1) for child in reversed(span['children']))
+    return rows
+
+
 def handler(request, usage_id, handler_slug):
     """Provide a handler for the request."""
     student_id = get_student_id(request)
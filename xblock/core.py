@@ -5,16 +5,14 @@ and used by all runtimes.
 
 """
 import functools
-try:
-    import simplesjson as json  # pylint: disable=F0401
-except ImportError:
-    import json
-from webob import Response
+import logging
 
 from xblock.exceptions import XBlockSaveError, KeyValueMultiSaveError
 from xblock.fields import ChildrenModelMetaclass, ModelMetaclass, String, List, Scope
 from xblock.plugin import Plugin
 
+log = logging.getLogger(__name__)
+
 
 class TagCombiningMetaclass(type):
     """
@@ -67,12 +65,22 @@ class XBlock(Plugin):
 
     entry_point = 'xblock.v1'
 
+    # The entry point group that declares the tags of the classes in
+    # `entry_point`, so that they can be found by tag without importing them.
+    # Each entry is named for a tag, and refers to a class with that tag, as
+    # ``checker = xblock.problem:EqualityCheckerBlock``.  A class that
+    # declares any tags there must declare all of its class tags.
+    tag_entry_point = 'xblock.v1.tags'
+
     parent = String(help='The id of the parent of this XBlock', default=None, scope=Scope.parent)
     name = String(help="Short name for the block", scope=Scope.settings)
     tags = List(help="Tags for this block", scope=Scope.settings)
 
     _class_tags = set()
 
+    # The (entry point, tags) of the plugins with each tag, built when first needed.
+    _tagged_classes = None
+
     @classmethod
     def json_handler(cls, func):
         """Wrap a handler to consume and produce JSON.
@@ -85,6 +93,7 @@ class XBlock(Plugin):
         @functools.wraps(func)
         def wrapper(self, request):
             """The wrapper function `json_handler` returns."""
+            json, Response = _json_handler_modules()  # pylint: disable=C0103
             request_json = json.loads(request.body)
             response_json = json.dumps(func(self, request_json))
             return Response(response_json, content_type='application/json')
@@ -97,17 +106,84 @@ class XBlock(Plugin):
             """Add the words in `tags` as class tags to this class."""
             # Add in this class's tags
             cls._class_tags.update(tags.replace(",", " ").split())
+            XBlock._tagged_classes = None
             return cls
         return dec
 
+    @classmethod
+    def clear_plugin_cache(cls):
+        """Forget the plugins found, and the classes with each tag."""
+        super(XBlock, cls).clear_plugin_cache()
+        XBlock._tagged_classes = None
+
+    @classmethod
+    def _declared_tags(cls):
+        """The tags declared in `tag_entry_point`, by the (module name, attrs) of the class they tag."""
+        declared_tags = {}
+        for entry_point in cls.entry_points.iter_entry_points(cls.tag_entry_point):
+            declared_tags.setdefault(_entry_point_target(entry_point), set()).add(entry_point.name)
+        return declared_tags
+
+    @classmethod
+    def _tag_index(cls):
+        """The (entry point, tags) of the plugins with each tag."""
+        # Allow this method to access the `_class_tags`
+        # pylint: disable=W0212
+        tagged_classes = XBlock._tagged_classes
+        while tagged_classes is None:
+            with cls._plugin_cache_lock:
+                tagged_classes = XBlock._tagged_classes
+                if tagged_classes is not None:
+                    break
+                generation = XBlock._plugin_generation
+                entry_points = list(cls._all_entry_points())
+                declared_tags = cls._declared_tags()
+
+            # Import the classes without declared tags without the lock (see
+            # `Plugin`), and publish the index unless the plugins changed meanwhile.
+            index = {}
+            for entry_point in entry_points:
+                tags = declared_tags.get(_entry_point_target(entry_point))
+                if tags is None:
+                    tags = frozenset(cls._load_class_entry_point(entry_point)._class_tags)
+                for tag in tags:
+                    index.setdefault(tag, []).append((entry_point, tags))
+            with cls._plugin_cache_lock:
+                if XBlock._tagged_classes is None and XBlock._plugin_generation == generation:
+                    XBlock._tagged_classes = index
+                tagged_classes = XBlock._tagged_classes
+        return tagged_classes
+
     @classmethod
     def load_tagged_classes(cls, tag):
-        """Produce a sequence of all XBlock classes tagged with `tag`."""
+        """Produce a sequence of all XBlock classes tagged with `tag`.
+
+        Classes whose tags are declared in the `tag_entry_point` group are
+        found by those tags, and only the ones tagged with `tag` are
+        imported.  Other classes are imported to read their class tags.
+
+        The classes with each tag are found once, and remembered until the
+        plugins or class tags change.
+
+        """
         # Allow this method to access the `_class_tags`
         # pylint: disable=W0212
-        for name, class_ in cls.load_classes():
-            if tag in class_._class_tags:
-                yield name, class_
+        for entry_point, tags in cls._tag_index().get(tag, ()):
+            class_ = cls._load_class_entry_point(entry_point)
+            if tags != class_._class_tags:
+                log.warning(
+                    "XBlock %r is declared with the tags %s, but its class has the tags %s",
+                    entry_point.name, sorted(tags), sorted(class_._class_tags)
+                )
+            yield entry_point.name, class_
+
+    @classmethod
+    def tagged_plugin_names(cls, tag):
+        """
+        The names of the XBlock plugins tagged with `tag`, found without
+        importing the classes whose tags are declared (see `load_tagged_classes`).
+        """
+        return [entry_point.name for entry_point, _ in cls._tag_index().get(tag, ())]
 
     def __init__(self, runtime, field_data, scope_ids):
         """
@@ -126,6 +202,7 @@ class XBlock(Plugin):
         self._field_data = field_data
         self._field_data_cache = {}
         self._dirty_fields = {}
+        self._read_only = False
         self.scope_ids = scope_ids
 
     def __repr__(self):
@@ -261,3 +338,32 @@ class XBlock(Plugin):
             return self.content
         else:
             return None
+
+
+# The json module and webob's Response class, once a JSON handler needs them.
+_JSON_HANDLER_MODULES = None
+
+
+def _json_handler_modules():
+    """
+    The json module (simplejson, if it is installed) and webob's Response,
+    imported on first use, so that processes that never handle requests
+    don't pay to load them.
+    """
+    global _JSON_HANDLER_MODULES  # pylint: disable=W0603
+    if _JSON_HANDLER_MODULES is None:
+        try:
+            import simplejson as json  # pylint: disable=F0401
+        except ImportError:
+            import json
+        from webob import Response
+        _JSON_HANDLER_MODULES = (json, Response)
+    return _JSON_HANDLER_MODULES
+
+
+def _entry_point_target(entry_point):
+    """The (module name, attrs) of the object `entry_point` refers to, or None if it doesn't say."""
+    module_name = getattr(entry_point, 'module_name', None)
+    if module_name is None:
+        return None
+    return module_name, tuple(entry_point.attrs)
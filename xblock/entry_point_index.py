@@ -0,0 +1,206 @@
+"""An index of the entry points of the installed distributions, kept on disk.
+
+Finding entry points with :mod:`pkg_resources` means importing it, which
+reads the metadata of every installed distribution, and takes far longer
+than a process should spend starting up.  An :class:`EntryPointIndex`
+remembers the entry points it found in a file, and reads them from there
+until the installed distributions change, without importing `pkg_resources`.
+
+Whether the distributions have changed is decided by a fingerprint of the
+metadata on `sys.path` (see :func:`distributions_fingerprint`), which only
+needs a directory listing and a few `stat` calls for each entry of the path.
+
+The index names the modules that plugins are imported from, so it is kept
+in the user's cache directory (or the file named by the
+``XBLOCK_ENTRY_POINT_INDEX`` environment variable), as JSON, and is only
+read from a file that belongs to the user, and that no one else can write.
+
+This code is in the Runtime layer.
+
+"""
+
+import hashlib
+import logging
+import os
+import stat
+import sys
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+# Change this whenever the contents of an index file change.
+INDEX_FORMAT = 2
+
+
+def _default_index_file():
+    """The index file to use: the one in XBLOCK_ENTRY_POINT_INDEX, or one in the user's cache directory."""
+    if "XBLOCK_ENTRY_POINT_INDEX" in os.environ:
+        return os.environ["XBLOCK_ENTRY_POINT_INDEX"]
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "xblock", "entry-points.json")
+
+
+INDEX_FILE = _default_index_file()
+
+# The number of sets of distributions an index file remembers, so that
+# processes with different paths can share one file.
+KEPT_FINGERPRINTS = 8
+
+# The names on `sys.path` whose changes mean the distributions may have changed.
+_METADATA_SUFFIXES = (".egg-info", ".dist-info", ".egg", ".egg-link", ".pth")
+
+
+def _stamp(path):
+    """The modification time and size of `path`, or None if there is nothing there."""
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    return (file_stat.st_mtime, file_stat.st_size)
+
+
+def distributions_fingerprint(path=None):
+    """
+    A fingerprint of the distributions installed on `path`, which defaults
+    to `sys.path`.  It changes when a distribution is installed, removed, or
+    has its entry points changed, and when `path` changes.
+    """
+    fingerprint = hashlib.sha1()
+    fingerprint.update("%d %s\n" % (INDEX_FORMAT, sys.version))
+    for entry in sys.path if path is None else path:
+        fingerprint.update("%s\0%r\n" % (entry, _stamp(entry or ".")))
+        try:
+            names = sorted(os.listdir(entry or "."))
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith(_METADATA_SUFFIXES):
+                metadata = os.path.join(entry or ".", name)
+                fingerprint.update("%s\0%r\0%r\n" % (
+                    name, _stamp(metadata), _stamp(os.path.join(metadata, "entry_points.txt"))
+                ))
+    return fingerprint.hexdigest()
+
+
+def _is_private(opened):
+    """Does the open file `opened` belong to this user, with no one else able to write it?"""
+    if not hasattr(os, "getuid"):
+        return True
+    file_stat = os.fstat(opened.fileno())
+    return file_stat.st_uid == os.getuid() and not file_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+class IndexedEntryPoint(object):
+    """
+    An entry point read from an index, loaded like a `pkg_resources.EntryPoint`.
+
+    The requirements of its extras aren't checked when it is loaded.
+    """
+    def __init__(self, name, module_name, attrs=(), extras=()):
+        self.name = name
+        self.module_name = module_name
+        self.attrs = tuple(attrs)
+        self.extras = tuple(extras)
+
+    def __repr__(self):
+        return "IndexedEntryPoint(%r, %r, %r, %r)" % (self.name, self.module_name, self.attrs, self.extras)
+
+    def load(self):
+        """Import the object the entry point refers to."""
+        loaded = __import__(self.module_name, fromlist=["__name__"])
+        for attr in self.attrs:
+            loaded = getattr(loaded, attr)
+        return loaded
+
+
+class EntryPointIndex(object):
+    """
+    The entry points of the installed distributions, by group, read from the
+    file `filename` when it was written for the same distributions, and found
+    with `pkg_resources` (and written to the file) otherwise.
+
+    The distributions are fingerprinted once, when the first group is
+    needed: like `pkg_resources`, an index doesn't notice distributions
+    installed while the process is running.
+    """
+    def __init__(self, filename=None):
+        self.filename = filename or INDEX_FILE
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        # Lists of (name, module_name, attrs, extras), by group.
+        self._groups = None
+
+    def _read(self):
+        """
+        The (fingerprint, groups) pairs in the index file, most recently
+        written first.
+        """
+        import json
+        try:
+            with open(self.filename, "rb") as index_file:
+                if not _is_private(index_file):
+                    log.warning("Not reading the entry point index %s, which others could have written", self.filename)
+                    return []
+                index_format, indexes = json.load(index_file)
+        except (IOError, OSError, ValueError, TypeError):
+            return []
+        if index_format != INDEX_FORMAT:
+            return []
+        return indexes
+
+    def _write(self):
+        """Add the groups found so far to the index file, all at once."""
+        import json
+        indexes = [(self._fingerprint, self._groups)] + [
+            (fingerprint, groups) for fingerprint, groups in self._read() if fingerprint != self._fingerprint
+        ]
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0700)
+            handle, temp_filename = tempfile.mkstemp(dir=directory)
+        except (IOError, OSError):
+            log.warning("Couldn't write an entry point index to %s", self.filename, exc_info=True)
+            return
+        try:
+            with os.fdopen(handle, "wb") as index_file:
+                json.dump((INDEX_FORMAT, indexes[:KEPT_FINGERPRINTS]), index_file)
+            os.rename(temp_filename, self.filename)
+        except (IOError, OSError):
+            log.warning("Couldn't write an entry point index to %s", self.filename, exc_info=True)
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+    def _group(self, group):
+        """The entries of `group`, finding them if they aren't known yet."""
+        with self._lock:
+            if self._groups is None:
+                self._fingerprint = distributions_fingerprint()
+                self._groups = dict(self._read()).get(self._fingerprint, {})
+            if group not in self._groups:
+                import pkg_resources
+                self._groups[group] = [
+                    (entry_point.name, entry_point.module_name, tuple(entry_point.attrs), tuple(entry_point.extras))
+                    for entry_point in pkg_resources.iter_entry_points(group)
+                ]
+                self._write()
+            return self._groups[group]
+
+    def iter_entry_points(self, group, name=None):
+        """
+        Produce the entry points in `group`, or only those called `name`,
+        in the order `pkg_resources.iter_entry_points` would.
+        """
+        for entry in self._group(group):
+            if name is None or entry[0] == name:
+                yield IndexedEntryPoint(*entry)
+
+    def refresh(self):
+        """Forget the entry points found, to find them again when next needed."""
+        with self._lock:
+            self._fingerprint = self._groups = None
+
+
+# The index `Plugin` uses.
+ENTRY_POINTS = EntryPointIndex()
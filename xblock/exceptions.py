@@ -46,6 +46,20 @@ class InvalidScopeError(Exception):
     pass
 
 
+class ReadOnlyFieldError(Exception):
+    """
+    Raised when a field is written while its XBlock is being rendered read-only.
+    """
+    pass
+
+
+class BadPathError(Exception):
+    """
+    Raised to indicate that a querypath couldn't be parsed.
+    """
+    pass
+
+
 class NoSuchViewError(Exception):
     """
     Raised to indicate that the view requested was not found.
@@ -6,8 +6,9 @@ simple.
 """
 
 import copy
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from xblock.exceptions import InvalidScopeError
+from xblock.fields import BlockScope, Scope
 
 
 class FieldData(object):
@@ -69,6 +70,46 @@ class FieldData(object):
         except KeyError:
             return False
 
+    def get_many(self, block, names):
+        """
+        Retrieve the values of many fields on an XBlock at once.
+
+        Returns a dict mapping each of `names` that has a value to that value.
+        Fields without a value are left out.
+
+        This implementation brute force gets field by field, which may be
+        inefficient for any FieldData that reads from a remote store.  Such
+        implementations will want to override this method.
+
+        :param block: block to inspect
+        :type block: :class:`~xblock.core.XBlock`
+        :param names: field names to look up
+        :type names: iterable of str
+        """
+        values = {}
+        for name in names:
+            try:
+                values[name] = self.get(block, name)
+            except KeyError:
+                pass
+        return values
+
+    def get_many_for_blocks(self, requests):
+        """
+        Retrieve the values of fields on many XBlocks at once.
+
+        Returns a list with a dict for each of `requests`, as `get_many`
+        would return for its block and names.
+
+        This implementation reads one block at a time through `get_many`.
+        A FieldData that reads from a remote store will want to override it
+        to read everything together.
+
+        :param requests: The fields to look up
+        :type requests: list of (`block`, `names`) pairs
+        """
+        return [self.get_many(block, names) for block, names in requests]
+
     def set_many(self, block, update_dict):
         """
         Update many fields on an XBlock simultaneously.
@@ -81,6 +122,20 @@ class FieldData(object):
         for key, value in update_dict.items():
             self.set(block, key, value)
 
+    def set_many_for_blocks(self, updates):
+        """
+        Update fields on many XBlocks at once.
+
+        This implementation updates one block at a time through `set_many`.
+        A FieldData that writes to a remote store will want to override it
+        to write everything together.
+
+        :param updates: The updates to make
+        :type updates: iterable of (`block`, `update_dict`) pairs
+        """
+        for block, update_dict in updates:
+            self.set_many(block, update_dict)
+
     def default(self, block, name):
         """
         Get the default value for this field which may depend on context or may just be the field's global
@@ -114,6 +169,9 @@ class DictFieldData(FieldData):
     def has(self, block, name):
         return name in self._data
 
+    def get_many(self, block, names):
+        return dict((name, copy.deepcopy(self._data[name])) for name in names if name in self._data)
+
     def set_many(self, block, update_dict):
         self._data.update(copy.deepcopy(update_dict))
 
@@ -147,6 +205,49 @@ class SplitFieldData(FieldData):
     def get(self, block, name):
         return self._field_data(block, name).get(block, name)
 
+    def get_many(self, block, names):
+        """
+        Retrieve many fields at once, with one `get_many` per backing FieldData.
+
+        Fields whose scope has no backing FieldData are left out of the result
+        (getting them individually raises InvalidScopeError).
+        """
+        names_by_field_data = defaultdict(list)
+        for name in names:
+            scope = block.fields[name].scope
+            if scope in self._scope_mappings:
+                names_by_field_data[self._scope_mappings[scope]].append(name)
+        values = {}
+        for field_data, field_names in names_by_field_data.items():
+            values.update(field_data.get_many(block, field_names))
+        return values
+
+    def get_many_for_blocks(self, requests):
+        """
+        Retrieve fields of many blocks at once, with one `get_many_for_blocks`
+        per backing FieldData.  Fields are left out as by :func:`get_many`.
+        """
+        requests = list(requests)
+        # The requests for each backing FieldData, and the position in
+        # `requests` of each of them.
+        requests_by_field_data = defaultdict(list)
+        positions_by_field_data = defaultdict(list)
+        for position, (block, names) in enumerate(requests):
+            names_by_field_data = defaultdict(list)
+            for name in names:
+                scope = block.fields[name].scope
+                if scope in self._scope_mappings:
+                    names_by_field_data[self._scope_mappings[scope]].append(name)
+            for field_data, field_names in names_by_field_data.items():
+                requests_by_field_data[field_data].append((block, field_names))
+                positions_by_field_data[field_data].append(position)
+        results = [{} for _ in requests]
+        for field_data, field_requests in requests_by_field_data.items():
+            field_results = field_data.get_many_for_blocks(field_requests)
+            for position, values in zip(positions_by_field_data[field_data], field_results):
+                results[position].update(values)
+        return results
+
     def set(self, block, name, value):
         self._field_data(block, name).set(block, name, value)
 
@@ -167,10 +268,10 @@ class SplitFieldData(FieldData):
         return self._field_data(block, name).default(block, name)
 
 
-class ReadOnlyFieldData(FieldData):
+class DelegatingFieldData(FieldData):
     """
-    A FieldData that wraps another FieldData an makes all calls to set and delete
-    raise :class:`~xblock.exceptions.InvalidScopeError`s.
+    A FieldData that passes every call on to another FieldData, `source`.
+    Subclasses override the calls they handle differently.
     """
     def __init__(self, source):
         self._source = source
@@ -178,14 +279,143 @@ class ReadOnlyFieldData(FieldData):
     def get(self, block, name):
         return self._source.get(block, name)
 
+    def get_many(self, block, names):
+        return self._source.get_many(block, names)
+
+    def get_many_for_blocks(self, requests):
+        return self._source.get_many_for_blocks(requests)
+
+    def set(self, block, name, value):
+        self._source.set(block, name, value)
+
+    def set_many(self, block, update_dict):
+        self._source.set_many(block, update_dict)
+
+    def set_many_for_blocks(self, updates):
+        self._source.set_many_for_blocks(updates)
+
+    def delete(self, block, name):
+        self._source.delete(block, name)
+
+    def has(self, block, name):
+        return self._source.has(block, name)
+
+    def default(self, block, name):
+        return self._source.default(block, name)
+
+
+class ReadOnlyFieldData(DelegatingFieldData):
+    """
+    A FieldData that wraps another FieldData an makes all calls to set and delete
+    raise :class:`~xblock.exceptions.InvalidScopeError`s.
+    """
     def set(self, block, name, value):
         raise InvalidScopeError("{block}.{name} is read-only, cannot set".format(block=block, name=name))
 
+    def set_many(self, block, update_dict):
+        for name in update_dict:
+            self.set(block, name, update_dict[name])
+
+    def set_many_for_blocks(self, updates):
+        for block, update_dict in updates:
+            self.set_many(block, update_dict)
+
     def delete(self, block, name):
         raise InvalidScopeError("{block}.{name} is read-only, cannot delete".format(block=block, name=name))
 
+
+class BufferedFieldData(FieldData):
+    """
+    A FieldData that keeps the values written to it, and writes them to
+    another FieldData in chunks of `chunk_size` blocks, with
+    `set_many_for_blocks`.
+
+    Reading a block that has values waiting to be written, or a field
+    shared between blocks (one not scoped to a single usage) that has a value
+    waiting to be written for any block, writes out the buffer first.  Call :func:`flush` to write everything out, and
+    :func:`close` to stop buffering once the writes are done: after that,
+    writes go straight to the source.
+
+    """
+    def __init__(self, source, chunk_size=1000):
+        self._source = source
+        self.chunk_size = chunk_size
+        self.closed = False
+        # The values waiting to be written, by block: ScopeIds to (block, {name: value}).
+        self._pending = OrderedDict()
+        self._pending_usages = set()
+        # The names of the shared fields with values waiting to be written.
+        self._pending_shared_names = set()
+
+    def _read(self, block, names):
+        """
+        Get ready to read the fields `names` from `block`, writing out the
+        buffered values that could be read.
+        """
+        if block.scope_ids.usage_id in self._pending_usages or not self._pending_shared_names.isdisjoint(names):
+            self.flush()
+
+    def flush(self):
+        """Write out all the buffered values."""
+        if self._pending:
+            updates = self._pending.values()
+            self._pending = OrderedDict()
+            self._pending_usages.clear()
+            self._pending_shared_names.clear()
+            self._source.set_many_for_blocks(updates)
+
+    def close(self):
+        """Write out all the buffered values, and buffer no more."""
+        self.flush()
+        self.closed = True
+
+    def get(self, block, name):
+        self._read(block, [name])
+        return self._source.get(block, name)
+
+    def get_many(self, block, names):
+        self._read(block, names)
+        return self._source.get_many(block, names)
+
+    def get_many_for_blocks(self, requests):
+        requests = list(requests)
+        for block, names in requests:
+            self._read(block, names)
+        return self._source.get_many_for_blocks(requests)
+
+    def set(self, block, name, value):
+        self.set_many(block, {name: value})
+
+    def set_many(self, block, update_dict):
+        if self.closed:
+            self._source.set_many(block, update_dict)
+            return
+        pending = self._pending.setdefault(block.scope_ids, (block, {}))
+        pending[1].update((name, copy.deepcopy(value)) for name, value in update_dict.iteritems())
+        self._pending_usages.add(block.scope_ids.usage_id)
+        self._pending_shared_names.update(name for name in update_dict if _is_shared(block, name))
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def set_many_for_blocks(self, updates):
+        for block, update_dict in updates:
+            self.set_many(block, update_dict)
+
+    def delete(self, block, name):
+        self._read(block, [name])
+        self._source.delete(block, name)
+
     def has(self, block, name):
+        self._read(block, [name])
         return self._source.has(block, name)
 
     def default(self, block, name):
         return self._source.default(block, name)
+
+
+def _is_shared(block, name):
+    """Could field `name` of `block` be stored under the same key as a field of another usage?"""
+    field = block.fields.get(name)
+    if field is None:
+        return True
+    return field.scope not in (Scope.children, Scope.parent) and field.scope.block != BlockScope.USAGE
@@ -8,6 +8,9 @@ storage mechanism is.
 import copy
 from collections import namedtuple
 
+from xblock.exceptions import ReadOnlyFieldError
+
+
 class BlockScope(object):
     """Enumeration defining BlockScopes"""
     USAGE, DEFINITION, TYPE, ALL = xrange(4)
@@ -221,6 +224,13 @@ class Field(object):
         if self not in xblock._dirty_fields:
             xblock._dirty_fields[self] = copy.deepcopy(value)
 
+    def _check_writable(self, xblock):
+        """Raise ReadOnlyFieldError if `xblock` is being rendered read-only."""
+        if getattr(xblock, '_read_only', False):
+            raise ReadOnlyFieldError(
+                "Can't change {0.name!r} on {1.__class__.__name__} during a read-only render".format(self, xblock)
+            )
+
     def _is_dirty(self, xblock):
         """
         Return whether this field should be saved when xblock.save() is called
@@ -231,6 +241,18 @@ class Field(object):
         baseline = xblock._dirty_fields[self]
         return baseline is EXPLICITLY_SET or xblock._field_data_cache[self.name] != baseline
 
+    def _read_default(self, xblock):
+        """
+        Return the default value of this field on `xblock`, from its field data
+        if it provides one, or else the field's own default.
+        """
+        # Allow this method to access the `_field_data` of `xblock`
+        # pylint: disable=W0212
+        try:
+            return self.from_json(xblock._field_data.default(xblock, self.name))
+        except KeyError:
+            return self.default
+
     def __get__(self, xblock, xblock_class):
         """
         Gets the value of this xblock. Prioritizes the cached value over
@@ -248,16 +270,14 @@ class Field(object):
                 value = self.from_json(xblock._field_data.get(xblock, self.name))
             else:
                 # Cache default value
-                try:
-                    value = self.from_json(xblock._field_data.default(xblock, self.name))
-                except KeyError:
-                    value = self.default
+                value = self._read_default(xblock)
 
             self._set_cached_value(xblock, value)
 
         # If this is a mutable type, mark it as dirty, since mutations can occur without an
-        # explicit call to __set__ (but they do require a call to __get__)
-        if self.MUTABLE:
+        # explicit call to __set__ (but they do require a call to __get__).  Blocks being
+        # rendered read-only are never saved, so there is no need to track them.
+        if self.MUTABLE and not getattr(xblock, '_read_only', False):
             self._mark_dirty(xblock, value)
 
         return value
@@ -268,7 +288,11 @@ class Field(object):
         Setting a value does not update the underlying data store; the
         new value is kept in the cache and the xblock is marked as
         dirty until `save` is explicitly called.
+
+        Raises :class:`~xblock.exceptions.ReadOnlyFieldError` if `xblock`
+        is being rendered read-only.
         """
+        self._check_writable(xblock)
         # Mark the field as dirty and update the cache:
         self._mark_dirty(xblock, EXPLICITLY_SET)
         self._set_cached_value(xblock, value)
@@ -280,6 +304,7 @@ class Field(object):
         """
         # Allow this method to access the `_field_data` and `_dirty_fields` of `xblock`
         # pylint: disable=W0212
+        self._check_writable(xblock)
 
         # Try to perform the deletion on the field_data, and accept
         # that it's okay if the key is not present.  (It may never
@@ -0,0 +1,522 @@
+"""Instrumentation of the work a runtime does for its XBlocks.
+
+A :class:`~xblock.runtime.Runtime` tells its :class:`Instrumentation` when it
+begins and ends each piece of work it does for a block: getting it, rendering
+a view, running a handler, saving it, and each call to its
+:class:`~xblock.field_data.FieldData`.  :class:`StatsCollector` uses those
+hooks to gather statistics about which blocks, views and handlers are slow,
+and :class:`Tracer` to record the work done for single slow requests.
+
+This code is in the Runtime layer.
+
+"""
+
+import itertools
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from xblock.field_data import FieldData
+from xblock.fields import Scope
+
+log = logging.getLogger(__name__)
+
+
+class Instrumentation(object):
+    """
+    Hooks called by a runtime around the work it does for its blocks.
+
+    This base class does nothing.  Subclasses override :func:`begin` and
+    :func:`end` to measure the work.
+
+    The events are:
+
+        "render", "render_child": `name` is the view name.
+
+        "handle": `name` is the handler name.
+
+        "save": `name` is None.
+
+        "get_block": `block` is None, as it hasn't been got yet, and `name`
+        is the usage id.  The block got is passed to :func:`end` as the
+        `result`.
+
+        "get", "get_many", "has", "default": reads from the FieldData,
+        `name` is the field name (or a list of them).  A read of the fields
+        of many blocks at once is one "get_many", on the first of them.
+
+        "set", "set_many", "delete": writes to the FieldData, `name` is the
+        field name (or a list of them).
+
+    """
+
+    # The FieldData events that read and that write field values.
+    READ_EVENTS = frozenset(["get", "get_many", "has", "default"])
+    WRITE_EVENTS = frozenset(["set", "set_many", "delete"])
+
+    def begin(self, event, block, name):
+        """
+        Called as the runtime begins `event` on `block`.
+
+        Returns a token, to be passed to :func:`end` once the work is done.
+        """
+        return None
+
+    def end(self, token, result=None):
+        """
+        Called as the runtime ends the work begun with the `begin` that
+        returned `token`, whether the work succeeded or not.
+
+        `result` is the result of the work, if it has one: for instance the
+        :class:`~xblock.fragment.Fragment` produced by a view.
+        """
+        pass
+
+
+class MultiInstrumentation(Instrumentation):
+    """
+    An :class:`Instrumentation` that passes every event on to each of a
+    number of others.
+    """
+    def __init__(self, *instrumentations):
+        self.instrumentations = instrumentations
+
+    def begin(self, event, block, name):
+        return [
+            instrumentation.begin(event, block, name)
+            for instrumentation in self.instrumentations
+        ]
+
+    def end(self, token, result=None):
+        for instrumentation, inner_token in reversed(zip(self.instrumentations, token)):
+            instrumentation.end(inner_token, result)
+
+
+class InstrumentedFieldData(FieldData):
+    """
+    A FieldData that wraps another FieldData, and reports each call made to it
+    to an :class:`Instrumentation`.
+    """
+    def __init__(self, source, instrumentation):
+        self._source = source
+        self._instrumentation = instrumentation
+
+    def _call(self, event, block, name, *args):
+        """Call the `event` method of the source FieldData, instrumented."""
+        token = self._instrumentation.begin(event, block, name)
+        try:
+            return getattr(self._source, event)(block, name, *args)
+        finally:
+            self._instrumentation.end(token)
+
+    def get(self, block, name):
+        return self._call("get", block, name)
+
+    def get_many(self, block, names):
+        return self._call("get_many", block, names)
+
+    def set(self, block, name, value):
+        self._call("set", block, name, value)
+
+    def set_many(self, block, update_dict):
+        self._call("set_many", block, update_dict)
+
+    def get_many_for_blocks(self, requests):
+        # Reported as one "get_many" of the first block, as it is one read.
+        requests = list(requests)
+        if not requests:
+            return []
+        block, names = requests[0]
+        token = self._instrumentation.begin("get_many", block, names)
+        try:
+            return self._source.get_many_for_blocks(requests)
+        finally:
+            self._instrumentation.end(token)
+
+    def set_many_for_blocks(self, updates):
+        # Bulk writes belong to no one block, so go uninstrumented.
+        self._source.set_many_for_blocks(updates)
+
+    def delete(self, block, name):
+        self._call("delete", block, name)
+
+    def has(self, block, name):
+        return self._call("has", block, name)
+
+    def default(self, block, name):
+        return self._call("default", block, name)
+
+
+class _Frame(object):
+    """The work begun by one call to `StatsCollector.begin`."""
+    __slots__ = ("key", "start", "reads", "writes")
+
+    def __init__(self, key, start):
+        self.key = key
+        self.start = start
+        self.reads = 0
+        self.writes = 0
+
+
+# Pushed on the stack for work that isn't being sampled.
+_UNSAMPLED = object()
+
+
+class StatsCollector(Instrumentation):
+    """
+    Collects statistics for each kind of work, per block type and name.
+
+    For each (block type, event, name), such as ("problem", "render",
+    "student_view"), it counts the calls, and totals their wall time, the
+    field reads and writes made while doing them, and the bytes of HTML
+    produced by views.
+
+    Set `sample_rate` below 1 to only measure that fraction of the top-level
+    calls (and everything they do), to keep the cost down in production.
+
+    """
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        """The stack of work in progress on this thread."""
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def begin(self, event, block, name):
+        stack = self._stack()
+        if stack:
+            parent = stack[-1]
+            if parent is _UNSAMPLED:
+                stack.append(_UNSAMPLED)
+                return _UNSAMPLED
+            if event in self.READ_EVENTS:
+                parent.reads += 1
+            elif event in self.WRITE_EVENTS:
+                parent.writes += 1
+        elif self.sample_rate < 1 and random.random() >= self.sample_rate:
+            stack.append(_UNSAMPLED)
+            return _UNSAMPLED
+
+        if block is None or isinstance(name, (list, tuple, dict)):
+            # Neither usage ids nor lists of fields are kept apart.
+            name = None
+        block_type = block.scope_ids.block_type if block is not None else None
+        frame = _Frame((block_type, event, name), time.time())
+        stack.append(frame)
+        return frame
+
+    def end(self, token, result=None):
+        self._stack().pop()
+        if token is _UNSAMPLED:
+            return
+
+        elapsed = time.time() - token.start
+        size = len(result.body_html()) if hasattr(result, "body_html") else 0
+        key = token.key
+        if key[0] is None and hasattr(result, "scope_ids"):
+            # A block got by "get_block" is counted under its type.
+            key = (result.scope_ids.block_type,) + key[1:]
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = [0, 0.0, 0, 0, 0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += token.reads
+            stats[3] += token.writes
+            stats[4] += size
+
+    def reset(self):
+        """Forget all the statistics collected so far."""
+        with self._lock:
+            self._stats.clear()
+
+    def dump(self):
+        """
+        Return the statistics collected so far, as a list of dicts, slowest first.
+
+        Each dict has keys `block_type`, `event`, `name`, `count`, `time`
+        (total wall time, in seconds), `reads`, `writes` and `bytes`.
+
+        """
+        with self._lock:
+            items = self._stats.items()
+            rows = [
+                {
+                    'block_type': block_type,
+                    'event': event,
+                    'name': name,
+                    'count': count,
+                    'time': total_time,
+                    'reads': reads,
+                    'writes': writes,
+                    'bytes': size,
+                }
+                for (block_type, event, name), (count, total_time, reads, writes, size) in items
+            ]
+        rows.sort(key=lambda row: row['time'], reverse=True)
+        return rows
+
+
+class _CountingCache(dict):
+    """
+    A block's field cache that tells a :class:`Tracer` each time a field
+    value is read from it.
+    """
+    def __init__(self, values, tracer):
+        super(_CountingCache, self).__init__(values)
+        self.tracer = tracer
+
+    def get(self, key, default=None):
+        value = super(_CountingCache, self).get(key, default)
+        if value is not default:
+            self.tracer.cache_hit()
+        return value
+
+
+# The names of the standard scopes, by scope.
+_SCOPE_NAMES = dict(
+    (getattr(Scope, scope_name), scope_name)
+    for scope_name in ['content', 'settings', 'user_state', 'preferences', 'user_info', 'user_state_summary']
+)
+
+
+def _field_key(block, name):
+    """
+    Describe the key-value store key of field `name` of `block`, as
+    [scope name, block scope id, user id, field name], as a `DbModel` builds it.
+    """
+    from xblock.runtime import DbModel  # xblock.runtime imports this module.
+
+    try:
+        field = block.fields[name]
+    except (AttributeError, KeyError, TypeError):
+        return [None, block.scope_ids.usage_id, None, name]
+    key = DbModel._key_from_scope_ids(field, name, block.scope_ids)  # pylint: disable=W0212
+    return [_SCOPE_NAMES.get(key.scope, repr(key.scope)), key.block_scope_id, key.user_id, key.field_name]
+
+
+def _json():
+    """
+    The JSON module, imported when a trace is first saved or loaded, so that
+    runtimes that never trace don't pay to load it.
+    """
+    try:
+        import simplejson as json  # pylint: disable=F0401
+    except ImportError:
+        import json
+    return json
+
+
+# The ids `Tracer` gives its traces.
+TRACE_ID_RE = re.compile(r"^\d+-\d+-\d+$")
+
+
+class Tracer(Instrumentation):
+    """
+    Records each request as a tree of spans, and saves the slow ones.
+
+    A trace begins with the outermost render, handler call, or save, and
+    holds a span for each render, render_child, handle and save done while
+    it runs.  Each span records its block, its start and duration (in
+    seconds from the start of the trace), the key-value store keys read and
+    written by its field accesses, the blocks it got, and how many field
+    values were read from the blocks' caches instead.
+
+    Traces taking `threshold` seconds or more are written as JSON to
+    `directory`, which keeps only the latest `max_traces` of them.  A trace
+    that can't be saved is logged and dropped, without failing the request.
+
+    Each trace's id is made of the time it began, in microseconds, and the
+    process id and a count of the traces of the process that saved it, so
+    that the processes of a multi-process server can share a directory.  Each
+    trace is a dict::
+
+        {
+            "id": "1397572938012345-4242-12",
+            "time": <wall-clock time the request began>,
+            "duration": 0.73,
+            "root": <span>,
+        }
+
+    and each span a dict::
+
+        {
+            "event": "render", "block_type": "problem", "usage_id": "problem_3",
+            "name": "student_view", "start": 0.012, "duration": 0.2,
+            "fields": [{"op": "get", "keys": [[scope, block_scope_id, user_id, field]],
+                        "start": 0.013, "duration": 0.0001}, ...],
+            "cache_hits": 4,
+            "children": [<span>, ...],
+        }
+
+    Each block got while the span runs is listed among its field accesses,
+    as ``{"op": "get_block", "keys": [[None, usage_id, None, None]], ...}``.
+
+    """
+    # The events that get their own span.
+    SPAN_EVENTS = frozenset(["render", "render_child", "handle", "save"])
+
+    def __init__(self, directory, threshold=0.5, max_traces=50):
+        self.directory = directory
+        self.threshold = threshold
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counter = itertools.count(1)
+
+    def _stack(self):
+        """The stack of spans and field accesses in progress on this thread."""
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def begin(self, event, block, name):
+        now = time.time()
+        stack = self._stack()
+        if not stack:
+            if event not in self.SPAN_EVENTS:
+                # Field access outside of any traced work.
+                return None
+            self._local.start = now
+            self._local.swapped_caches = []
+
+        record = {
+            'start': now - self._local.start,
+            'duration': None,
+        }
+        if event in self.SPAN_EVENTS:
+            record.update({
+                'event': event,
+                'block_type': block.scope_ids.block_type,
+                'usage_id': block.scope_ids.usage_id,
+                'name': name,
+                'fields': [],
+                'cache_hits': 0,
+                'children': [],
+            })
+            # Count the reads this block makes from its field cache, until
+            # the trace ends.
+            cache = getattr(block, '_field_data_cache', None)
+            if isinstance(cache, dict) and not isinstance(cache, _CountingCache):
+                block._field_data_cache = _CountingCache(cache, self)  # pylint: disable=W0212
+                self._local.swapped_caches.append((block, cache))
+            if stack:
+                stack[-1]['children'].append(record)
+        else:
+            if event == "get_block":
+                keys = [[None, name, None, None]]
+            else:
+                names = name if isinstance(name, (list, tuple, dict)) else [name]
+                keys = [_field_key(block, field_name) for field_name in names]
+            record.update({'op': event, 'keys': keys})
+            # Getting a block may itself access fields: they go in the span.
+            self._span(stack)['fields'].append(record)
+        stack.append(record)
+        return record
+
+    def end(self, token, result=None):
+        if token is None:
+            return
+        now = time.time()
+        stack = self._stack()
+        stack.pop()
+        token['duration'] = now - self._local.start - token['start']
+        if stack:
+            return
+        self._restore_caches()
+        if token['duration'] >= self.threshold:
+            try:
+                self.save({
+                    'time': self._local.start,
+                    'duration': token['duration'],
+                    'root': token,
+                })
+            except (IOError, OSError):
+                log.warning("Couldn't save a trace to %s", self.directory, exc_info=True)
+
+    def _restore_caches(self):
+        """Give the blocks traced back their own field caches, with the values now cached."""
+        # pylint: disable=W0212
+        for block, cache in self._local.swapped_caches:
+            counting_cache = block._field_data_cache
+            if isinstance(counting_cache, _CountingCache) and counting_cache.tracer is self:
+                cache.clear()
+                cache.update(counting_cache)
+                block._field_data_cache = cache
+        self._local.swapped_caches = []
+
+    def _span(self, stack):
+        """The innermost span on `stack`."""
+        for record in reversed(stack):
+            if 'children' in record:
+                return record
+
+    def cache_hit(self):
+        """Note that a field value was read from a block's cache."""
+        span = self._span(self._stack())
+        if span is not None:
+            span['cache_hits'] += 1
+
+    def _path(self, trace_id):
+        """The file that trace `trace_id` is saved in."""
+        return os.path.join(self.directory, "%s.json" % trace_id)
+
+    def trace_ids(self):
+        """The ids of the saved traces, most recent first."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        ids = [name[:-5] for name in names if name.endswith(".json") and TRACE_ID_RE.match(name[:-5])]
+        return sorted(ids, key=lambda trace_id: [int(part) for part in trace_id.split("-")], reverse=True)
+
+    def save(self, trace):
+        """
+        Save `trace` in the ring of trace files, forgetting the oldest one if
+        the ring is full.  Returns the id given to the trace.
+        """
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            trace_id = "%d-%d-%d" % (trace['time'] * 1000000, os.getpid(), next(self._counter))
+
+            trace = dict(trace, id=trace_id)
+            json = _json()
+            temp_path = self._path(trace_id) + ".tmp"
+            with open(temp_path, "w") as trace_file:
+                json.dump(trace, trace_file)
+            os.rename(temp_path, self._path(trace_id))
+
+            for old_id in self.trace_ids()[self.max_traces:]:
+                try:
+                    os.remove(self._path(old_id))
+                except OSError:
+                    pass
+        return trace_id
+
+    def load(self, trace_id):
+        """
+        Load the saved trace `trace_id`.
+
+        Raises `KeyError` if there is no such trace.
+        """
+        if not TRACE_ID_RE.match(str(trace_id)):
+            raise KeyError(trace_id)
+        try:
+            with open(self._path(trace_id)) as trace_file:
+                return _json().load(trace_file)
+        except IOError:
+            raise KeyError(trace_id)
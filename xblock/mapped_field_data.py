@@ -0,0 +1,190 @@
+"""
+A read-only :class:`~xblock.field_data.FieldData` backed by a memory-mapped
+file, so that many processes can share one copy of a course's content.
+
+A course is written to a file once with :func:`publish`, and each process
+then reads it with a :class:`MappedFieldData`.  The file is mapped rather
+than read, so its pages live in the operating system's page cache, shared
+by every process that maps it, and are only read from disk when used.
+
+Published files hold the fields of scopes with no user, such as
+`Scope.content` and `Scope.settings`.  The other scopes can be kept
+elsewhere with a :class:`~xblock.field_data.SplitFieldData`::
+
+    SplitFieldData({
+        Scope.content: MappedFieldData("course.published"),
+        Scope.settings: MappedFieldData("course.published"),
+        Scope.children: student_field_data,
+        ...
+    })
+
+The file is a header, an index of entries sorted by the hash of their key,
+and then the entries.  Each index entry holds the hash of a key, and the
+offset and length of its entry.  Each entry is the length of its key, the
+key, and the JSON of the value.
+
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from xblock.exceptions import InvalidScopeError
+from xblock.fields import BlockScope, Scope, UserScope
+from xblock.field_data import FieldData
+
+_MAGIC = "XBFD"
+_FORMAT_VERSION = 1
+# Magic, version, and the number of entries.
+_HEADER = struct.Struct("<4sII")
+# The hash of a key, and the offset and length of its entry.
+_INDEX_ENTRY = struct.Struct("<QQI")
+# The length of the key at the start of an entry.
+_KEY_LENGTH = struct.Struct("<I")
+
+
+def _key(scope, scope_ids, name):
+    """
+    The key in a published file of the field `name`, in `scope`, of the
+    block identified by `scope_ids`.
+    """
+    if scope in (Scope.children, Scope.parent) or scope.user != UserScope.NONE:
+        raise InvalidScopeError(scope)
+    block_id = {
+        BlockScope.USAGE: scope_ids.usage_id,
+        BlockScope.DEFINITION: scope_ids.def_id,
+        BlockScope.TYPE: scope_ids.block_type,
+        BlockScope.ALL: "",
+    }[scope.block]
+    return ("%d/%s/%s" % (scope.block, block_id, name)).encode("utf8")
+
+
+def _hash(key):
+    """The 64-bit hash of `key`."""
+    return struct.unpack("<Q", hashlib.md5(key).digest()[:8])[0]
+
+
+def publish(blocks, filename, scopes=(Scope.content, Scope.settings)):
+    """
+    Write the fields in `scopes` of each of `blocks` to `filename`, to be
+    read with a :class:`MappedFieldData`.
+
+    Only fields with values are written.  The file is replaced all at once,
+    so processes that already have the old one mapped carry on reading it.
+
+    """
+    # Allow this function to read the blocks' field data directly.
+    # pylint: disable=W0212
+    values = {}
+    for block in blocks:
+        names = [name for name, field in block.fields.iteritems() if field.scope in scopes]
+        for name, value in block._field_data.get_many(block, names).iteritems():
+            values[_key(block.fields[name].scope, block.scope_ids, name)] = value
+
+    keys = sorted(values, key=lambda key: (_hash(key), key))
+    entries = [
+        _KEY_LENGTH.pack(len(key)) + key + json.dumps(values[key], separators=(",", ":"))
+        for key in keys
+    ]
+    offset = _HEADER.size + _INDEX_ENTRY.size * len(entries)
+    index = []
+    for key, entry in zip(keys, entries):
+        index.append(_INDEX_ENTRY.pack(_hash(key), offset, len(entry)))
+        offset += len(entry)
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    handle, temp_filename = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(handle, "wb") as published:
+            published.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(entries)))
+            published.write("".join(index))
+            published.write("".join(entries))
+        # mkstemp makes the file readable only by its owner: give it the mode
+        # that any other new file would have, for the processes that map it.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_filename, 0666 & ~umask)
+        os.rename(temp_filename, filename)
+    except:
+        os.remove(temp_filename)
+        raise
+
+
+class MappedFieldData(FieldData):
+    """
+    A read-only FieldData of the values in a file written by :func:`publish`.
+
+    Setting or deleting a value raises :class:`~xblock.exceptions.InvalidScopeError`,
+    as do fields of scopes that can't be published.
+    """
+    def __init__(self, filename):
+        with open(filename, "rb") as published:
+            self._map = mmap.mmap(published.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError("{} isn't a published XBlock field data file".format(filename))
+
+    def close(self):
+        """Unmap the file."""
+        self._map.close()
+
+    def _hash_at(self, position):
+        """The key hash of the index entry at `position`."""
+        return _INDEX_ENTRY.unpack_from(self._map, _HEADER.size + position * _INDEX_ENTRY.size)[0]
+
+    def _find(self, key):
+        """The JSON of the value of `key`, or None."""
+        key_hash = _hash(key)
+        # Find the first index entry with the hash.
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < key_hash:
+                low = middle + 1
+            else:
+                high = middle
+
+        for position in xrange(low, self._count):
+            entry_hash, offset, length = _INDEX_ENTRY.unpack_from(
+                self._map, _HEADER.size + position * _INDEX_ENTRY.size
+            )
+            if entry_hash != key_hash:
+                break
+            key_length = _KEY_LENGTH.unpack_from(self._map, offset)[0]
+            key_start = offset + _KEY_LENGTH.size
+            if self._map[key_start:key_start + key_length] == key:
+                return self._map[key_start + key_length:offset + length]
+        return None
+
+    def _json(self, block, name):
+        """The JSON of the field `name` of `block`, or None."""
+        return self._find(_key(block.fields[name].scope, block.scope_ids, name))
+
+    def get(self, block, name):
+        value = self._json(block, name)
+        if value is None:
+            raise KeyError(name)
+        return json.loads(value)
+
+    def get_many(self, block, names):
+        values = {}
+        for name in names:
+            value = self._json(block, name)
+            if value is not None:
+                values[name] = json.loads(value)
+        return values
+
+    def has(self, block, name):
+        return self._json(block, name) is not None
+
+    def set(self, block, name, value):
+        raise InvalidScopeError("{block}.{name} is published, cannot set".format(block=block, name=name))
+
+    def set_many(self, block, update_dict):
+        raise InvalidScopeError("{block} is published, cannot set".format(block=block))
+
+    def delete(self, block, name):
+        raise InvalidScopeError("{block}.{name} is published, cannot delete".format(block=block, name=name))
@@ -7,7 +7,9 @@ This code is in the Runtime layer.
 import functools
 import itertools
 import logging
-import pkg_resources
+import threading
+
+from xblock.entry_point_index import ENTRY_POINTS
 
 log = logging.getLogger(__name__)
 
@@ -41,10 +43,24 @@ class Plugin(object):
 
         `entry_point`: The name of the entry point to load plugins from.
 
+    Entry points are found in `entry_points`, an
+    :class:`~xblock.entry_point_index.EntryPointIndex`, rather than by
+    scanning the installed distributions each time.
+
     """
 
+    # The classes loaded, and the identifiers found to have no entry point,
+    # by identifier.  Both are filled while holding `_plugin_cache_lock`,
+    # which is never held while importing a class: on Python 2 that would
+    # deadlock with a thread whose import loads a plugin.
     _plugin_cache = None
+    _missing_plugins = None
+    _plugin_cache_lock = threading.RLock()
+    # Counts the calls to `clear_plugin_cache`, so that anything remembering
+    # classes it loaded can tell when to forget them.
+    _plugin_generation = 0
     entry_point = None  # Should be overwritten by children classes
+    entry_points = ENTRY_POINTS
 
     # Temporary entry points, for register_temp_plugin.  A list of pairs,
     # (identifier, entry_point):
@@ -85,29 +101,90 @@ class Plugin(object):
         if select is None:
             select = raise_ambiguous_exception
 
+        identifier = identifier.lower()
+        # The caches are only ever added to while they're in use, so they
+        # can be read without the lock.
+        cache, missing = cls._plugin_cache, cls._missing_plugins
+        if cache is None or missing is None or (identifier not in cache and identifier not in missing):
+            with cls._plugin_cache_lock:
+                cache, missing = cls._caches()
+                entry_points = None
+                if identifier not in cache and identifier not in missing:
+                    entry_points = cls._find_entry_points(identifier)
+            if entry_points:
+                # Import the class without the lock.  Threads that load the
+                # same class at once all get the one cached first.
+                entry_point = select(entry_points) if len(entry_points) > 1 else entry_points[0]
+                class_ = cls._load_class_entry_point(entry_point)
+                with cls._plugin_cache_lock:
+                    return cls._caches()[0].setdefault(identifier, class_)
+
+        if identifier in cache:
+            return cache[identifier]
+        if default is not None:
+            return default
+        raise PluginMissingError(identifier)
+
+    @classmethod
+    def _caches(cls):
+        """The positive and negative caches of this plugin, made if need be.  Hold the lock to call this."""
         if cls._plugin_cache is None:
             cls._plugin_cache = {}
+            cls._missing_plugins = set()
+        return cls._plugin_cache, cls._missing_plugins
 
-        if identifier not in cls._plugin_cache:
-            identifier = identifier.lower()
-            entry_points = list(pkg_resources.iter_entry_points(cls.entry_point, name=identifier))
-            for extra_identifier, extra_entry_point in cls.extra_entry_points:
-                if identifier == extra_identifier:
-                    entry_points.append(extra_entry_point)
+    @classmethod
+    def _find_entry_points(cls, identifier):
+        """
+        The entry points for `identifier`, remembering it as missing if
+        there are none.  Hold the lock to call this.
+        """
+        entry_points = list(cls.entry_points.iter_entry_points(cls.entry_point, name=identifier))
+        for extra_identifier, extra_entry_point in cls.extra_entry_points:
+            if identifier == extra_identifier:
+                entry_points.append(extra_entry_point)
+        if not entry_points:
+            cls._missing_plugins.add(identifier)
+        return entry_points
 
-            if len(entry_points) > 1:
-                entry_point = select(entry_points)
+    @classmethod
+    def clear_plugin_cache(cls):
+        """Forget the classes loaded, and the identifiers found missing, to search for them again."""
+        with cls._plugin_cache_lock:
+            cls._plugin_cache = cls._missing_plugins = None
+            cls._plugin_generation += 1
 
-            elif len(entry_points) == 0:
-                if default is not None:
-                    return default
-                raise PluginMissingError(identifier)
+    @classmethod
+    def preload(cls):
+        """
+        Load every plugin class now, as a worker starts, so that loading a
+        class later only needs the cache.
 
-            else:
-                entry_point = entry_points[0]
+        Identifiers with more than one entry point are left to `load_class`
+        to choose between.
+        """
+        entry_points = {}
+        for entry_point in cls.entry_points.iter_entry_points(cls.entry_point):
+            entry_points.setdefault(entry_point.name, []).append(entry_point)
+        for identifier, entry_point in cls.extra_entry_points:
+            entry_points.setdefault(identifier, []).append(entry_point)
+        classes = dict(
+            (identifier, cls._load_class_entry_point(found[0]))
+            for identifier, found in entry_points.iteritems() if len(found) == 1
+        )
+        with cls._plugin_cache_lock:
+            cache, missing = cls._caches()
+            for identifier, class_ in classes.iteritems():
+                cache.setdefault(identifier, class_)
+                missing.discard(identifier)
 
-            cls._plugin_cache[identifier] = cls._load_class_entry_point(entry_point)
-        return cls._plugin_cache[identifier]
+    @classmethod
+    def _all_entry_points(cls):
+        """Produce the entry points of all the available instances of this plugin."""
+        return itertools.chain(
+            cls.entry_points.iter_entry_points(cls.entry_point),
+            (entry_point for identifier, entry_point in cls.extra_entry_points),
+        )
 
     @classmethod
     def load_classes(cls):
@@ -117,11 +194,7 @@ class Plugin(object):
         classes for all of the available instances of this plugin.
 
         """
-        all_classes = itertools.chain(
-            pkg_resources.iter_entry_points(cls.entry_point),
-            (entry_point for identifier, entry_point in cls.extra_entry_points),
-        )
-        for class_ in all_classes:
+        for class_ in cls._all_entry_points():
             yield (class_.name, cls._load_class_entry_point(class_))
 
     @classmethod
@@ -144,10 +217,12 @@ class Plugin(object):
             def _inner(*args, **kwargs):                # pylint: disable=C0111
                 old = list(cls.extra_entry_points)
                 cls.extra_entry_points.append((identifier, entry_point))
+                cls.clear_plugin_cache()
                 try:
                     return func(*args, **kwargs)
                 finally:
                     cls.extra_entry_points = old
+                    cls.clear_plugin_cache()
             return _inner
         return _decorator
 
@@ -191,10 +191,8 @@ class ProblemBlock(XBlock):
             kwargs.update(arguments)
             for arg_name, arg_value in arguments.items():
                 if arg_value.startswith("."):
-                    values = list(self.runtime.querypath(self, arg_value))
-                    # TODO: What is the specific promised semantic of the iterability
-                    # of the value returned by querypath?
-                    kwargs[arg_name] = values[0]
+                    # Only the first value is wanted, so don't look for more.
+                    kwargs[arg_name] = next(iter(self.runtime.querypath(self, arg_value)))
                 elif arg_value.startswith("$"):
                     kwargs[arg_name] = context.get(arg_value[1:])
                 elif arg_value.startswith("="):
@@ -476,11 +474,13 @@ class AttemptsScoreboardBlock(XBlock):
         """Provide default student view."""
         # Get the attempts for all problems in my parent.
         if self.parent:
-            # these two lines are equivalent, and both work:
-            attempts = list(self.runtime.query(self).parent().descendants().attr("problem_attempted"))
-            attempts = list(self.runtime.querypath(self, "..//@problem_attempted"))
-            num_problems = len(attempts)
-            attempted = sum(attempts)
+            problems = self.runtime.query(self).parent().descendants()
+            if hasattr(problems, "count_and_sum"):
+                # The runtime can total the attempts with one read of them all.
+                num_problems, attempted = problems.count_and_sum("problem_attempted")
+            else:
+                attempts = list(problems.attr("problem_attempted"))
+                num_problems, attempted = len(attempts), sum(attempts)
             if num_problems == 0:
                 content = u"There are no problems here..."
             elif attempted == num_problems:
@@ -2,18 +2,28 @@
 Machinery to make the common case easy when building new runtimes
 """
 
+import copy
 import functools
+import hashlib
+import logging
 import re
 import threading
 
-from lxml import etree
 from cStringIO import StringIO
 
-from collections import namedtuple
+from collections import defaultdict, namedtuple, OrderedDict
+from contextlib import contextmanager
 from xblock.fields import Field, BlockScope, Scope, ScopeIds, UserScope
-from xblock.field_data import FieldData
-from xblock.exceptions import NoSuchViewError, NoSuchHandlerError
+from xblock.field_data import BufferedFieldData, FieldData
+from xblock.exceptions import BadPathError, NoSuchViewError, NoSuchHandlerError
 from xblock.core import XBlock
+from xblock.fragment import Fragment
+from xblock.instrumentation import Instrumentation, InstrumentedFieldData
+
+# lxml and multiprocessing are imported by the methods that use them, so
+# that processes that never import or export XML don't pay to load them.
+
+log = logging.getLogger(__name__)
 
 
 class KeyValueStore(object):
@@ -25,7 +35,10 @@ class KeyValueStore(object):
     Key = namedtuple("Key", "scope, user_id, block_scope_id, field_name")
 
     def get(self, key):
-        """Abstract get method. Implementations should return the value of the given `key`."""
+        """
+        Abstract get method. Implementations should return the value of the given `key`,
+        and must raise KeyError if `key` has no value: :func:`get_many` relies on it.
+        """
         pass
 
     def set(self, key, value):
@@ -47,6 +60,24 @@ class KeyValueStore(object):
         """
         raise KeyError(repr(key))
 
+    def get_many(self, keys):
+        """
+        Bulk lookup of the kvs.
+        Returns a dict mapping each of `keys` that has a value to that value; keys without
+        a value are left out. This implementation brute force gets key by key, which may be
+        inefficient for any runtimes doing a round trip to a store on each get. Such
+        implementations will want to override this method.  It takes a key to have no
+        value when :func:`get` raises KeyError for it, rather than asking :func:`has`.
+        :keys: the keys to look up
+        """
+        values = {}
+        for key in keys:
+            try:
+                values[key] = self.get(key)
+            except KeyError:
+                pass
+        return values
+
     def set_many(self, update_dict):
         """
         Bulk update of the kvs.
@@ -103,9 +134,15 @@ class DbModel(FieldData):
             field_name=name
         )
         """
-        field = self._getfield(block, name)
+        return self._key_from_scope_ids(self._getfield(block, name), name, block.scope_ids)
+
+    @staticmethod
+    def _key_from_scope_ids(field, name, scope_ids):
+        """
+        Build the key for `field`, named `name`, of the block identified by `scope_ids`.
+        """
         if field.scope in (Scope.children, Scope.parent):
-            block_id = block.scope_ids.usage_id
+            block_id = scope_ids.usage_id
             user_id = None
         else:
             block_scope = field.scope.block
@@ -113,14 +150,14 @@ class DbModel(FieldData):
             if block_scope == BlockScope.ALL:
                 block_id = None
             elif block_scope == BlockScope.USAGE:
-                block_id = block.scope_ids.usage_id
+                block_id = scope_ids.usage_id
             elif block_scope == BlockScope.DEFINITION:
-                block_id = block.scope_ids.def_id
+                block_id = scope_ids.def_id
             elif block_scope == BlockScope.TYPE:
-                block_id = block.scope_ids.block_type
+                block_id = scope_ids.block_type
 
             if field.scope.user == UserScope.ONE:
-                user_id = block.scope_ids.user_id
+                user_id = scope_ids.user_id
             else:
                 user_id = None
 
@@ -141,6 +178,30 @@ class DbModel(FieldData):
         """
         return self._kvs.get(self._key(block, name))
 
+    def get_many(self, block, names):
+        """
+        Retrieve the values of the fields named in `names`, with a single
+        lookup in the underlying KeyValueStore.
+        """
+        keys = dict((self._key(block, name), name) for name in names)
+        return dict((keys[key], value) for key, value in self._kvs.get_many(keys).iteritems())
+
+    def get_many_for_blocks(self, requests):
+        """
+        Retrieve the values of fields of many blocks, with a single lookup
+        in the underlying KeyValueStore.
+
+        Returns a list with a dict for each of `requests`, a list of
+        (block, names) pairs, as :func:`get_many` returns.
+        """
+        requests = list(requests)
+        keys = [dict((self._key(block, name), name) for name in names) for block, names in requests]
+        found = self._kvs.get_many(set(key for block_keys in keys for key in block_keys))
+        return [
+            dict((block_keys[key], found[key]) for key in block_keys if key in found)
+            for block_keys in keys
+        ]
+
     def set(self, block, name, value):
         """
         Set the value of the field named `name`
@@ -172,6 +233,15 @@ class DbModel(FieldData):
 
         self._kvs.set_many(updated_dict)
 
+    def set_many_for_blocks(self, updates):
+        """Update the fields of many blocks with a single write to the underlying model."""
+        updated_dict = {}
+        for block, update_dict in updates:
+            for (key, value) in update_dict.items():
+                updated_dict[self._key(block, key)] = value
+
+        self._kvs.set_many(updated_dict)
+
     def default(self, block, name):
         """
         Ask the kvs for the default (default implementation which other classes may override).
@@ -218,22 +288,112 @@ class UsageStore(object):
         """
         pass
 
+    def create_definitions(self, block_types):
+        """Make a definition of each of `block_types`.
+
+        Returns a list of the newly-created definition ids.  This
+        implementation makes them one at a time with `create_definition`.
+
+        """
+        return [self.create_definition(block_type) for block_type in block_types]
+
+    def create_usages(self, def_ids):
+        """Make a usage of each of `def_ids`.
+
+        Returns a list of the newly-created usage ids.  This implementation
+        makes them one at a time with `create_usage`.
+
+        """
+        return [self.create_usage(def_id) for def_id in def_ids]
+
+    def set_definition_id(self, usage_id, def_id):
+        """Point the existing usage `usage_id` at the definition `def_id`.
+
+        Re-importing uses this to give a usage new content without changing
+        its id.  This implementation can't, and raises NotImplementedError:
+        re-importing into a store that doesn't override it replaces the
+        usages whose shared content changes with new usages instead.
+
+        """
+        raise NotImplementedError("This UsageStore can't change the definition of a usage")
+
 
 class Runtime(object):
     """
     Access to the runtime environment for XBlocks.
     """
 
-    def __init__(self, usage_store, field_data, mixins=()):
+    # Read the fields of all a block's children at once in `render_children`.
+    prefetch_children = True
+
+    # How many blocks' worth of field values to write at once when importing.
+    import_chunk_size = 1000
+
+    # Give blocks without children that are imported from identical XML in
+    # one import a single definition, so that their content is only stored once.
+    deduplicate_definitions = True
+
+    def __init__(self, usage_store, field_data, mixins=(), read_only_views=(), instrumentation=None):
         """
         :param mixins: Classes that should be mixed in with every :class:`~xblock.core.XBlock`
             created by this `Runtime`
         :type mixins: `tuple` of `class`es
+
+        :param read_only_views: Names of views that are always rendered read-only
+            (see :func:`render`)
+        :type read_only_views: `iterable` of `str`
+
+        :param instrumentation: Told about the work done by this `Runtime`,
+            each block it gets, and each call it makes to `field_data`
+        :type instrumentation: :class:`~xblock.instrumentation.Instrumentation`
         """
+        if instrumentation is not None:
+            field_data = InstrumentedFieldData(field_data, instrumentation)
+            # Shadow the class's `get_block`, whichever class defines it,
+            # with one that reports each block got.
+            setattr(self, 'get_block', self._instrumented_get_block)
+        else:
+            instrumentation = Instrumentation()
+        self.instrumentation = instrumentation
         self._view_name = None
+        # Set `read_only` to True to render every view read-only, for instance
+        # for the duration of a request that is known not to change any state.
+        self.read_only = False
+        self.read_only_views = frozenset(read_only_views)
+        # While streaming, the children whose rendering has been deferred.
+        self._deferred_children = None
+        # During `parse_xml_parallel`, the subtrees parsed by worker processes,
+        # keyed by their root element.
+        self._parsed_subtrees = {}
+        # While exporting with `export_to_xml_stream`, the child blocks of the
+        # block being exported, keyed by the elements they are to be written at.
+        self._deferred_exports = None
+        # The number of bytes of imported XML that reused an existing definition.
+        self.deduplicated_bytes = 0
         self.mixologist = Mixologist(mixins)
+        # The class of each block type, and the mixed class of each class,
+        # as of the XBlock plugin generation they were loaded in.
+        self._block_classes = {}
+        self._mixed_classes = {}
+        self._plugin_generation = XBlock._plugin_generation  # pylint: disable=W0212
         self.usage_store = usage_store
-        self.field_data = field_data
+        self._field_data = field_data
+        # The buffered FieldData of the import session each thread is in, if
+        # any, and the definitions it has made for digested XML (see
+        # `_digest_maps`).
+        self._import_sessions = threading.local()
+
+    @property
+    def field_data(self):
+        """
+        The FieldData of the blocks this runtime constructs.  On a thread
+        in an :func:`import_session`, the session's buffering FieldData.
+        """
+        return getattr(self._import_sessions, 'field_data', None) or self._field_data
+
+    @field_data.setter
+    def field_data(self, field_data):  # pylint: disable=C0111
+        self._field_data = field_data
 
     # Block operations
 
@@ -242,26 +402,76 @@ class Runtime(object):
         Construct a new xblock of the type identified by block_type,
         passing *args and **kwargs into __init__
         """
-        block_class = XBlock.load_class(block_type, default_class)
-        return self.construct_xblock_from_class(
-            cls=block_class,
-            scope_ids=scope_ids,
-            field_data=field_data,
-            *args, **kwargs
-        )
+        block_classes = self._class_caches()[0]
+        try:
+            block_class = block_classes[block_type]
+        except KeyError:
+            block_class = XBlock.load_class(block_type, default_class)
+            if block_class is not default_class:
+                # Don't remember the default for a block type that isn't known.
+                block_classes[block_type] = block_class
+        return self.construct_xblock_from_class(block_class, scope_ids, field_data, *args, **kwargs)
 
     def construct_xblock_from_class(self, cls, scope_ids, field_data=None, *args, **kwargs):
         """
         Construct a new xblock of type cls, mixing in the mixins
         defined for this application
         """
-        return self.mixologist.mix(cls)(
+        return self._mixed_class(cls)(
             runtime=self,
             field_data=field_data or self.field_data,
             scope_ids=scope_ids,
             *args, **kwargs
         )
 
+    def block_class(self, block_type):
+        """
+        The class of blocks of `block_type`, with this runtime's mixins.
+
+        Raises :class:`~xblock.plugin.PluginMissingError` if there is no
+        such block type.
+        """
+        block_classes = self._class_caches()[0]
+        try:
+            block_class = block_classes[block_type]
+        except KeyError:
+            block_class = block_classes[block_type] = XBlock.load_class(block_type)
+        return self._mixed_class(block_class)
+
+    def _mixed_class(self, cls):
+        """`cls`, with this runtime's mixins."""
+        mixed_classes = self._class_caches()[1]
+        try:
+            return mixed_classes[cls]
+        except KeyError:
+            mixed_class = mixed_classes[cls] = self.mixologist.mix(cls)
+            return mixed_class
+
+    def _class_caches(self):
+        """
+        The block classes and mixed classes this runtime has loaded, emptied
+        if the XBlock plugins have changed since they were loaded.
+        """
+        generation = XBlock._plugin_generation  # pylint: disable=W0212
+        if generation != self._plugin_generation:
+            self._block_classes = {}
+            self._mixed_classes = {}
+            self._plugin_generation = generation
+        return self._block_classes, self._mixed_classes
+
+    def warm_up(self):
+        """
+        Find the class of every installed block type now, rather than when
+        the first block of each type is constructed.
+
+        Block types that fail to load are logged and skipped.
+        """
+        for block_type, _ in XBlock.load_classes():
+            try:
+                self.block_class(block_type)
+            except Exception:  # pylint: disable=W0703
+                log.warning("Unable to load block type %r", block_type, exc_info=True)
+
     def get_block(self, usage_id):
         """Get a block by usage id.
 
@@ -269,6 +479,16 @@ class Runtime(object):
         """
         raise NotImplementedError("Runtime needs to provide get_block()")
 
+    def _instrumented_get_block(self, usage_id):
+        """Get a block with the class's :func:`get_block`, telling the instrumentation."""
+        token = self.instrumentation.begin("get_block", None, usage_id)
+        block = None
+        try:
+            block = type(self).get_block(self, usage_id)
+            return block
+        finally:
+            self.instrumentation.end(token, block)
+
     # Parsing XML
 
     def parse_xml_string(self, xml):
@@ -277,10 +497,391 @@ class Runtime(object):
 
     def parse_xml_file(self, fileobj):
         """Parse an open XML file, returning a usage id."""
+        from lxml import etree
         root = etree.parse(fileobj).getroot()
-        usage_id = self._usage_id_from_node(root, None)
+        with self.import_session():
+            usage_id = self._usage_id_from_node(root, None)
         return usage_id
 
+    @contextmanager
+    def import_session(self):
+        """
+        A context manager for importing many blocks at once.
+
+        Within it, the field values saved by blocks are buffered, and written
+        out in chunks of `import_chunk_size` blocks with a single
+        :func:`~xblock.field_data.FieldData.set_many_for_blocks` each.
+        Everything is written out when the session ends.
+
+        The session only buffers the blocks constructed by the thread that
+        began it: other threads using the runtime meanwhile are unaffected.
+        Blocks with identical XML only share a definition if they are
+        imported in the same session, as definitions may be edited after it.
+
+        """
+        session = self._import_sessions
+        if getattr(session, 'field_data', None) is not None:
+            # Already in a session.
+            yield
+            return
+
+        buffered = session.field_data = BufferedFieldData(self._field_data, self.import_chunk_size)
+        session.definitions_by_digest = session.definition_digests = None
+        try:
+            yield
+        finally:
+            session.field_data = None
+            session.definitions_by_digest = session.definition_digests = None
+            # Blocks made during the session write straight through from now on.
+            buffered.close()
+
+    def _digest_maps(self):
+        """
+        The definitions made for digested XML in this thread's import
+        session: a dict of their ids by the digest of the XML, and a dict
+        of the digest and size of the XML of each of them, by id.
+        """
+        session = self._import_sessions
+        if getattr(session, 'definitions_by_digest', None) is None:
+            session.definitions_by_digest, session.definition_digests = {}, {}
+        return session.definitions_by_digest, session.definition_digests
+
+    def parse_xml_stream(self, fileobj):
+        """
+        Parse an open XML file a piece at a time, returning a usage id.
+
+        This produces the same blocks, with the same ids, as
+        :func:`parse_xml_file`, without holding the whole document in memory.
+        Each block is built and saved as soon as its end tag has been read,
+        and its XML is then thrown away.  Blocks that parse their children
+        themselves (by overriding :func:`~xblock.core.XBlock.parse_xml`)
+        are given their whole subtree, as usual.
+
+        """
+        from lxml import etree
+        with self.import_session():
+            return self._parse_xml_events(etree.iterparse(fileobj, events=("start", "end")))
+
+    def parse_xml_parallel(self, fileobj, split_tags=("sequence", "vertical"), processes=None):
+        """
+        Parse an open XML file using a pool of worker processes, returning a usage id.
+
+        The document is split at the elements named in `split_tags`: each
+        outermost such element below the root (reached through blocks that
+        parse their children with the default
+        :func:`~xblock.core.XBlock.parse_xml`) is parsed into blocks in a
+        worker process.  The workers' usages, definitions and field values
+        are then recorded here in document order, so the result, ids
+        included, is the same as :func:`parse_xml_file` would produce.
+
+        Blocks parsed in a worker see a plain :class:`Runtime`, so their
+        `parse_xml` may only use the parsing methods of the runtime.
+
+        `processes` is the number of worker processes to use, by default one
+        per CPU.  With `processes=1`, the subtrees are parsed in this process.
+
+        """
+        import multiprocessing
+        from lxml import etree
+        root = etree.parse(fileobj).getroot()
+        subtrees = self._split_subtrees(root, frozenset(split_tags))
+        # Allow the workers to mix in the same classes.
+        # pylint: disable=W0212
+        jobs = [
+            (etree.tostring(node, with_tail=False), self.mixologist._mixins, self.deduplicate_definitions)
+            for node in subtrees
+        ]
+        if processes == 1 or len(jobs) < 2:
+            parsed = [_parse_subtree(job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                parsed = pool.map(_parse_subtree, jobs)
+            finally:
+                pool.close()
+                pool.join()
+
+        self._parsed_subtrees = dict(zip(subtrees, parsed))
+        try:
+            with self.import_session():
+                return self._usage_id_from_node(root, None)
+        finally:
+            self._parsed_subtrees = {}
+
+    def _split_subtrees(self, root, split_tags):
+        """The outermost elements below `root` named in `split_tags`, in document order."""
+        subtrees = []
+
+        def visit(node):
+            """Find the subtrees among the children of `node`."""
+            for child in node:
+                if child.tag in split_tags:
+                    subtrees.append(child)
+                elif _parses_children_as_blocks(self.block_class(child.tag)):
+                    visit(child)
+
+        if _parses_children_as_blocks(self.block_class(root.tag)):
+            visit(root)
+        return subtrees
+
+    def _add_parsed_subtree(self, parsed, parent_id):
+        """
+        Record the blocks of a subtree parsed by :func:`_parse_subtree`,
+        returning the usage id of its root.
+        """
+        # The worker's ids, and the ids they become here.  Creating them in
+        # the order the worker did gives the ids a serial parse would.
+        ids = {}
+        blocks = {}
+        block_types = {}
+        # The definitions with digests made here, and not yet used.
+        unused = set()
+        for kind, local_id, ref in parsed.creations:
+            if kind == "definition":
+                block_types[local_id] = ref
+                if local_id in parsed.digests:
+                    ids[local_id], created = self._digested_definition(ref, *parsed.digests[local_id])
+                    if created:
+                        unused.add(local_id)
+                else:
+                    ids[local_id] = self.usage_store.create_definition(ref)
+            else:
+                if ref in parsed.digests:
+                    if ref in unused:
+                        unused.remove(ref)
+                    else:
+                        # As _new_scope_ids would have counted it.
+                        self.deduplicated_bytes += parsed.digests[ref][1]
+                ids[local_id] = self.usage_store.create_usage(ids[ref])
+                keys = ScopeIds(UserScope.NONE, block_types[ref], ids[ref], ids[local_id])
+                block_class = self.block_class(keys.block_type)
+                blocks[local_id] = self.construct_xblock_from_class(block_class, keys)
+
+        for kind, local_id, payload in parsed.writes:
+            block = blocks[local_id]
+            if kind == "delete":
+                self.field_data.delete(block, payload)
+                continue
+            if payload.get("children"):
+                payload["children"] = [ids.get(child_id, child_id) for child_id in payload["children"]]
+            if "parent" in payload:
+                if local_id == parsed.usage_id:
+                    payload["parent"] = parent_id
+                else:
+                    payload["parent"] = ids.get(payload["parent"], payload["parent"])
+            self.field_data.set_many(block, payload)
+        return ids[parsed.usage_id]
+
+    def reimport_xml_string(self, xml, usage_id):
+        """Re-import a string of XML over the block `usage_id`, returning a usage id."""
+        return self.reimport_xml_file(StringIO(xml), usage_id)
+
+    def reimport_xml_file(self, fileobj, usage_id):
+        """
+        Re-import an open XML file over the block `usage_id`, returning a usage id.
+
+        The XML is parsed into blocks as usual, but rather than being stored
+        as new usages, those blocks are matched against the existing blocks
+        from `usage_id` down, and only the differences are written:
+
+        * Each child is matched to an existing child of the same type by its
+          `name`, or if it has none, by its position among the unnamed
+          children of its type.  Matched blocks keep their usage ids, and so
+          the state stored for them.
+
+        * The field values that have changed are written, and content and
+          settings that are no longer set are deleted.  Blocks that may share
+          their definition with identical XML (see `deduplicate_definitions`)
+          are pointed at a definition of the new XML if their content
+          changes, leaving the old definition to the blocks sharing it.  If
+          the usage store can't do that, they are replaced by a new usage.
+
+        * Unmatched new children are added, and unmatched old children are
+          removed from their parent.
+
+        The usage id returned is `usage_id`, unless the root block had to be
+        replaced.
+
+        """
+        from lxml import etree
+        root = etree.parse(fileobj).getroot()
+        # Allow the scratch parse to mix in the same classes.
+        # pylint: disable=W0212
+        parsed = _parse_in_scratch(root, self.mixologist._mixins, self.deduplicate_definitions)
+        blocks = _parsed_blocks(parsed)
+        with self.import_session():
+            block = self.get_block(usage_id)
+            usage_id = self._reimport_block(parsed, blocks, parsed.usage_id, block)
+        return usage_id
+
+    def _reimport_block(self, parsed, blocks, parsed_id, block):
+        """
+        Update `block` to be the block `parsed_id` of `parsed` (see
+        :func:`reimport_xml_file`), returning the usage id of the result.
+        """
+        block_type, values = blocks[parsed_id]
+        parent_id = block.parent
+        if block_type != block.scope_ids.block_type:
+            return self._add_parsed_subtree(_parsed_part(parsed, parsed_id, blocks), parent_id)
+
+        stored, changed, deleted = _reimport_changes(block, values)
+        if self._digestible(type(block)) and any(
+                block.fields[name].scope.block == BlockScope.DEFINITION for name in changed.keys() + deleted
+        ):
+            # Other usages may share the old definition, so this one gets
+            # another, keeping its id, and so the state stored for it.  If the
+            # usage store can't do that, the usage is replaced.
+            if not _sets_definition_ids(self.usage_store):
+                return self._add_parsed_subtree(_parsed_part(parsed, parsed_id, blocks), parent_id)
+            block = self._redefine(block, parsed, parsed_id)
+            stored, changed, deleted = _reimport_changes(block, values)
+
+        if changed:
+            self.field_data.set_many(block, changed)
+        for name in deleted:
+            self.field_data.delete(block, name)
+
+        if block.has_children:
+            old_children = stored.get("children", [])
+            children = self._reimport_children(parsed, blocks, values.get("children") or [], block, old_children)
+            if children != old_children:
+                self.field_data.set_many(block, {"children": children})
+        return block.scope_ids.usage_id
+
+    def _redefine(self, block, parsed, parsed_id):
+        """
+        Point the usage of `block` at a definition of the XML of the block
+        `parsed_id` of `parsed`: one already made for identical XML in this
+        import, or else a new one.  Returns the block, as it is now.
+        """
+        parsed_def_id = next(
+            ref for kind, local_id, ref in parsed.creations if kind == "usage" and local_id == parsed_id
+        )
+        block_type = block.scope_ids.block_type
+        if parsed_def_id in parsed.digests:
+            digest, size = parsed.digests[parsed_def_id]
+            def_id, created = self._digested_definition(block_type, digest, size)
+            if not created:
+                self.deduplicated_bytes += size
+        else:
+            def_id = self.usage_store.create_definition(block_type)
+        self.usage_store.set_definition_id(block.scope_ids.usage_id, def_id)
+        return self.get_block(block.scope_ids.usage_id)
+
+    def _reimport_children(self, parsed, blocks, parsed_ids, block, old_children):
+        """
+        Update the children `old_children` of `block` to be the blocks
+        `parsed_ids` of `parsed`, returning the new list of child usage ids.
+        """
+        # The old children with each key, in order: siblings that share a
+        # name are matched in turn, by their position among themselves.
+        old_blocks = defaultdict(list)
+        positions = defaultdict(int)
+        for child_id in old_children:
+            child = self.get_block(child_id)
+            old_blocks[_reimport_key(child.scope_ids.block_type, child.name, positions)].append(child)
+
+        children = []
+        positions = defaultdict(int)
+        for parsed_id in parsed_ids:
+            block_type, values = blocks[parsed_id]
+            matches = old_blocks.get(_reimport_key(block_type, values.get("name"), positions))
+            child = matches.pop(0) if matches else None
+            if child is None:
+                part = _parsed_part(parsed, parsed_id, blocks)
+                children.append(self._add_parsed_subtree(part, block.scope_ids.usage_id))
+            else:
+                children.append(self._reimport_block(parsed, blocks, parsed_id, child))
+        return children
+
+    def _parse_xml_events(self, events):
+        """Build the blocks for the `iterparse` `events`, returning the root's usage id."""
+        # The elements being read, and the blocks they will become: a list
+        # of (node, keys, block_class, child usage ids).
+        stack = []
+        # While inside an element whose block parses its own children, how
+        # deep inside it we are.
+        depth_in_whole = 0
+        usage_id = None
+        for event, node in events:
+            if depth_in_whole:
+                depth_in_whole += 1 if event == "start" else -1
+                if depth_in_whole:
+                    continue
+            elif event == "start":
+                block_class = self.block_class(node.tag)
+                # Create the ids in document order, as parse_xml_file does.
+                # A block without children makes no ids inside it, so its
+                # ids can wait until its XML has been read, to be digested.
+                keys = None if self._digestible(block_class) else self._new_scope_ids(node.tag)
+                stack.append((node, keys, block_class, []))
+                if not _parses_children_as_blocks(block_class):
+                    depth_in_whole = 1
+                continue
+
+            node, keys, block_class, child_ids = stack.pop()
+            if keys is None:
+                keys = self._new_scope_ids(node.tag, self._xml_digest(node))
+            if _parses_children_as_blocks(block_class):
+                # The children have been parsed already.
+                del node[:]
+            block = block_class.parse_xml(node, self, keys)
+            if child_ids:
+                block.children = child_ids
+            parent = stack[-1] if stack else None
+            block.parent = parent[1].usage_id if parent else None
+            block.save()
+            usage_id = keys.usage_id
+            if parent:
+                parent[3].append(usage_id)
+                # We're done with this element: let it go.
+                parent[0].remove(node)
+            node.clear()
+        return usage_id
+
+    def _new_scope_ids(self, block_type, xml_digest=None):
+        """
+        Create a new usage of `block_type`, returning its ScopeIds.
+
+        The usage gets a new definition, unless `xml_digest` (from
+        :func:`_xml_digest`) matches that of an existing definition.
+
+        """
+        if xml_digest is None:
+            def_id = self.usage_store.create_definition(block_type)
+        else:
+            digest, size = xml_digest
+            def_id, created = self._digested_definition(block_type, digest, size)
+            if not created:
+                self.deduplicated_bytes += size
+        usage_id = self.usage_store.create_usage(def_id)
+        return ScopeIds(UserScope.NONE, block_type, def_id, usage_id)
+
+    def _digested_definition(self, block_type, digest, size):
+        """
+        Find or create the definition of `block_type` for XML with `digest`,
+        returning its id, and whether it was created.
+        """
+        definitions_by_digest, definition_digests = self._digest_maps()
+        def_id = definitions_by_digest.get(digest)
+        if def_id is not None:
+            return def_id, False
+        def_id = self.usage_store.create_definition(block_type)
+        definitions_by_digest[digest] = def_id
+        definition_digests[def_id] = (digest, size)
+        return def_id, True
+
+    def _digestible(self, block_class):
+        """Can the blocks of `block_class` share definitions with identical XML?"""
+        return self.deduplicate_definitions and not block_class.has_children
+
+    @staticmethod
+    def _xml_digest(node):
+        """The digest of the canonical XML of `node`, and its size in bytes."""
+        from lxml import etree
+        xml = etree.tostring(node, method="c14n", with_tail=False)
+        return hashlib.sha1(xml).hexdigest(), len(xml)
+
     def _usage_id_from_node(self, node, parent_id):
         """Create a new usage id from an XML dom node.
 
@@ -289,16 +890,15 @@ class Runtime(object):
         :param parent_id: The usage ID of the parent block.
 
         """
-        block_type = node.tag
-        # TODO: a way for this node to be a usage to an existing definition?
-        def_id = self.usage_store.create_definition(block_type)
-        usage_id = self.usage_store.create_usage(def_id)
-        keys = ScopeIds(UserScope.NONE, block_type, def_id, usage_id)
-        block_class = self.mixologist.mix(XBlock.load_class(block_type))
+        if node in self._parsed_subtrees:
+            return self._add_parsed_subtree(self._parsed_subtrees.pop(node), parent_id)
+        block_class = self.block_class(node.tag)
+        xml_digest = self._xml_digest(node) if self._digestible(block_class) else None
+        keys = self._new_scope_ids(node.tag, xml_digest)
         block = block_class.parse_xml(node, self, keys)
         block.parent = parent_id
         block.save()
-        return usage_id
+        return keys.usage_id
 
     def add_node_as_child(self, block, node):
         """
@@ -313,17 +913,71 @@ class Runtime(object):
         """
         Export the block to XML, writing the XML to `xmlfile`.
         """
+        from lxml import etree
         root = etree.Element("unknown_root")
         tree = etree.ElementTree(root)
         block.export_xml(root)
         tree.write(xmlfile, xml_declaration=True, encoding="utf8")
 
+    def export_to_xml_stream(self, block, xmlfile):
+        """
+        Export the block to XML, writing the XML to `xmlfile` as it goes.
+
+        This writes the same XML as :func:`export_to_xml` (though characters
+        in attributes may be escaped differently), but rather than building
+        the whole tree of elements first, each block's element is written out
+        as soon as the block has exported itself, with its child blocks
+        written in place as they are reached.  Only the blocks on the path to
+        the one being exported, and their children, are held at once.  If
+        `prefetch_children` is set, each block's children have their fields
+        read ahead of time with :func:`prefetch_fields`.
+
+        """
+        from lxml import etree
+        # Spelled as ElementTree.write spells it in the XML declaration.
+        with etree.xmlfile(xmlfile, encoding="UTF8") as xml:
+            xml.write_declaration()
+            self._export_block_stream(block, xml)
+
+    def _export_block_stream(self, block, xml):
+        """Export `block` to the `etree.xmlfile` `xml`."""
+        from lxml import etree
+        node = etree.Element("unknown_root")
+        outer_exports = self._deferred_exports
+        self._deferred_exports = children = OrderedDict()
+        try:
+            block.export_xml(node)
+        finally:
+            self._deferred_exports = outer_exports
+
+        if not children:
+            xml.write(node)
+            return
+        if self.prefetch_children:
+            self.prefetch_fields(children.values(), every_scope=True)
+        with xml.element(node.tag, node.attrib, node.nsmap):
+            if node.text:
+                xml.write(node.text)
+            for child_node in node:
+                child = children.pop(child_node, None)
+                if child is None:
+                    xml.write(child_node)
+                    continue
+                self._export_block_stream(child, xml)
+                if child_node.tail:
+                    xml.write(child_node.tail)
+
     def add_block_as_child_node(self, block, node):
         """
         Export `block` as a child node of `node`.
         """
+        from lxml import etree
         child = etree.SubElement(node, "unknown")
-        block.export_xml(child)
+        if self._deferred_exports is not None:
+            # Streaming: the block is exported when the output reaches it.
+            self._deferred_exports[child] = block
+        else:
+            block.export_xml(child)
 
     # Rendering
 
@@ -339,11 +993,24 @@ class Runtime(object):
         view is returned, with possible modifications by the runtime to
         integrate it into a larger whole.
 
+        If `view_name` is one of the runtime's `read_only_views`, or if
+        `read_only` is set on the runtime, the view is rendered read-only: the
+        block isn't saved afterwards, its fields aren't tracked for changes,
+        and any attempt to change a field raises
+        :class:`~xblock.exceptions.ReadOnlyFieldError`.  Children rendered
+        from a read-only view are rendered read-only too.
+
         """
         # Set the active view so that :function:`render_child` can use it
         # as a default
         old_view_name = self._view_name
+        old_read_only = self.read_only
+        old_block_read_only = block._read_only  # pylint: disable=W0212
         self._view_name = view_name
+        self.read_only = read_only = old_read_only or view_name in self.read_only_views
+        block._read_only = read_only  # pylint: disable=W0212
+        token = self.instrumentation.begin("render", block, view_name)
+        wrapped = None
         try:
 
             view_fn = getattr(block, view_name, None)
@@ -355,12 +1022,18 @@ class Runtime(object):
 
             frag = view_fn(context)
 
-            # Explicitly save because render action may have changed state
-            block.save()
-            return self.wrap_child(block, view_name, frag, context)
+            # Explicitly save because render action may have changed state.
+            # A read-only render can't have, so skip the write path entirely.
+            if not read_only:
+                self._save_block(block)
+            wrapped = self.wrap_child(block, view_name, frag, context)
+            return wrapped
         finally:
+            self.instrumentation.end(token, wrapped)
             # Reset the active view to what it was before entering this method
             self._view_name = old_view_name
+            self.read_only = old_read_only
+            block._read_only = old_block_read_only  # pylint: disable=W0212
 
     def render_child(self, child, view_name=None, context=None):
         """A shortcut to render a child block.
@@ -370,26 +1043,132 @@ class Runtime(object):
         If `view_name` is not provided, it will default to the view name you're
         being rendered with.
 
-        Returns the same value as :func:`render`.
+        Returns the same value as :func:`render`.  While streaming (see
+        :func:`render_stream`), the child isn't rendered yet: the returned
+        fragment is a placeholder, to be used in your fragment's content.
 
         """
-        return child.render(view_name or self._view_name, context)
+        view_name = view_name or self._view_name
+        if self._deferred_children is not None:
+            placeholder = Fragment(_STREAM_PLACEHOLDER % len(self._deferred_children))
+            self._deferred_children.append((child, view_name, context, self.read_only))
+            return placeholder
+        token = self.instrumentation.begin("render_child", child, view_name)
+        frag = None
+        try:
+            frag = child.render(view_name, context)
+            return frag
+        finally:
+            self.instrumentation.end(token, frag)
 
     def render_children(self, block, view_name=None, context=None):
         """Render a block's children, returning a list of results.
 
         Each child of `block` will be rendered, just as :func:`render_child` does.
+        If `prefetch_children` is set, the children's fields are read ahead
+        of time with :func:`prefetch_fields`.
 
         Returns a list of values, each as provided by :func:`render`.
 
         """
+        children = [self.get_block(child_id) for child_id in block.children]
+        if self.prefetch_children:
+            self.prefetch_fields(children)
         results = []
-        for child_id in block.children:
-            child = self.get_block(child_id)
+        for child in children:
             result = self.render_child(child, view_name, context)
             results.append(result)
         return results
 
+    def prefetch_fields(self, blocks, every_scope=False, names=None):
+        """
+        Read the fields of all of `blocks` that are specific to each block,
+        with one `get_many_for_blocks` on their FieldData, rather than with a
+        `has` and a `get` for each field as it's used.
+
+        Only fields scoped to the block's usage (and its children and parent)
+        are read: other blocks rendered before these ones could change fields
+        with wider scopes.  Set `every_scope` to read all the fields, when
+        nothing will change them while the blocks are in use.  Set `names` to
+        read only the fields with those names.
+        """
+        # Allow this method to access the field caches of the blocks
+        # pylint: disable=W0212
+        # The (block, fields) to read, by the FieldData to read them from.
+        requests = OrderedDict()
+        for block in blocks:
+            fields = [
+                field for field in block.fields.values()
+                if field.name not in block._field_data_cache and (names is None or field.name in names) and (
+                    every_scope or
+                    field.scope in (Scope.children, Scope.parent) or
+                    field.scope.block == BlockScope.USAGE
+                )
+            ]
+            if fields:
+                requests.setdefault(block._field_data, []).append((block, fields))
+
+        for field_data, block_fields in requests.iteritems():
+            all_values = field_data.get_many_for_blocks(
+                [(block, [field.name for field in fields]) for block, fields in block_fields]
+            )
+            for (block, fields), values in zip(block_fields, all_values):
+                for field in fields:
+                    if field.name in values:
+                        value = field.from_json(values[field.name])
+                    else:
+                        value = field._read_default(block)
+                    field._set_cached_value(block, value)
+
+    def render_stream(self, block, view_name, context=None):
+        """Render a block incrementally, as a sequence of fragments.
+
+        This is like :func:`render`, but rather than rendering the whole tree
+        of blocks at once, children are only rendered when the output reaches
+        them.  Each fragment produced holds the next piece of body HTML, and
+        the resources needed by that piece.
+
+        Concatenating the body HTML of all the fragments gives the same HTML as
+        :func:`render`.  The first fragment is produced as soon as `block`
+        itself has been rendered, so a page can be sent before all of its
+        blocks have been rendered.  Head resources needed by later pieces can
+        only be known once those pieces are rendered, so a page written from a
+        stream must allow for them after its ``<head>``.
+
+        Only views that put the fragments from :func:`render_child` into their
+        own content unchanged can be streamed: while streaming, those fragments
+        are placeholders, so a view that inspects or transforms its children's
+        HTML would see the placeholders rather than the HTML.
+
+        """
+        return self._render_stream(block, view_name, context, self.read_only)
+
+    def _render_stream(self, block, view_name, context, read_only):
+        """Produce the fragments for :func:`render_stream`."""
+        old_deferred_children = self._deferred_children
+        old_read_only = self.read_only
+        deferred_children = self._deferred_children = []
+        self.read_only = read_only
+        try:
+            frag = self.render(block, view_name, context)
+        finally:
+            self._deferred_children = old_deferred_children
+            self.read_only = old_read_only
+
+        # Pieces alternate between our own HTML, and the index of a child
+        # rendered in its place.
+        pieces = _STREAM_PLACEHOLDER_RE.split(frag.body_html())
+        first = Fragment(pieces[0])
+        first.add_frag_resources(frag)
+        yield first
+
+        for index, html in zip(pieces[1::2], pieces[2::2]):
+            child, child_view_name, child_context, child_read_only = deferred_children[int(index)]
+            for child_frag in self._render_stream(child, child_view_name, child_context, child_read_only):
+                yield child_frag
+            if html:
+                yield Fragment(html)
+
     def wrap_child(self, block, view, frag, context):  # pylint: disable=W0613
         """
         Wraps the fragment with any necessary HTML, informed by
@@ -411,21 +1190,33 @@ class Runtime(object):
         :param request: The request to handle
         :type request: webob.Request
         """
-        handler = getattr(block, handler_name, None)
-        if handler:
-            # Cache results of the handler call for later saving
-            results = handler(request)
-        else:
-            fallback_handler = getattr(block, "fallback_handler", None)
-            if fallback_handler:
+        token = self.instrumentation.begin("handle", block, handler_name)
+        try:
+            handler = getattr(block, handler_name, None)
+            if handler:
                 # Cache results of the handler call for later saving
-                results = fallback_handler(handler_name, request)
+                results = handler(request)
             else:
-                raise NoSuchHandlerError("Couldn't find handler %r for %r" % (handler_name, block))
+                fallback_handler = getattr(block, "fallback_handler", None)
+                if fallback_handler:
+                    # Cache results of the handler call for later saving
+                    results = fallback_handler(handler_name, request)
+                else:
+                    raise NoSuchHandlerError("Couldn't find handler %r for %r" % (handler_name, block))
+
+            # Write out dirty fields
+            self._save_block(block)
+            return results
+        finally:
+            self.instrumentation.end(token)
 
-        # Write out dirty fields
-        block.save()
-        return results
+    def _save_block(self, block):
+        """Save `block`, telling the instrumentation about it."""
+        token = self.instrumentation.begin("save", block, None)
+        try:
+            block.save()
+        finally:
+            self.instrumentation.end(token)
 
     def handler_url(self, block, url):
         """Get the actual URL to invoke a handler.
@@ -451,67 +1242,218 @@ class Runtime(object):
         raise NotImplementedError("Runtime needs to provide query()")
 
     def querypath(self, block, path):
-        """An XPath-like interface to `query`."""
-        class BadPath(Exception):
-            """Bad path exception thrown when path cannot be found."""
-            pass
-        results = self.query(block)
-        ROOT, SEP, WORD, FINAL = range(4)               # pylint: disable=C0103
-        state = ROOT
-        lexer = RegexLexer(
-            ("dotdot", r"\.\."),
-            ("dot", r"\."),
-            ("slashslash", r"//"),
-            ("slash", r"/"),
-            ("atword", r"@\w+"),
-            ("word", r"\w+"),
-            ("err", r"."),
-        )
-        for tokname, toktext in lexer.lex(path):
-            if state == FINAL:
-                # Shouldn't be any tokens after a last token.
-                raise BadPath()
-            if tokname == "dotdot":
-                # .. (parent)
-                if state == WORD:
-                    raise BadPath()
-                results = results.parent()
-                state = WORD
-            elif tokname == "dot":
-                # . (current node)
-                if state == WORD:
-                    raise BadPath()
-                state = WORD
-            elif tokname == "slashslash":
-                # // (descendants)
-                if state == SEP:
-                    raise BadPath()
-                if state == ROOT:
-                    raise NotImplementedError()
-                results = results.descendants()
-                state = SEP
-            elif tokname == "slash":
-                # / (here)
-                if state == SEP:
-                    raise BadPath()
-                if state == ROOT:
-                    raise NotImplementedError()
-                state = SEP
-            elif tokname == "atword":
-                # @xxx (attribute access)
-                if state != SEP:
-                    raise BadPath()
-                results = results.attr(toktext[1:])
-                state = FINAL
-            elif tokname == "word":
-                # xxx (tag selection)
-                if state != SEP:
-                    raise BadPath()
-                results = results.children().tagged(toktext)
-                state = WORD
-            else:
-                raise BadPath("Invalid thing: %r" % toktext)
-        return results
+        """
+        An XPath-like interface to `query`.
+
+        `path` is compiled once into a :class:`QueryPlan` (see
+        :func:`compile_querypath`), which is then run from `block`.
+
+        """
+        return compile_querypath(path).run(self.query(block))
+
+
+def _parses_children_as_blocks(block_class):
+    """
+    Does `block_class` parse XML with the default :func:`XBlock.parse_xml`,
+    which makes a child block of each child element?
+    """
+    return block_class.parse_xml.__func__ is XBlock.parse_xml.__func__
+
+
+def _sets_definition_ids(usage_store):
+    """
+    Can `usage_store` point a usage at another definition?  That is, does
+    it implement :func:`UsageStore.set_definition_id`?
+    """
+    return type(usage_store).set_definition_id.__func__ is not UsageStore.set_definition_id.__func__
+
+
+# Stands for a field without a stored value.
+_MISSING = object()
+
+
+# A subtree parsed by a worker process of `Runtime.parse_xml_parallel`.
+#   usage_id: the (worker's) usage id of the subtree's root.
+#   creations: a list of ("definition", def_id, block_type) and
+#       ("usage", usage_id, def_id), in the order they were made.
+#   writes: a list of ("set", usage_id, {name: value}) and
+#       ("delete", usage_id, name), in the order they were made.
+#   digests: the XML digest and size of the definitions that have them.
+ParsedSubtree = namedtuple("ParsedSubtree", "usage_id creations writes digests")
+
+
+class _ScratchUsageStore(UsageStore):
+    """A `UsageStore` that records what is made in it, with ids local to a worker."""
+    # pylint: disable=W0223
+
+    def __init__(self):
+        self.creations = []
+        self._usages = {}
+        self._definitions = {}
+
+    def _next_id(self):
+        """Generate a new id, which can't be mistaken for a real one."""
+        return "scratch-%d" % len(self.creations)
+
+    def create_usage(self, def_id):
+        usage_id = self._next_id()
+        self.creations.append(("usage", usage_id, def_id))
+        self._usages[usage_id] = def_id
+        return usage_id
+
+    def get_definition_id(self, usage_id):
+        return self._usages[usage_id]
+
+    def create_definition(self, block_type):
+        def_id = self._next_id()
+        self.creations.append(("definition", def_id, block_type))
+        self._definitions[def_id] = block_type
+        return def_id
+
+    def get_block_type(self, def_id):
+        return self._definitions[def_id]
+
+
+class _ScratchFieldData(FieldData):
+    """
+    A `FieldData` that records the writes made to it.
+
+    Every block is a new usage of a new definition while parsing, so values
+    are kept by usage id and field name, whatever their scope.
+    """
+
+    def __init__(self):
+        self.writes = []
+        self._values = {}
+
+    def get(self, block, name):
+        return copy.deepcopy(self._values[(block.scope_ids.usage_id, name)])
+
+    def set(self, block, name, value):
+        self.set_many(block, {name: value})
+
+    def set_many(self, block, update_dict):
+        update_dict = copy.deepcopy(update_dict)
+        usage_id = block.scope_ids.usage_id
+        for name, value in update_dict.iteritems():
+            self._values[(usage_id, name)] = value
+        self.writes.append(("set", usage_id, update_dict))
+
+    def delete(self, block, name):
+        usage_id = block.scope_ids.usage_id
+        self._values.pop((usage_id, name), None)
+        self.writes.append(("delete", usage_id, name))
+
+
+def _parse_subtree(job):
+    """
+    Parse a subtree for `Runtime.parse_xml_parallel`, returning a `ParsedSubtree`.
+
+    `job` is the subtree's XML, and the mixins and `deduplicate_definitions`
+    of the runtime importing it.
+    """
+    from lxml import etree
+    xml, mixins, deduplicate_definitions = job
+    return _parse_in_scratch(etree.fromstring(xml), mixins, deduplicate_definitions)
+
+
+def _parse_in_scratch(node, mixins, deduplicate_definitions):
+    """Parse `node` into blocks in a scratch runtime, returning a `ParsedSubtree`."""
+    # pylint: disable=W0212
+    runtime = Runtime(_ScratchUsageStore(), _ScratchFieldData(), mixins)
+    runtime.deduplicate_definitions = deduplicate_definitions
+    usage_id = runtime._usage_id_from_node(node, None)
+    return ParsedSubtree(
+        usage_id, runtime.usage_store.creations, runtime.field_data.writes, runtime._digest_maps()[1]
+    )
+
+
+def _reimport_key(block_type, name, positions):
+    """
+    The key to match a child block of type `block_type` named `name` when
+    re-importing.  `positions` counts the unnamed siblings of each type
+    before it, and is updated with this one.
+    """
+    if name:
+        return ("name", name)
+    position = positions[block_type]
+    positions[block_type] += 1
+    return ("position", block_type, position)
+
+
+def _reimport_changes(block, values):
+    """
+    Compare the stored fields of `block` with `values`, the values re-imported
+    for it, returning the stored values, and the values changed and the names
+    of the fields deleted by re-importing.
+    """
+    # Allow this function to look up stored values for the block.
+    # pylint: disable=W0212
+    stored_names = set(
+        name for name, field in block.fields.iteritems()
+        if name in values or field.scope in (Scope.content, Scope.settings, Scope.children)
+    )
+    stored_names.discard("parent")
+    stored = block._field_data.get_many(block, stored_names)
+    changed = dict(
+        (name, value) for name, value in values.iteritems()
+        if name not in ("children", "parent") and stored.get(name, _MISSING) != value
+    )
+    deleted = [
+        name for name in stored
+        if name not in values and name != "children" and block.fields[name].scope != Scope.children
+    ]
+    return stored, changed, deleted
+
+
+def _parsed_blocks(parsed):
+    """
+    The blocks of the `ParsedSubtree` `parsed`: a dict mapping each (worker)
+    usage id to its block type and the final values of its fields.
+    """
+    block_types = {}
+    blocks = {}
+    for kind, local_id, ref in parsed.creations:
+        if kind == "definition":
+            block_types[local_id] = ref
+        else:
+            blocks[local_id] = (block_types[ref], {})
+    for kind, local_id, payload in parsed.writes:
+        values = blocks[local_id][1]
+        if kind == "delete":
+            values.pop(payload, None)
+        else:
+            values.update(payload)
+    return blocks
+
+
+def _parsed_part(parsed, usage_id, blocks):
+    """
+    The part of the `ParsedSubtree` `parsed` below `usage_id`, as a
+    `ParsedSubtree` of its own.  `blocks` is from :func:`_parsed_blocks`.
+    """
+    usage_ids = set()
+    to_visit = [usage_id]
+    while to_visit:
+        visiting = to_visit.pop()
+        usage_ids.add(visiting)
+        to_visit.extend(blocks[visiting][1].get("children") or ())
+
+    def_ids = set(
+        def_id for kind, local_id, def_id in parsed.creations
+        if kind == "usage" and local_id in usage_ids
+    )
+    return ParsedSubtree(
+        usage_id,
+        [creation for creation in parsed.creations if creation[1] in usage_ids or creation[1] in def_ids],
+        [write for write in parsed.writes if write[1] in usage_ids],
+        dict((def_id, digest) for def_id, digest in parsed.digests.iteritems() if def_id in def_ids),
+    )
+
+
+# Placeholders for the deferred children of a block being streamed.
+_STREAM_PLACEHOLDER = u"<!--xblock-child:%d-->"
+_STREAM_PLACEHOLDER_RE = re.compile(r"<!--xblock-child:(\d+)-->")
 
 
 class ObjectAggregator(object):
@@ -615,3 +1557,119 @@ class RegexLexer(object):
         for match in self.regex.finditer(text):
             name = match.lastgroup
             yield (name, match.group(name))
+
+
+class QueryPlan(object):
+    """
+    A compiled querypath: the steps to take through a `query`.
+
+    Each step is the name of a query method and the arguments to call it
+    with, so a plan has nothing to do with any particular block, and can
+    be run from any number of them.
+
+    """
+    def __init__(self, path, steps):
+        self.path = path
+        self.steps = tuple(steps)
+
+    def __repr__(self):
+        return "<QueryPlan %r: %r>" % (self.path, self.steps)
+
+    def run(self, results):
+        """Run the steps of this plan on `results`, the query to start from."""
+        for method_name, args in self.steps:
+            results = getattr(results, method_name)(*args)
+        return results
+
+
+_QUERYPATH_LEXER = RegexLexer(
+    ("dotdot", r"\.\."),
+    ("dot", r"\."),
+    ("slashslash", r"//"),
+    ("slash", r"/"),
+    ("atword", r"@\w+"),
+    ("word", r"\w+"),
+    ("err", r"."),
+)
+
+# The most recently compiled querypaths, least recently used first.
+_QUERYPATH_CACHE = OrderedDict()
+_QUERYPATH_CACHE_SIZE = 256
+_QUERYPATH_CACHE_LOCK = threading.Lock()
+
+
+def compile_querypath(path):
+    """
+    Compile the querypath `path` into a :class:`QueryPlan`.
+
+    The plans of the most recently used paths are cached, so compiling the
+    same path again is cheap.
+
+    Raises :class:`~xblock.exceptions.BadPathError` if `path` isn't a valid
+    querypath.
+
+    """
+    with _QUERYPATH_CACHE_LOCK:
+        plan = _QUERYPATH_CACHE.pop(path, None)
+        if plan is not None:
+            _QUERYPATH_CACHE[path] = plan
+            return plan
+
+    plan = QueryPlan(path, _querypath_steps(path))
+
+    with _QUERYPATH_CACHE_LOCK:
+        _QUERYPATH_CACHE[path] = plan
+        while len(_QUERYPATH_CACHE) > _QUERYPATH_CACHE_SIZE:
+            _QUERYPATH_CACHE.popitem(last=False)
+    return plan
+
+
+def _querypath_steps(path):
+    """Parse `path`, producing the steps of its plan."""
+    ROOT, SEP, WORD, FINAL = range(4)               # pylint: disable=C0103
+    state = ROOT
+    for tokname, toktext in _QUERYPATH_LEXER.lex(path):
+        if state == FINAL:
+            # Shouldn't be any tokens after a last token.
+            raise BadPathError(path)
+        if tokname == "dotdot":
+            # .. (parent)
+            if state == WORD:
+                raise BadPathError(path)
+            yield ("parent", ())
+            state = WORD
+        elif tokname == "dot":
+            # . (current node)
+            if state == WORD:
+                raise BadPathError(path)
+            state = WORD
+        elif tokname == "slashslash":
+            # // (descendants)
+            if state == SEP:
+                raise BadPathError(path)
+            if state == ROOT:
+                raise NotImplementedError()
+            yield ("descendants", ())
+            state = SEP
+        elif tokname == "slash":
+            # / (here)
+            if state == SEP:
+                raise BadPathError(path)
+            if state == ROOT:
+                raise NotImplementedError()
+            state = SEP
+        elif tokname == "atword":
+            # @xxx (attribute access)
+            if state != SEP:
+                raise BadPathError(path)
+            yield ("attr", (toktext[1:],))
+            state = FINAL
+        elif tokname == "word":
+            # xxx (tag selection)
+            if state != SEP:
+                raise BadPathError(path)
+            yield ("children", ())
+            yield ("tagged", (toktext,))
+            state = WORD
+        else:
+            raise BadPathError("Invalid thing: %r" % toktext)
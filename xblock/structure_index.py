@@ -0,0 +1,166 @@
+"""
+An index of the structure of a tree of XBlocks: their parents, children and
+tags, so that queries over the tree can be answered without constructing the
+blocks in it.
+
+:class:`IndexingFieldData` keeps a :class:`StructureIndex` up to date as the
+fields it indexes are written.
+
+This code is in the Runtime layer.
+
+"""
+
+from collections import defaultdict
+
+from xblock.field_data import DelegatingFieldData
+
+
+class StructureIndex(object):
+    """
+    The parent, children and tags of each usage in a tree of blocks.
+
+    A usage is tagged with its `name` field, each tag in its `tags` field,
+    and each of its class's tags (see :func:`~xblock.core.XBlock.tag`).
+
+    Usages the index has never been told about are unknown to it (see
+    :func:`knows`), and callers must find out about them some other way.
+
+    """
+    def __init__(self):
+        self._parents = {}
+        self._children = {}
+        # The tags of each usage, by source: "name", "tags" and "class".
+        self._tags = {}
+        self._usages_by_tag = defaultdict(set)
+
+    def clear(self):
+        """Forget everything."""
+        self._parents.clear()
+        self._children.clear()
+        self._tags.clear()
+        self._usages_by_tag.clear()
+
+    def dump(self):
+        """The contents of the index, as plain dicts and lists (see :func:`load`)."""
+        tags = dict(
+            (usage_id, dict((source, sorted(source_tags)) for source, source_tags in usage_tags.iteritems()))
+            for usage_id, usage_tags in self._tags.iteritems()
+        )
+        return (dict(self._parents), dict(self._children), tags)
+
+    def load(self, dumped):
+        """Add the contents of an index produced by :func:`dump`."""
+        parents, children, tags = dumped
+        self._parents.update(parents)
+        self._children.update(children)
+        for usage_id, usage_tags in tags.iteritems():
+            for source, source_tags in usage_tags.iteritems():
+                self._set_tags(usage_id, source, source_tags)
+
+    def knows(self, usage_id):
+        """Has the index been told about `usage_id`?"""
+        return usage_id in self._tags
+
+    def add_usage(self, usage_id, class_tags=()):
+        """Tell the index about `usage_id`, whose class is tagged `class_tags`."""
+        if usage_id not in self._tags:
+            self._tags[usage_id] = {}
+            self._set_tags(usage_id, "class", class_tags)
+
+    def set_parent(self, usage_id, parent_id):
+        """Record that `parent_id` (or None) is the parent of `usage_id`."""
+        self._parents[usage_id] = parent_id
+
+    def set_children(self, usage_id, child_ids):
+        """Record that `child_ids` are the children of `usage_id`."""
+        self._children[usage_id] = list(child_ids or ())
+
+    def set_name(self, usage_id, name):
+        """Record that `usage_id` is named `name` (or None)."""
+        self._set_tags(usage_id, "name", [name] if name else [])
+
+    def set_tags(self, usage_id, tags):
+        """Record that `usage_id` has the tags in `tags`."""
+        self._set_tags(usage_id, "tags", tags or [])
+
+    def _set_tags(self, usage_id, source, tags):
+        """Replace the tags of `usage_id` that came from `source`."""
+        usage_tags = self._tags.setdefault(usage_id, {})
+        for tag in usage_tags.get(source, ()):
+            self._usages_by_tag[tag].discard(usage_id)
+        usage_tags[source] = frozenset(tags)
+        for tag in usage_tags[source]:
+            self._usages_by_tag[tag].add(usage_id)
+
+    def parent(self, usage_id):
+        """The usage id of the parent of `usage_id`, or None."""
+        return self._parents.get(usage_id)
+
+    def children(self, usage_id):
+        """The usage ids of the children of `usage_id`."""
+        return self._children.get(usage_id, ())
+
+    def descendants(self, usage_id):
+        """Produce the usage ids of all the descendants of `usage_id`, depth first."""
+        stack = list(reversed(self.children(usage_id)))
+        while stack:
+            descendant = stack.pop()
+            yield descendant
+            stack.extend(reversed(self.children(descendant)))
+
+    def tagged(self, tag):
+        """The set of usage ids tagged `tag`."""
+        return self._usages_by_tag.get(tag, frozenset())
+
+    def has_tag(self, usage_id, tag):
+        """Is `usage_id` tagged `tag`?"""
+        return any(tag in tags for tags in self._tags.get(usage_id, {}).itervalues())
+
+
+class IndexingFieldData(DelegatingFieldData):
+    """
+    A FieldData that wraps another FieldData, and records the writes to the
+    fields that describe the structure of the blocks in a :class:`StructureIndex`.
+    """
+    # The fields that are indexed, and the method of StructureIndex that records each.
+    INDEXED_FIELDS = {
+        'parent': StructureIndex.set_parent,
+        'children': StructureIndex.set_children,
+        'name': StructureIndex.set_name,
+        'tags': StructureIndex.set_tags,
+    }
+
+    def __init__(self, source, index):
+        super(IndexingFieldData, self).__init__(source)
+        self.index = index
+
+    def _record(self, block, name, value):
+        """Record `value` as the new value of field `name` of `block`, if it is indexed."""
+        # Allow this method to access the `_class_tags` of the block
+        # pylint: disable=W0212
+        record = self.INDEXED_FIELDS.get(name)
+        if record is not None:
+            usage_id = block.scope_ids.usage_id
+            self.index.add_usage(usage_id, getattr(block, '_class_tags', ()))
+            record(self.index, usage_id, value)
+
+    def set(self, block, name, value):
+        self._source.set(block, name, value)
+        self._record(block, name, value)
+
+    def set_many(self, block, update_dict):
+        self._source.set_many(block, update_dict)
+        for name, value in update_dict.iteritems():
+            self._record(block, name, value)
+
+    def set_many_for_blocks(self, updates):
+        updates = list(updates)
+        self._source.set_many_for_blocks(updates)
+        for block, update_dict in updates:
+            for name, value in update_dict.iteritems():
+                self._record(block, name, value)
+
+    def delete(self, block, name):
+        self._source.delete(block, name)
+        if name in self.INDEXED_FIELDS:
+            self._record(block, name, block.fields[name].default)
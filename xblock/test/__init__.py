@@ -0,0 +1,15 @@
+"""
+Set up the tests' plugins to be found with an entry point index of their own.
+"""
+
+from xblock.test.tools import restore_entry_point_index, use_temp_entry_point_index
+
+
+def setup_package():
+    """Use a temporary entry point index for the tests in this package."""
+    use_temp_entry_point_index()
+
+
+def teardown_package():
+    """Go back to the usual entry point index."""
+    restore_entry_point_index()
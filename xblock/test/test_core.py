@@ -4,6 +4,7 @@ metaclassing, field access, caching, serialization, and bulk saves."""
 # pylint: disable=W0212
 from mock import patch, MagicMock, Mock
 from datetime import datetime
+import json
 
 from xblock.core import XBlock
 from xblock.exceptions import XBlockSaveError, KeyValueMultiSaveError
@@ -11,6 +12,7 @@ from xblock.fields import ChildrenModelMetaclass, Dict, Float, \
     Integer, List, ModelMetaclass, Field, \
     Scope
 from xblock.field_data import FieldData, DictFieldData
+from xblock.plugin import _EntryPointStub
 
 from xblock.test.tools import (
     assert_equals, assert_raises,
@@ -570,8 +572,22 @@ def test_loading_tagged_classes():
 
     the_classes = [('hastag1', HasTag1), ('hastag2', HasTag2), ('hasnttag', HasntTag)]
     tagged_classes = [('hastag1', HasTag1), ('hastag2', HasTag2)]
-    with patch('xblock.core.XBlock.load_classes', return_value=the_classes):
-        assert_equals(set(XBlock.load_tagged_classes('thetag')), set(tagged_classes))
+    the_entry_points = [_EntryPointStub(class_, name) for name, class_ in the_classes]
+    XBlock.clear_plugin_cache()
+    try:
+        with patch('xblock.core.XBlock._all_entry_points', return_value=the_entry_points) as all_entry_points:
+            assert_equals(set(XBlock.load_tagged_classes('thetag')), set(tagged_classes))
+            # The classes are only found once.
+            assert_equals(set(XBlock.load_tagged_classes('thetag')), set(tagged_classes))
+            assert_equals(list(XBlock.load_tagged_classes('othertag')), [])
+        assert_equals(all_entry_points.call_count, 1)
+
+        # Tagging a class finds the classes again.
+        XBlock.tag("othertag")(HasntTag)
+        with patch('xblock.core.XBlock._all_entry_points', return_value=the_entry_points):
+            assert_equals(list(XBlock.load_tagged_classes('othertag')), [('hasnttag', HasntTag)])
+    finally:
+        XBlock.clear_plugin_cache()
 
 
 def setup_save_failure(set_many):
@@ -759,3 +775,22 @@ def test_handle_shortcut():
 
     block.handle('handler_name', request)
     runtime.handle.assert_called_with(block, 'handler_name', request)
+
+
+def test_json_handler():
+    # pylint doesn't see that the handler is wrapped to return a Response.
+    # pylint: disable=E1101
+    class JsonBlock(XBlock):
+        """Toy XBlock with a JSON handler"""
+        @XBlock.json_handler
+        def echo(self, data):
+            """Send back what was sent."""
+            return {'echo': data}
+
+    block = JsonBlock(Mock(), DictFieldData({}), Mock())
+    response = block.echo(Mock(body='{"a": [1, 2]}'))
+    assert_equals(response.content_type, 'application/json')
+    assert_equals(json.loads(response.body), {'echo': {'a': [1, 2]}})
+    # The modules are only imported once.
+    with patch.dict('sys.modules', {'json': None, 'simplejson': None, 'webob': None}):
+        assert_equals(json.loads(block.echo(Mock(body='3')).body), {'echo': 3})
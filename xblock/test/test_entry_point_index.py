@@ -0,0 +1,160 @@
+"""
+Tests of the on-disk index of entry points
+"""
+
+import os
+import shutil
+import tempfile
+
+import pkg_resources
+from mock import patch
+
+from xblock import entry_point_index
+from xblock.entry_point_index import EntryPointIndex, IndexedEntryPoint, distributions_fingerprint
+
+from xblock.test.tools import assert_equals, assert_is, assert_not_equals, assert_true
+
+
+def described(entry_points):
+    """The parts of each of `entry_points` an index records."""
+    return [
+        (entry_point.name, entry_point.module_name, tuple(entry_point.attrs), tuple(entry_point.extras))
+        for entry_point in entry_points
+    ]
+
+
+class IndexFileTest(object):
+    """A test with an index file of its own."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "entry-points.index")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestEntryPointIndex(IndexFileTest):
+    """Tests of finding entry points with an index."""
+
+    def test_same_as_pkg_resources(self):
+        index = EntryPointIndex(self.filename)
+        expected = described(pkg_resources.iter_entry_points("xblock.v1"))
+        assert_true(expected)
+        assert_equals(described(index.iter_entry_points("xblock.v1")), expected)
+        assert_equals(
+            described(index.iter_entry_points("xblock.v1", name="html")),
+            described(pkg_resources.iter_entry_points("xblock.v1", name="html")),
+        )
+        assert_equals(list(index.iter_entry_points("xblock.v1", name="nosuch")), [])
+        assert_equals(list(index.iter_entry_points("no.such.group")), [])
+
+    def test_read_from_file(self):
+        expected = described(EntryPointIndex(self.filename).iter_entry_points("xblock.v1"))
+        assert_true(os.path.exists(self.filename))
+        with patch.object(pkg_resources, "iter_entry_points") as iter_entry_points:
+            assert_equals(described(EntryPointIndex(self.filename).iter_entry_points("xblock.v1")), expected)
+        assert_equals(iter_entry_points.call_count, 0)
+
+    def test_distributions_changed(self):
+        list(EntryPointIndex(self.filename).iter_entry_points("xblock.v1"))
+        with patch.object(entry_point_index, "distributions_fingerprint", return_value="changed"):
+            with patch.object(pkg_resources, "iter_entry_points", return_value=[]) as iter_entry_points:
+                assert_equals(list(EntryPointIndex(self.filename).iter_entry_points("xblock.v1")), [])
+        assert_equals(iter_entry_points.call_count, 1)
+
+    def test_refresh(self):
+        index = EntryPointIndex(self.filename)
+        list(index.iter_entry_points("xblock.v1"))
+        index.refresh()
+        with patch.object(entry_point_index, "distributions_fingerprint", return_value="changed"):
+            with patch.object(pkg_resources, "iter_entry_points", return_value=[]):
+                assert_equals(list(index.iter_entry_points("xblock.v1")), [])
+
+    def test_new_directory(self):
+        filename = os.path.join(self.directory, "cache", "xblock", "entry-points.json")
+        list(EntryPointIndex(filename).iter_entry_points("xblock.v1"))
+        assert_true(os.path.exists(filename))
+        assert_equals(os.stat(os.path.dirname(filename)).st_mode & 0777, 0700)
+
+    def test_unwritable_file(self):
+        # A file is in the way of the directory.
+        open(os.path.join(self.directory, "notadir"), "w").close()
+        index = EntryPointIndex(os.path.join(self.directory, "notadir", "entry-points.json"))
+        assert_equals(
+            described(index.iter_entry_points("xblock.v1")),
+            described(pkg_resources.iter_entry_points("xblock.v1")),
+        )
+
+    def test_untrusted_file(self):
+        list(EntryPointIndex(self.filename).iter_entry_points("xblock.v1"))
+        # An index that others could have written isn't read.
+        os.chmod(self.filename, 0666)
+        with patch.object(pkg_resources, "iter_entry_points", return_value=[]) as iter_entry_points:
+            assert_equals(list(EntryPointIndex(self.filename).iter_entry_points("xblock.v1")), [])
+        assert_equals(iter_entry_points.call_count, 1)
+        # Nor is one belonging to someone else.
+        list(EntryPointIndex(self.filename).iter_entry_points("xblock.v1"))
+        with patch("os.getuid", return_value=os.getuid() + 1):
+            with patch.object(pkg_resources, "iter_entry_points", return_value=[]) as iter_entry_points:
+                assert_equals(list(EntryPointIndex(self.filename).iter_entry_points("xblock.v1")), [])
+        assert_equals(iter_entry_points.call_count, 1)
+
+    def test_default_file(self):
+        with patch.dict(os.environ, {"XBLOCK_ENTRY_POINT_INDEX": self.filename}):
+            assert_equals(entry_point_index._default_index_file(), self.filename)  # pylint: disable=W0212
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": self.directory}):
+            os.environ.pop("XBLOCK_ENTRY_POINT_INDEX", None)
+            assert_equals(
+                entry_point_index._default_index_file(),  # pylint: disable=W0212
+                os.path.join(self.directory, "xblock", "entry-points.json")
+            )
+
+    def test_fingerprint(self):
+        # The times of the directory are reset after each change, to
+        # leave only the changes to its contents.
+        path = [self.directory]
+        os.utime(self.directory, (0, 0))
+        fingerprint = distributions_fingerprint(path)
+        assert_equals(fingerprint, distributions_fingerprint(path))
+        # Files that aren't distribution metadata don't matter.
+        open(os.path.join(self.directory, "notes.txt"), "w").close()
+        os.utime(self.directory, (0, 0))
+        assert_equals(distributions_fingerprint(path), fingerprint)
+        metadata = os.path.join(self.directory, "Thing-1.0.egg-info")
+        os.mkdir(metadata)
+        os.utime(self.directory, (0, 0))
+        installed = distributions_fingerprint(path)
+        assert_not_equals(installed, fingerprint)
+        with open(os.path.join(metadata, "entry_points.txt"), "w") as entry_points:
+            entry_points.write("[xblock.v1]\nthing = thing:Thing\n")
+        os.utime(self.directory, (0, 0))
+        assert_not_equals(distributions_fingerprint(path), installed)
+
+
+def test_load():
+    entry_point = IndexedEntryPoint("index", "xblock.test.test_entry_point_index", ["TestEntryPointIndex", "setUp"])
+    assert_equals(entry_point.load(), TestEntryPointIndex.setUp)
+    assert_is(IndexedEntryPoint("module", "xblock.entry_point_index").load(), entry_point_index)
+
+
+class TestSharedIndexFile(IndexFileTest):
+    """Tests of processes with different distributions sharing an index file."""
+
+    def index(self, fingerprint):
+        """The entry points in xblock.v1 of an index on the distributions `fingerprint`."""
+        with patch.object(entry_point_index, "distributions_fingerprint", return_value=fingerprint):
+            with patch.object(pkg_resources, "iter_entry_points", return_value=[]) as iter_entry_points:
+                list(EntryPointIndex(self.filename).iter_entry_points("xblock.v1"))
+        return iter_entry_points.call_count
+
+    def test_shared_file(self):
+        assert_equals(self.index("one"), 1)
+        assert_equals(self.index("two"), 1)
+        assert_equals(self.index("one"), 0)
+        assert_equals(self.index("two"), 0)
+
+    def test_oldest_forgotten(self):
+        for fingerprint in xrange(entry_point_index.KEPT_FINGERPRINTS + 1):
+            self.index(str(fingerprint))
+        assert_equals(self.index("1"), 0)
+        assert_equals(self.index("0"), 1)
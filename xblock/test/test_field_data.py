@@ -6,8 +6,8 @@ from mock import Mock
 
 from xblock.core import XBlock
 from xblock.exceptions import InvalidScopeError
-from xblock.fields import Scope, String
-from xblock.field_data import SplitFieldData, ReadOnlyFieldData
+from xblock.fields import Scope, ScopeIds, String
+from xblock.field_data import BufferedFieldData, DictFieldData, FieldData, SplitFieldData, ReadOnlyFieldData
 
 from xblock.test.tools import assert_false, assert_raises, assert_equals
 
@@ -52,6 +52,26 @@ class TestSplitFieldData(object):
         self.content.has.assert_called_once_with(self.block, 'content')
         assert_false(self.settings.has.called)
 
+    def test_get_many(self):
+        self.content.get_many.return_value = {'content': 'the content'}
+        self.settings.get_many.return_value = {}
+        values = self.split.get_many(self.block, ['content', 'settings', 'user_state'])
+        assert_equals(values, {'content': 'the content'})
+        self.content.get_many.assert_called_once_with(self.block, ['content'])
+        self.settings.get_many.assert_called_once_with(self.block, ['settings'])
+
+    def test_get_many_for_blocks(self):
+        other = TestingBlock(runtime=Mock(), field_data=self.split, scope_ids=Mock())
+        self.content.get_many_for_blocks.return_value = [{'content': 'the content'}, {}]
+        self.settings.get_many_for_blocks.return_value = [{'settings': 'the settings'}]
+        values = self.split.get_many_for_blocks([
+            (self.block, ['content', 'settings', 'user_state']),
+            (other, ['content']),
+        ])
+        assert_equals(values, [{'content': 'the content', 'settings': 'the settings'}, {}])
+        self.content.get_many_for_blocks.assert_called_once_with([(self.block, ['content']), (other, ['content'])])
+        self.settings.get_many_for_blocks.assert_called_once_with([(self.block, ['settings'])])
+
     def test_set_many(self):
         self.split.set_many(self.block, {'content': 'new content', 'settings': 'new settings'})
         self.content.set_many.assert_called_once_with(self.block, {'content': 'new content'})
@@ -81,6 +101,10 @@ class TestReadOnlyFieldData(object):
         assert_equals(self.source.get.return_value, self.read_only.get(self.block, 'content'))
         self.source.get.assert_called_once_with(self.block, 'content')
 
+    def test_get_many(self):
+        assert_equals(self.source.get_many.return_value, self.read_only.get_many(self.block, ['content']))
+        self.source.get_many.assert_called_once_with(self.block, ['content'])
+
     def test_set(self):
         with assert_raises(InvalidScopeError):
             self.read_only.set(self.block, 'content', 'foo')
@@ -100,3 +124,88 @@ class TestReadOnlyFieldData(object):
     def test_has(self):
         assert_equals(self.source.has.return_value, self.read_only.has(self.block, 'content'))
         self.source.has.assert_called_once_with(self.block, 'content')
+
+
+def test_dict_field_data_get_many():
+    data = {'content': ['a list']}
+    field_data = DictFieldData(data)
+    block = TestingBlock(runtime=Mock(), field_data=field_data, scope_ids=Mock())
+    values = field_data.get_many(block, ['content', 'settings'])
+    assert_equals(values, {'content': ['a list']})
+    # The values are copies
+    values['content'].append('more')
+    assert_equals(data['content'], ['a list'])
+
+
+def test_default_get_many():
+    field_data = FieldData()
+    field_data.get = Mock(side_effect=lambda block, name: {'content': 'the content'}[name])
+    assert_equals(field_data.get_many(Mock(), ['content', 'settings']), {'content': 'the content'})
+    assert_equals(
+        field_data.get_many_for_blocks([(Mock(), ['content']), (Mock(), ['settings'])]),
+        [{'content': 'the content'}, {}]
+    )
+
+
+class TestBufferedFieldData(object):
+    """Tests of BufferedFieldData."""
+    def setUp(self):
+        self.source = Mock()
+        self.buffered = BufferedFieldData(self.source, chunk_size=2)
+        self.blocks = [
+            TestingBlock(runtime=Mock(), field_data=self.buffered, scope_ids=ScopeIds('user', 'testing', 'd', usage_id))
+            for usage_id in ['u1', 'u2', 'u3']
+        ]
+
+    def test_buffered_writes(self):
+        first, second, third = self.blocks
+        self.buffered.set(first, 'content', 'c1')
+        self.buffered.set_many(first, {'settings': 's1'})
+        assert_false(self.source.set_many_for_blocks.called)
+
+        # A second block fills the buffer, which is written at once.
+        self.buffered.set(second, 'content', 'c2')
+        self.source.set_many_for_blocks.assert_called_once_with([
+            (first, {'content': 'c1', 'settings': 's1'}),
+            (second, {'content': 'c2'}),
+        ])
+
+        self.buffered.set(third, 'content', 'c3')
+        self.buffered.close()
+        self.source.set_many_for_blocks.assert_called_with([(third, {'content': 'c3'})])
+
+        # Once closed, writes go straight through.
+        self.buffered.set(third, 'content', 'c4')
+        self.source.set_many.assert_called_with(third, {'content': 'c4'})
+
+    def test_reads_flush(self):
+        first, second, _ = self.blocks
+        self.buffered.set(first, 'user_state', 'u1')
+
+        # Reading the fields of other blocks' usages needs nothing written...
+        self.buffered.get(second, 'user_state')
+        self.buffered.has(second, 'content')
+        assert_false(self.source.set_many_for_blocks.called)
+
+        # ...but reading a block with buffered values writes them first.
+        self.buffered.get_many(first, ['content'])
+        self.source.set_many_for_blocks.assert_called_once_with([(first, {'user_state': 'u1'})])
+        self.source.get_many.assert_called_once_with(first, ['content'])
+
+    def test_shared_reads_flush(self):
+        first, second, _ = self.blocks
+        # The blocks share a definition, and so their content.
+        self.buffered.set(first, 'content', 'c1')
+        self.buffered.get_many_for_blocks([(second, ['user_state'])])
+        assert_false(self.source.set_many_for_blocks.called)
+
+        self.buffered.has(second, 'content')
+        self.source.set_many_for_blocks.assert_called_once_with([(first, {'content': 'c1'})])
+
+
+def test_set_many_for_blocks():
+    field_data = DictFieldData({})
+    field_data.set_many = Mock()
+    field_data.set_many_for_blocks([('block1', {'a': 1}), ('block2', {'b': 2})])
+    assert_equals(field_data.set_many.call_count, 2)
+    field_data.set_many.assert_called_with('block2', {'b': 2})
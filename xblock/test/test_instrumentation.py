@@ -0,0 +1,244 @@
+"""Tests of the instrumentation of runtimes"""
+
+import shutil
+import tempfile
+
+from mock import Mock, patch
+
+from xblock.core import XBlock
+from xblock.field_data import DictFieldData
+from xblock.fields import Integer, Scope, ScopeIds
+from xblock.fragment import Fragment
+from xblock.instrumentation import (
+    Instrumentation, InstrumentedFieldData, MultiInstrumentation, StatsCollector, Tracer
+)
+
+from xblock.test.tools import assert_equals, assert_in, assert_raises, assert_true
+
+
+def make_block(block_type):
+    """A stand-in block of type `block_type`."""
+    return Mock(scope_ids=ScopeIds('user', block_type, 'def', 'usage'))
+
+
+def test_stats_collector():
+    stats = StatsCollector()
+    problem = make_block('problem')
+    html = make_block('html')
+
+    for _ in range(2):
+        token = stats.begin('render', problem, 'student_view')
+        stats.end(stats.begin('get', problem, 'attempts'))
+        stats.end(stats.begin('get_many', problem, ['attempts', 'score']))
+        stats.end(stats.begin('set', problem, 'attempts'))
+        stats.end(stats.begin('render_child', html, 'student_view'), Fragment(u"<p>hi</p>"))
+        stats.end(token, Fragment(u"hello"))
+
+    rows = dict(((row['block_type'], row['event'], row['name']), row) for row in stats.dump())
+    render = rows['problem', 'render', 'student_view']
+    assert_equals(render['count'], 2)
+    assert_equals(render['reads'], 4)
+    assert_equals(render['writes'], 2)
+    assert_equals(render['bytes'], 10)
+    assert_true(render['time'] >= 0)
+    assert_equals(rows['html', 'render_child', 'student_view']['bytes'], 18)
+    assert_equals(rows['problem', 'get', 'attempts']['count'], 2)
+    assert_true(('problem', 'get_many', None) in rows)
+
+    # The slowest work comes first.
+    times = [row['time'] for row in stats.dump()]
+    assert_equals(times, sorted(times, reverse=True))
+
+    stats.reset()
+    assert_equals(stats.dump(), [])
+
+
+def test_stats_collector_get_block():
+    stats = StatsCollector()
+    problem = make_block('problem')
+    html = Mock(spec=['scope_ids'], scope_ids=ScopeIds('user', 'html', 'def', 'usage'))
+
+    token = stats.begin('render', problem, 'student_view')
+    stats.end(stats.begin('get_block', None, 'child_1'), html)
+    stats.end(stats.begin('get_block', None, 'child_2'), html)
+    stats.end(stats.begin('get_block', None, 'missing'))
+    stats.end(token)
+
+    rows = dict(((row['block_type'], row['event'], row['name']), row) for row in stats.dump())
+    assert_equals(rows['html', 'get_block', None]['count'], 2)
+    # A block that wasn't got has no type.
+    assert_equals(rows[None, 'get_block', None]['count'], 1)
+    assert_equals(rows['problem', 'render', 'student_view']['reads'], 0)
+
+
+def test_stats_collector_sampling():
+    stats = StatsCollector(sample_rate=0.5)
+    block = make_block('problem')
+
+    def render():
+        """Render with one nested field read."""
+        token = stats.begin('render', block, 'student_view')
+        stats.end(stats.begin('get', block, 'attempts'))
+        stats.end(token)
+
+    with patch('random.random', return_value=0.7):
+        render()
+    assert_equals(stats.dump(), [])
+
+    with patch('random.random', return_value=0.2):
+        render()
+    assert_equals(
+        sorted((row['event'], row['count'], row['reads']) for row in stats.dump()),
+        [('get', 1, 0), ('render', 1, 1)]
+    )
+
+
+def test_instrumented_field_data():
+    instrumentation = Mock(spec=Instrumentation)
+    source = DictFieldData({'field': 'value'})
+    field_data = InstrumentedFieldData(source, instrumentation)
+    block = make_block('problem')
+
+    assert_equals(field_data.get(block, 'field'), 'value')
+    instrumentation.begin.assert_called_once_with('get', block, 'field')
+    instrumentation.end.assert_called_once_with(instrumentation.begin.return_value)
+
+    field_data.set_many(block, {'field': 'new', 'other': 1})
+    assert_equals(field_data.get_many(block, ['field', 'other']), {'field': 'new', 'other': 1})
+    field_data.delete(block, 'other')
+    assert_equals(field_data.has(block, 'other'), False)
+    assert_equals(
+        [call[0][0] for call in instrumentation.begin.call_args_list],
+        ['get', 'set_many', 'get_many', 'delete', 'has']
+    )
+
+    # The work is ended even when it fails.
+    with assert_raises(KeyError):
+        field_data.get(block, 'other')
+    assert_equals(instrumentation.begin.call_count, instrumentation.end.call_count)
+
+
+def test_multi_instrumentation():
+    first, second = Mock(spec=Instrumentation), Mock(spec=Instrumentation)
+    multi = MultiInstrumentation(first, second)
+    block = make_block('problem')
+
+    token = multi.begin('render', block, 'student_view')
+    first.begin.assert_called_once_with('render', block, 'student_view')
+    second.begin.assert_called_once_with('render', block, 'student_view')
+
+    multi.end(token, 'result')
+    first.end.assert_called_once_with(first.begin.return_value, 'result')
+    second.end.assert_called_once_with(second.begin.return_value, 'result')
+
+
+class TracedBlock(XBlock):
+    """A block with a field in each of two scopes."""
+    score = Integer(scope=Scope.user_state, default=0)
+    weight = Integer(scope=Scope.settings, default=1)
+
+
+class TestTracer(object):
+    """Tests of Tracer."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tracer = Tracer(self.directory, threshold=0, max_traces=3)
+        field_data = InstrumentedFieldData(DictFieldData({'score': 5}), self.tracer)
+        self.block = TracedBlock(Mock(), field_data, ScopeIds('fred', 'traced', 'def', 'usage'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def render(self):
+        """Trace a render of `self.block` that reads its fields."""
+        token = self.tracer.begin('render', self.block, 'student_view')
+        save = self.tracer.begin('save', self.block, None)
+        self.block.score = self.block.score + self.block.weight
+        self.block.save()
+        self.tracer.end(save)
+        self.tracer.end(token)
+
+    def test_trace(self):
+        self.render()
+
+        trace_ids = self.tracer.trace_ids()
+        assert_equals(len(trace_ids), 1)
+        trace = self.tracer.load(trace_ids[0])
+        assert_equals(trace['id'], trace_ids[0])
+        root = trace['root']
+        assert_equals(
+            (root['event'], root['block_type'], root['usage_id'], root['name']),
+            ('render', 'traced', 'usage', 'student_view')
+        )
+        assert_equals(len(root['children']), 1)
+        save = root['children'][0]
+        assert_equals(save['event'], 'save')
+        assert_true(0 <= save['start'] <= root['start'] + root['duration'])
+
+        # The field accesses, with the keys they read and wrote.
+        ops = [(access['op'], access['keys']) for access in save['fields']]
+        assert_in(('get', [['user_state', 'usage', 'fred', 'score']]), ops)
+        assert_in(('has', [['settings', 'usage', None, 'weight']]), ops)
+        assert_in(('set_many', [['user_state', 'usage', 'fred', 'score']]), ops)
+
+        # Reading the score again comes from the block's cache.
+        token = self.tracer.begin('render', self.block, 'student_view')
+        assert_equals(self.block.score, 6)
+        self.tracer.end(token)
+        assert_equals(self.tracer.load(self.tracer.trace_ids()[0])['root']['cache_hits'], 1)
+
+    def test_cache_restored(self):
+        # pylint: disable=W0212
+        cache = self.block._field_data_cache
+        self.render()
+        # Once the trace ends, the block has its own cache back, with the values cached during it.
+        assert_true(self.block._field_data_cache is cache)
+        assert_equals(cache['score'], 6)
+
+        # Reads after the trace aren't counted.
+        with patch.object(self.tracer, 'cache_hit') as cache_hit:
+            assert_equals(self.block.score, 6)
+        assert_equals(cache_hit.call_count, 0)
+
+    def test_get_block(self):
+        token = self.tracer.begin('render', self.block, 'student_view')
+        get_block = self.tracer.begin('get_block', None, 'child')
+        # Fields read while getting the block go in the span.
+        self.tracer.end(self.tracer.begin('get', self.block, 'score'))
+        self.tracer.end(get_block, self.block)
+        self.tracer.end(token)
+
+        root = self.tracer.load(self.tracer.trace_ids()[0])['root']
+        assert_equals(
+            [(access['op'], access['keys']) for access in root['fields']],
+            [('get_block', [[None, 'child', None, None]]), ('get', [['user_state', 'usage', 'fred', 'score']])]
+        )
+        assert_equals(root['children'], [])
+
+        # Getting a block outside of a traced request isn't traced.
+        assert_equals(self.tracer.begin('get_block', None, 'child'), None)
+
+    def test_threshold(self):
+        self.tracer.threshold = 60
+        self.render()
+        assert_equals(self.tracer.trace_ids(), [])
+
+    def test_ring(self):
+        saved = [self.tracer.save({'time': start, 'duration': 0, 'root': None}) for start in range(5)]
+        assert_equals(self.tracer.trace_ids(), saved[:1:-1])
+        with assert_raises(KeyError):
+            self.tracer.load(saved[0])
+        with assert_raises(KeyError):
+            self.tracer.load("../%s" % saved[4])
+
+        # A tracer in another process, on the same directory, doesn't reuse the ids.
+        with patch("os.getpid", return_value=0):
+            tracer = Tracer(self.directory, threshold=0, max_traces=3)
+            trace_id = tracer.save({'time': 4, 'duration': 0, 'root': None})
+        assert_equals(tracer.trace_ids(), [saved[4], trace_id, saved[3]])
+
+    def test_unsaved_trace(self):
+        self.tracer.directory = self.directory + "/nosuchdir"
+        with patch("os.makedirs", side_effect=OSError):
+            self.render()
+        assert_equals(self.tracer.trace_ids(), [])
@@ -0,0 +1,138 @@
+"""
+Tests of publishing field data to memory-mapped files
+"""
+
+import os
+import shutil
+import tempfile
+
+from mock import Mock, patch
+
+from xblock.core import XBlock
+from xblock.exceptions import InvalidScopeError
+from xblock.fields import Dict, Scope, ScopeIds, String
+from xblock.field_data import DictFieldData, SplitFieldData
+from xblock import mapped_field_data
+from xblock.mapped_field_data import MappedFieldData, publish
+
+from xblock.test.tools import assert_equals, assert_false, assert_raises
+
+
+class PublishedBlock(XBlock):
+    """A block with fields of several scopes."""
+    content = String(scope=Scope.content)
+    settings = Dict(scope=Scope.settings)
+    user_state = String(scope=Scope.user_state)
+
+
+def make_block(usage_id, def_id, field_data):
+    """A PublishedBlock identified by `usage_id` and `def_id`, storing its fields in `field_data`."""
+    return PublishedBlock(
+        runtime=Mock(),
+        field_data=field_data,
+        scope_ids=ScopeIds('user', 'published', def_id, usage_id),
+    )
+
+
+class TestMappedFieldData(object):
+    """Tests of publishing a tree of blocks to a file, and mapping it back."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "course.published")
+        self.blocks = [
+            make_block("u1", "d1", DictFieldData({'content': u'\u1d7e caf\xe9', 'settings': {'due': 3}})),
+            make_block("u2", "d1", DictFieldData({'content': u'\u1d7e caf\xe9', 'user_state': 'mine'})),
+            make_block("u3", "d2", DictFieldData({})),
+        ]
+        publish(self.blocks, self.filename)
+        self.published = MappedFieldData(self.filename)
+
+    def tearDown(self):
+        self.published.close()
+        shutil.rmtree(self.directory)
+
+    def reader(self, usage_id, def_id):
+        """A block reading from the published file."""
+        return make_block(usage_id, def_id, self.published)
+
+    def test_get(self):
+        block = self.reader("u1", "d1")
+        assert_equals(self.published.get(block, 'content'), u'\u1d7e caf\xe9')
+        assert_equals(self.published.get(block, 'settings'), {'due': 3})
+        assert_equals(block.settings, {'due': 3})
+        # Another usage of the same definition.
+        assert_equals(self.reader("u2", "d1").content, u'\u1d7e caf\xe9')
+
+    def test_missing(self):
+        block = self.reader("u3", "d2")
+        assert_false(self.published.has(block, 'content'))
+        with assert_raises(KeyError):
+            self.published.get(block, 'content')
+        assert_equals(block.settings, {})
+        assert_false(self.published.has(self.reader("nothing", "nothing"), 'settings'))
+
+    def test_get_many(self):
+        assert_equals(
+            self.published.get_many(self.reader("u2", "d1"), ['content', 'settings']),
+            {'content': u'\u1d7e caf\xe9'}
+        )
+
+    def test_read_only(self):
+        block = self.reader("u1", "d1")
+        with assert_raises(InvalidScopeError):
+            self.published.set(block, 'content', 'new')
+        with assert_raises(InvalidScopeError):
+            self.published.set_many(block, {'content': 'new'})
+        with assert_raises(InvalidScopeError):
+            self.published.delete(block, 'content')
+        # User state isn't published.
+        with assert_raises(InvalidScopeError):
+            self.published.get(block, 'user_state')
+
+    def test_hash_collisions(self):
+        # With every key hashed the same, values are still found by key.
+        with patch.object(mapped_field_data, '_hash', return_value=7):
+            publish(self.blocks, self.filename)
+            published = MappedFieldData(self.filename)
+            assert_equals(published.get(self.reader("u1", "d1"), 'settings'), {'due': 3})
+            assert_false(published.has(self.reader("u3", "d2"), 'settings'))
+            published.close()
+
+    def test_republishing(self):
+        self.blocks[2].content = "Changed"
+        self.blocks[2].save()
+        publish(self.blocks, self.filename)
+        # The old mapping reads the old file; a new one reads the new file.
+        assert_equals(self.reader("u3", "d2").content, None)
+        published = MappedFieldData(self.filename)
+        assert_equals(make_block("u3", "d2", published).content, "Changed")
+        published.close()
+
+    def test_file_mode(self):
+        # The published file gets the usual mode for new files, not mkstemp's 0600.
+        umask = os.umask(0022)
+        try:
+            publish(self.blocks, self.filename)
+        finally:
+            os.umask(umask)
+        assert_equals(os.stat(self.filename).st_mode & 0777, 0644)
+
+    def test_not_published(self):
+        with open(self.filename, "wb") as not_published:
+            not_published.write("Not published field data.")
+        with assert_raises(ValueError):
+            MappedFieldData(self.filename)
+
+    def test_split(self):
+        user_state = DictFieldData({'user_state': 'mine'})
+        split = SplitFieldData({
+            Scope.content: self.published,
+            Scope.settings: self.published,
+            Scope.user_state: user_state,
+        })
+        block = make_block("u1", "d1", split)
+        assert_equals(block.content, u'\u1d7e caf\xe9')
+        assert_equals(block.user_state, 'mine')
+        block.user_state = 'changed'
+        block.save()
+        assert_equals(user_state.get(block, "user_state"), "changed")
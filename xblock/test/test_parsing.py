@@ -4,12 +4,18 @@
 import re
 import StringIO
 import textwrap
+import threading
 import unittest
 
+from lxml import etree
+from mock import patch
+
 from xblock.core import XBlock
+from xblock.field_data import BufferedFieldData
 from xblock.fields import Scope, String, Integer
+from xblock.runtime import DbModel, UsageStore
 from xblock.test.tools import blocks_are_equivalent
-from workbench.runtime import WorkbenchRuntime
+from workbench.runtime import MemoryUsageStore, WorkbenchKeyValueStore, WorkbenchRuntime
 
 # XBlock classes to use in the tests.
 
@@ -40,6 +46,11 @@ class Specialized(XBlock):
 # Helpers
 
 
+def canonical(xml):
+    """The canonical form of the XML document `xml`."""
+    return etree.tostring(etree.fromstring(xml), method="c14n")
+
+
 class XmlTest(object):
     """Helpful things for XML tests."""
 
@@ -54,9 +65,18 @@ class XmlTest(object):
         return block
 
     def export_xml_for_block(self, block):
-        """A helper to return the XML string for a block."""
+        """
+        A helper to return the XML string for a block.
+
+        The XML is exported both all at once and as a stream, which must agree.
+        """
+        # XmlTest is mixed into TestCases.
+        # pylint: disable=E1101
         output = StringIO.StringIO()
         self.runtime.export_to_xml(block, output)
+        streamed = StringIO.StringIO()
+        self.runtime.export_to_xml_stream(block, streamed)
+        self.assertEqual(canonical(streamed.getvalue()), canonical(output.getvalue()))
         return output.getvalue()
 
 
@@ -160,6 +180,28 @@ class ExportTest(XmlTest, unittest.TestCase):
         # you an equivalent block.
         self.assertTrue(blocks_are_equivalent(block, block_imported))
 
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_export_stream(self):
+        block = self.parse_xml_to_block(textwrap.dedent("""\
+            <container>
+                <html><p>Some <b>HTML</b></p> text</html>
+                <container><leaf data1='child'/><html>More</html></container>
+                <leaf>Some text content.</leaf>
+            </container>
+            """))
+        xml = self.export_xml_for_block(block)
+        self.assertIn("<leaf data1=\"child\"/><html>More</html>", xml)
+
+        # Each level's fields are read at once.
+        block = self.runtime.get_block(block.scope_ids.usage_id)
+        with patch.object(self.runtime, 'prefetch_fields') as prefetch_fields:
+            self.runtime.export_to_xml_stream(block, StringIO.StringIO())
+        self.assertEqual(
+            [[child.scope_ids.block_type for child in call[0][0]] for call in prefetch_fields.call_args_list],
+            [["html", "container", "leaf"], ["leaf", "html"]]
+        )
+
 
 def squish(text):
     """Turn any run of whitespace into one space."""
@@ -208,3 +250,446 @@ class HtmlInOutTest(XmlTest, unittest.TestCase):
         for test in tests:
             block = self.parse_xml_to_block(test)
             self.assertIsInstance(block.content, unicode)
+
+
+class SiblingCounter(XBlock):
+    """Records how many elements are left in its parent when it is parsed."""
+    siblings = Integer(default=0, scope=Scope.content)
+
+    @classmethod
+    def parse_xml(cls, node, runtime, keys):
+        block = runtime.construct_xblock_from_class(cls, keys)
+        block.siblings = len(node.getparent())
+        return block
+
+
+class FixedUsageStore(MemoryUsageStore):
+    """A usage store that can't point a usage at another definition."""
+    set_definition_id = UsageStore.set_definition_id.__func__
+
+
+def isolated_runtime(kvs=None):
+    """A runtime with its own usage store and key-value store."""
+    runtime = WorkbenchRuntime()
+    runtime.usage_store = MemoryUsageStore()
+    runtime.field_data = DbModel(kvs or WorkbenchKeyValueStore({}))
+    return runtime
+
+
+class StreamParsingTest(unittest.TestCase):
+    """Tests of parsing XML a piece at a time."""
+
+    def assert_parses_the_same(self, xml):
+        """Parse `xml` all at once and a piece at a time, and check the results are the same."""
+        whole, streamed = isolated_runtime(), isolated_runtime()
+        whole_id = whole.parse_xml_string(xml)
+        streamed_id = streamed.parse_xml_stream(StringIO.StringIO(xml))
+
+        self.assertEqual(streamed_id, whole_id)
+        # Allow this method to access the stores' private members
+        # pylint: disable=W0212
+        self.assertEqual(streamed.usage_store._usages, whole.usage_store._usages)
+        self.assertEqual(streamed.usage_store._definitions, whole.usage_store._definitions)
+        self.assertEqual(streamed.field_data._kvs.db_dict, whole.field_data._kvs.db_dict)
+        self.assertEqual(streamed.deduplicated_bytes, whole.deduplicated_bytes)
+        return streamed.get_block(streamed_id)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    @XBlock.register_temp_plugin(Specialized)
+    def test_stream_parsing(self):
+        block = self.assert_parses_the_same(textwrap.dedent("""\
+            <container>
+                <leaf data1='child1' data2='I&#39;m also child1' />
+                <container>
+                    <leaf data1='grandchild'>Some text content.</leaf>
+                    <specialized><leaf/><leaf/><container><leaf/></container></specialized>
+                </container>
+                <html><p>Hello <b>there</b>.</p></html>
+                <leaf/>
+            </container>
+            """))
+
+        self.assertEqual(len(block.children), 4)
+        middle = block.runtime.get_block(block.children[1])
+        self.assertEqual(middle.parent, block.scope_ids.usage_id)
+        specialized = block.runtime.get_block(middle.children[1])
+        self.assertEqual(specialized.num_children, 3)
+
+    @XBlock.register_temp_plugin(Container)
+    @XBlock.register_temp_plugin(SiblingCounter)
+    def test_stream_parsing_frees_elements(self):
+        runtime = isolated_runtime()
+        usage_id = runtime.parse_xml_stream(StringIO.StringIO(
+            "<container><siblingcounter/><siblingcounter/><siblingcounter/></container>"
+        ))
+        block = runtime.get_block(usage_id)
+        # Each element is let go once its block is built, so by the time the
+        # last one is parsed, the others are gone.
+        last = block.runtime.get_block(block.children[-1])
+        self.assertEqual(last.siblings, 1)
+
+
+class CountingKeyValueStore(WorkbenchKeyValueStore):
+    """Counts the bulk writes made to it."""
+    def __init__(self):
+        super(CountingKeyValueStore, self).__init__({})
+        self.set_many_sizes = []
+
+    def set_many(self, update_dict):
+        self.set_many_sizes.append(len(update_dict))
+        super(CountingKeyValueStore, self).set_many(update_dict)
+
+
+class ImportSessionTest(unittest.TestCase):
+    """Tests of buffering the writes made while importing."""
+
+    XML = "<container>%s</container>" % ("<container><leaf data1='x'/><leaf/></container>" * 5)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_writes_are_batched(self):
+        for parse in ['parse_xml_string', 'parse_xml_stream']:
+            kvs = CountingKeyValueStore()
+            runtime = isolated_runtime(kvs)
+            runtime.import_chunk_size = 4
+            xml = self.XML if parse == 'parse_xml_string' else StringIO.StringIO(self.XML)
+            block = runtime.get_block(getattr(runtime, parse)(xml))
+
+            # 16 blocks, written 4 at a time.
+            self.assertEqual(len(kvs.set_many_sizes), 4)
+            self.assertEqual(sum(kvs.set_many_sizes), len(kvs.db_dict))
+            self.assertEqual(len(block.children), 5)
+            leaf = runtime.get_block(runtime.get_block(block.children[4]).children[0])
+            self.assertEqual(leaf.data1, 'x')
+            # The session is over.
+            self.assertIsInstance(runtime.field_data, DbModel)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_session_reads_its_writes(self):
+        runtime = isolated_runtime()
+        with runtime.import_session():
+            usage_id = runtime.parse_xml_string("<container><leaf data1='y'/></container>")
+            block = runtime.get_block(usage_id)
+            leaf = runtime.get_block(block.children[0])
+            self.assertEqual(leaf.data1, 'y')
+        self.assertEqual(runtime.get_block(block.children[0]).data1, 'y')
+
+        # Blocks from the session write straight through afterwards.
+        leaf.data1 = 'z'
+        leaf.save()
+        self.assertEqual(runtime.get_block(block.children[0]).data1, 'z')
+
+    def test_session_is_per_thread(self):
+        runtime = isolated_runtime()
+        field_data = []
+        with runtime.import_session():
+            self.assertIsInstance(runtime.field_data, BufferedFieldData)
+            thread = threading.Thread(target=lambda: field_data.append(runtime.field_data))
+            thread.start()
+            thread.join()
+        # The other thread used the runtime's FieldData, unbuffered.
+        self.assertIsInstance(field_data[0], DbModel)
+
+
+class ParallelParsingTest(unittest.TestCase):
+    """Tests of parsing XML with worker processes."""
+
+    XML = textwrap.dedent("""\
+        <container>
+            <leaf data1='first'/>
+            <container>
+                <leaf data1='grandchild'>Some text content.</leaf>
+                <specialized><leaf/><container><leaf/></container></specialized>
+                <html><p>Hello <b>there</b>.</p></html>
+                <leaf data1='grandchild'>Some text content.</leaf>
+            </container>
+            <specialized><container><leaf/></container></specialized>
+            <container><container><leaf data2='deep'/></container><leaf/></container>
+            <leaf/>
+        </container>
+        """)
+
+    def assert_parses_the_same(self, processes):
+        """Parse `XML` serially and in parallel, and check the results are the same."""
+        serial, parallel = isolated_runtime(), isolated_runtime()
+        serial_id = serial.parse_xml_string(self.XML)
+        parallel_id = parallel.parse_xml_parallel(
+            StringIO.StringIO(self.XML), split_tags=["container"], processes=processes
+        )
+
+        self.assertEqual(parallel_id, serial_id)
+        # Allow this method to access the stores' private members
+        # pylint: disable=W0212
+        self.assertEqual(parallel.usage_store._usages, serial.usage_store._usages)
+        self.assertEqual(parallel.usage_store._definitions, serial.usage_store._definitions)
+        self.assertEqual(parallel.field_data._kvs.db_dict, serial.field_data._kvs.db_dict)
+        self.assertEqual(parallel.deduplicated_bytes, serial.deduplicated_bytes)
+        self.assertEqual(parallel._parsed_subtrees, {})
+        return parallel.get_block(parallel_id)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    @XBlock.register_temp_plugin(Specialized)
+    def test_parallel_parsing(self):
+        block = self.assert_parses_the_same(processes=2)
+        # The grandchildren share a definition within a subtree, and the last
+        # <leaf/> shares one with the <leaf/> in the subtree before it.
+        self.assertEqual(
+            block.runtime.deduplicated_bytes,
+            len('<leaf data1="grandchild">Some text content.</leaf>') + len("<leaf></leaf>")
+        )
+        self.assertEqual(len(block.children), 5)
+        middle = block.runtime.get_block(block.children[1])
+        self.assertEqual(middle.parent, block.scope_ids.usage_id)
+        self.assertEqual(block.runtime.get_block(middle.children[0]).data1, 'grandchild')
+        self.assertEqual(block.runtime.get_block(middle.children[1]).num_children, 2)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    @XBlock.register_temp_plugin(Specialized)
+    def test_parallel_parsing_in_process(self):
+        self.assert_parses_the_same(processes=1)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    @XBlock.register_temp_plugin(Specialized)
+    def test_split_subtrees(self):
+        runtime = isolated_runtime()
+        root = etree.fromstring(self.XML)
+        # Allow this test to call the splitting directly
+        # pylint: disable=W0212
+        subtrees = runtime._split_subtrees(root, frozenset(["container"]))
+        # Not the root, nor anything inside a split, nor inside a specialized block.
+        self.assertEqual(subtrees, [root[1], root[3]])
+
+
+class DeduplicationTest(unittest.TestCase):
+    """Tests of sharing definitions between identical XML."""
+
+    XML = textwrap.dedent("""\
+        <container>
+            <leaf data1="shared">Some text.</leaf>
+            <container><leaf data1='shared'>Some text.</leaf></container>
+            <container><leaf data1='shared'>Some text.</leaf></container>
+            <leaf data1="shared">Other text.</leaf>
+        </container>
+        """)
+
+    def leaves(self, runtime, usage_id):
+        """The four leaves of `XML`, parsed with `runtime` as `usage_id`."""
+        block = runtime.get_block(usage_id)
+        children = [runtime.get_block(child_id) for child_id in block.children]
+        return [
+            children[0],
+            runtime.get_block(children[1].children[0]),
+            runtime.get_block(children[2].children[0]),
+            children[3],
+        ]
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_identical_leaves_share_definitions(self):
+        for parse in ['parse_xml_string', 'parse_xml_stream']:
+            runtime = isolated_runtime()
+            xml = self.XML if parse == 'parse_xml_string' else StringIO.StringIO(self.XML)
+            leaves = self.leaves(runtime, getattr(runtime, parse)(xml))
+
+            def_ids = [leaf.scope_ids.def_id for leaf in leaves]
+            self.assertEqual(def_ids[0], def_ids[1])
+            self.assertEqual(def_ids[0], def_ids[2])
+            self.assertNotEqual(def_ids[0], def_ids[3])
+            self.assertEqual(len(set(leaf.scope_ids.usage_id for leaf in leaves)), 4)
+            self.assertEqual([leaf.content for leaf in leaves], ["Some text."] * 3 + ["Other text."])
+            # The two copies: attribute quoting doesn't matter.
+            size = len('<leaf data1="shared">Some text.</leaf>')
+            self.assertEqual(runtime.deduplicated_bytes, 2 * size)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_containers_are_not_shared(self):
+        runtime = isolated_runtime()
+        block = runtime.get_block(runtime.parse_xml_string(self.XML))
+        first, second = [runtime.get_block(child_id) for child_id in block.children[1:3]]
+        self.assertNotEqual(first.scope_ids.def_id, second.scope_ids.def_id)
+        self.assertNotEqual(first.children, second.children)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_deduplication_can_be_turned_off(self):
+        runtime = isolated_runtime()
+        runtime.deduplicate_definitions = False
+        leaves = self.leaves(runtime, runtime.parse_xml_string(self.XML))
+        self.assertEqual(len(set(leaf.scope_ids.def_id for leaf in leaves)), 4)
+        self.assertEqual(runtime.deduplicated_bytes, 0)
+
+
+class ReimportTest(unittest.TestCase):
+    """Tests of re-importing XML over existing blocks."""
+
+    XML = textwrap.dedent("""\
+        <container>
+            <leaf name="a" data1="x">A</leaf>
+            <container><leaf>B</leaf><leaf>C</leaf></container>
+            <leaf name="gone"/>
+        </container>
+        """)
+
+    EDITED_XML = textwrap.dedent("""\
+        <container>
+            <leaf name="a" data1="y">A</leaf>
+            <container><leaf>B</leaf><leaf>C, edited</leaf><leaf>D</leaf></container>
+        </container>
+        """)
+
+    def setUp(self):
+        super(ReimportTest, self).setUp()
+        self.kvs = CountingKeyValueStore()
+        self.runtime = isolated_runtime(self.kvs)
+
+    def tree(self, usage_id):
+        """The usage ids of the blocks parsed from `XML` as `usage_id`."""
+        root = self.runtime.get_block(usage_id)
+        inner = self.runtime.get_block(root.children[1])
+        return [usage_id] + root.children + inner.children
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_reimport_unchanged(self):
+        usage_id = self.runtime.parse_xml_string(self.XML)
+        tree = self.tree(usage_id)
+        writes = len(self.kvs.set_many_sizes)
+        # Allow this test to access the usage store's private members
+        # pylint: disable=W0212
+        usages = dict(self.runtime.usage_store._usages)
+
+        self.assertEqual(self.runtime.reimport_xml_string(self.XML, usage_id), usage_id)
+        self.assertEqual(self.tree(usage_id), tree)
+        self.assertEqual(len(self.kvs.set_many_sizes), writes)
+        self.assertEqual(self.runtime.usage_store._usages, usages)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_reimport_edited(self):
+        usage_id = self.runtime.parse_xml_string(self.XML)
+        root_id, a_id, inner_id, _gone_id, b_id, c_id = self.tree(usage_id)
+        # A student's state for "a".
+        student = WorkbenchRuntime("bob")
+        student.usage_store, student.field_data = self.runtime.usage_store, self.runtime.field_data
+        for leaf_id in (a_id, c_id):
+            leaf = student.get_block(leaf_id)
+            leaf.data2 = "bob's"
+            leaf.save()
+        c_def_id = self.runtime.get_block(c_id).scope_ids.def_id
+
+        self.assertEqual(self.runtime.reimport_xml_string(self.EDITED_XML, usage_id), usage_id)
+        root = self.runtime.get_block(root_id)
+        self.assertEqual(root.children, [a_id, inner_id])
+        inner = self.runtime.get_block(inner_id)
+        self.assertEqual(inner.children[:2], [b_id, c_id])
+        contents = [self.runtime.get_block(child_id).content for child_id in inner.children]
+        self.assertEqual(contents, ["B", "C, edited", "D"])
+        self.assertEqual(self.runtime.get_block(inner.children[2]).parent, inner_id)
+        # "C" may share its definition with any other "C", so its new
+        # content is a new definition, of the same usage.
+        self.assertNotEqual(self.runtime.get_block(c_id).scope_ids.def_id, c_def_id)
+
+        self.assertEqual(self.runtime.get_block(a_id).data1, "y")
+        self.assertEqual(student.get_block(a_id).data2, "bob's")
+        self.assertEqual(student.get_block(c_id).data2, "bob's")
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_reimport_shared_definition(self):
+        # Two copies, imported together, share the definitions of their leaves.
+        xml = "<container>%s%s</container>" % (self.XML, self.XML)
+        root = self.runtime.get_block(self.runtime.parse_xml_string(xml))
+        usage_id, other_id = root.children
+        c_id, other_c_id = self.tree(usage_id)[-1], self.tree(other_id)[-1]
+        c_def_id = self.runtime.get_block(c_id).scope_ids.def_id
+        self.assertEqual(self.runtime.get_block(other_c_id).scope_ids.def_id, c_def_id)
+
+        self.runtime.reimport_xml_string(self.XML.replace(">C<", ">C, edited<"), usage_id)
+        self.assertEqual(self.tree(usage_id)[-1], c_id)
+        self.assertEqual(self.runtime.get_block(c_id).content, "C, edited")
+        # The other usage of the old definition is untouched.
+        self.assertEqual(self.runtime.get_block(other_c_id).scope_ids.def_id, c_def_id)
+        self.assertEqual(self.runtime.get_block(other_c_id).content, "C")
+
+        # Editing it back makes another definition: the old one might have
+        # been edited since it was imported.
+        self.runtime.reimport_xml_string(self.XML, usage_id)
+        self.assertNotEqual(self.runtime.get_block(c_id).scope_ids.def_id, c_def_id)
+        self.assertEqual(self.runtime.get_block(c_id).content, "C")
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_separate_imports_dont_share(self):
+        usage_id = self.runtime.parse_xml_string(self.XML)
+        leaf = self.runtime.get_block(self.tree(usage_id)[-1])
+        leaf.content = "C, edited by hand"
+        leaf.save()
+
+        # A later import of the same XML doesn't reuse the edited definition.
+        other_leaf = self.runtime.get_block(self.tree(self.runtime.parse_xml_string(self.XML))[-1])
+        self.assertNotEqual(other_leaf.scope_ids.def_id, leaf.scope_ids.def_id)
+        self.assertEqual(other_leaf.content, "C")
+        self.assertEqual(self.runtime.get_block(leaf.scope_ids.usage_id).content, "C, edited by hand")
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_reimport_without_set_definition_id(self):
+        self.runtime.usage_store = FixedUsageStore()
+        usage_id = self.runtime.parse_xml_string(self.XML)
+        c_id = self.tree(usage_id)[-1]
+        self.runtime.reimport_xml_string(self.XML.replace(">C<", ">C, edited<"), usage_id)
+        # The usage store can't change the definition, so "C" is replaced.
+        new_c_id = self.tree(usage_id)[-1]
+        self.assertNotEqual(new_c_id, c_id)
+        self.assertEqual(self.runtime.get_block(new_c_id).content, "C, edited")
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_reimport_edits_in_place(self):
+        self.runtime.deduplicate_definitions = False
+        usage_id = self.runtime.parse_xml_string(self.XML)
+        c_id = self.tree(usage_id)[-1]
+        writes = sum(self.kvs.set_many_sizes)
+
+        self.runtime.reimport_xml_string(self.XML.replace(">C<", ">C, edited<"), usage_id)
+        self.assertEqual(self.tree(usage_id)[-1], c_id)
+        self.assertEqual(self.runtime.get_block(c_id).content, "C, edited")
+        # Just the one value was written.
+        self.assertEqual(sum(self.kvs.set_many_sizes), writes + 1)
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_reimport_deletes_content(self):
+        self.runtime.deduplicate_definitions = False
+        usage_id = self.runtime.parse_xml_string(self.XML)
+        c_id = self.tree(usage_id)[-1]
+        self.runtime.reimport_xml_string(self.XML.replace("<leaf>C</leaf>", "<leaf/>"), usage_id)
+        self.assertEqual(self.runtime.get_block(c_id).content, "")
+
+    @XBlock.register_temp_plugin(Leaf)
+    @XBlock.register_temp_plugin(Container)
+    def test_reimport_repeated_names(self):
+        xml = '<container><leaf name="dup" data1="1"/><leaf name="dup" data1="2"/></container>'
+        usage_id = self.runtime.parse_xml_string(xml)
+        first_id, second_id = self.runtime.get_block(usage_id).children
+        student = WorkbenchRuntime("bob")
+        student.usage_store, student.field_data = self.runtime.usage_store, self.runtime.field_data
+        for leaf_id in (first_id, second_id):
+            leaf = student.get_block(leaf_id)
+            leaf.data2 = "bob's " + leaf_id
+            leaf.save()
+
+        # Siblings sharing a name are matched in order, and keep their ids and state.
+        self.runtime.reimport_xml_string(xml, usage_id)
+        self.assertEqual(self.runtime.get_block(usage_id).children, [first_id, second_id])
+        self.runtime.reimport_xml_string(xml.replace('data1="2"', 'data1="two"'), usage_id)
+        self.assertEqual(self.runtime.get_block(usage_id).children, [first_id, second_id])
+        self.assertEqual([self.runtime.get_block(leaf_id).data1 for leaf_id in (first_id, second_id)], ["1", "two"])
+        for leaf_id in (first_id, second_id):
+            self.assertEqual(student.get_block(leaf_id).data2, "bob's " + leaf_id)
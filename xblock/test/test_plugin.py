@@ -2,10 +2,18 @@
 Test xblock/core/plugin.py
 """
 
-from xblock.test.tools import assert_is, assert_raises_regexp
+import threading
+import time
+from contextlib import contextmanager
+from mock import Mock, patch
+
+from xblock.test.tools import assert_equals, assert_is, assert_raises_regexp, assert_true
 
 from xblock.core import XBlock
+from xblock.entry_point_index import IndexedEntryPoint
+from xblock.fields import XBlockMixin
 from xblock.plugin import AmbiguousPluginError, PluginMissingError
+from xblock.runtime import Mixologist
 
 
 class AmbiguousBlock1(XBlock):
@@ -62,3 +70,153 @@ def test_nosuch_plugin():
     # If we don't provide a default class, an exception is raised.
     with assert_raises_regexp(PluginMissingError, "nosuch_block"):
         XBlock.load_class("nosuch_block")
+
+
+@XBlock.tag("decorated")
+class TaggedBlock(XBlock):
+    """A dummy class with class tags, to find as a plugin."""
+    pass
+
+
+@XBlock.tag("declared")
+class DeclaredBlock(XBlock):
+    """A dummy class whose tags are declared by its entry points."""
+    pass
+
+
+@contextmanager
+def only_declaring_plugins(declared_tags=("declared",)):
+    """
+    Make the only plugins two dummy classes, one with `declared_tags`
+    declared by its entry points.
+    """
+    block_entry_points = [
+        IndexedEntryPoint("declaring", __name__, ["DeclaredBlock"]),
+        IndexedEntryPoint("undeclared", __name__, ["TaggedBlock"]),
+    ]
+    tag_entry_points = [IndexedEntryPoint(tag, __name__, ["DeclaredBlock"]) for tag in declared_tags]
+
+    def iter_entry_points(group, name=None):
+        """The entry points of `group`, or only those called `name`."""
+        entry_points = {XBlock.entry_point: block_entry_points, XBlock.tag_entry_point: tag_entry_points}[group]
+        return [entry_point for entry_point in entry_points if name in (None, entry_point.name)]
+
+    XBlock.clear_plugin_cache()
+    try:
+        with patch.object(XBlock, "entry_points", Mock(iter_entry_points=iter_entry_points)):
+            with patch.object(XBlock, "extra_entry_points", []):
+                yield
+    finally:
+        XBlock.clear_plugin_cache()
+
+
+def test_declared_tags():
+    with only_declaring_plugins():
+        with patch.object(IndexedEntryPoint, "load", return_value=TaggedBlock) as load:
+            assert_equals(XBlock.tagged_plugin_names("declared"), ["declaring"])
+        # Only the class without declared tags was imported, to read its class tags.
+        assert_equals(load.call_count, 1)
+        assert_equals(XBlock.tagged_plugin_names("decorated"), ["undeclared"])
+
+        # The classes produced are the classes themselves.
+        assert_equals(list(XBlock.load_tagged_classes("declared")), [("declaring", DeclaredBlock)])
+        assert_equals(list(XBlock.load_tagged_classes("decorated")), [("undeclared", TaggedBlock)])
+        # They can be mixed like any other.
+        (_, class_), = XBlock.load_tagged_classes("declared")
+        assert_true(issubclass(Mixologist([XBlockMixin]).mix(class_), DeclaredBlock))
+
+
+def test_declared_tags_mismatch():
+    with only_declaring_plugins(["declared", "other"]):
+        with patch("xblock.core.log") as log:
+            assert_equals(list(XBlock.load_tagged_classes("other")), [("declaring", DeclaredBlock)])
+        assert_equals(log.warning.call_count, 1)
+
+
+class TestPluginCache(object):
+    """Tests of the caching of plugin classes, and of missing plugins."""
+
+    def setUp(self):
+        XBlock.clear_plugin_cache()
+
+    def tearDown(self):
+        XBlock.clear_plugin_cache()
+
+    def test_missing_plugin_cached(self):
+        with patch.object(XBlock.entry_points, "iter_entry_points", return_value=[]) as iter_entry_points:
+            for _ in xrange(3):
+                assert_is(XBlock.load_class("nosuch_block", default=UnambiguousBlock), UnambiguousBlock)
+                with assert_raises_regexp(PluginMissingError, "nosuch_block"):
+                    XBlock.load_class("NoSuch_Block")
+        assert_equals(iter_entry_points.call_count, 1)
+
+    def test_temp_plugin_clears_cache(self):
+        assert_is(XBlock.load_class("temp_block", default=AmbiguousBlock1), AmbiguousBlock1)
+
+        @XBlock.register_temp_plugin(UnambiguousBlock, "temp_block")
+        def load_temp_block():
+            """Load the temporary plugin."""
+            return XBlock.load_class("temp_block", default=AmbiguousBlock1)
+
+        assert_is(load_temp_block(), UnambiguousBlock)
+        assert_is(XBlock.load_class("temp_block", default=AmbiguousBlock1), AmbiguousBlock1)
+
+    @XBlock.register_temp_plugin(UnambiguousBlock, "preloaded_block")
+    @XBlock.register_temp_plugin(AmbiguousBlock1, "ambiguous_block")
+    @XBlock.register_temp_plugin(AmbiguousBlock2, "ambiguous_block")
+    def test_preload(self):
+        XBlock.preload()
+        with patch.object(XBlock.entry_points, "iter_entry_points") as iter_entry_points:
+            assert_is(XBlock.load_class("preloaded_block"), UnambiguousBlock)
+            assert_equals(XBlock.load_class("html").plugin_name, "html")
+        assert_equals(iter_entry_points.call_count, 0)
+        # Ambiguous plugins are still chosen between when loaded.
+        with assert_raises_regexp(AmbiguousPluginError, "ambiguous_block"):
+            XBlock.load_class("ambiguous_block")
+
+    @XBlock.register_temp_plugin(UnambiguousBlock, "contended_block")
+    def test_contended_load(self):
+        def slow_load(entry_point):
+            """Load `entry_point` slowly, to give other threads a chance to load it too."""
+            time.sleep(0.01)
+            return type("Loaded", (entry_point.load(),), {})
+
+        loaded = []
+        with patch.object(XBlock, "_load_class_entry_point", side_effect=slow_load):
+            threads = [
+                threading.Thread(target=lambda: loaded.append(XBlock.load_class("contended_block")))
+                for _ in xrange(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # Every thread gets the class that was cached first.
+        assert_equals(len(loaded), 5)
+        assert_equals(len(set(loaded)), 1)
+        assert_is(XBlock.load_class("contended_block"), loaded[0])
+
+    @XBlock.register_temp_plugin(UnambiguousBlock, "importing_block")
+    def test_lock_not_held_while_importing(self):
+        locked = []
+
+        def load(entry_point):
+            """Load `entry_point`, noting whether another thread could take the lock meanwhile."""
+            def try_lock():
+                """Take the lock, and let it go, if it's free."""
+                if XBlock._plugin_cache_lock.acquire(False):  # pylint: disable=W0212
+                    XBlock._plugin_cache_lock.release()  # pylint: disable=W0212
+                    locked.append(False)
+                else:
+                    locked.append(True)
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            return entry_point.load()
+
+        with patch.object(XBlock, "_load_class_entry_point", side_effect=load):
+            assert_is(XBlock.load_class("importing_block"), UnambiguousBlock)
+            XBlock.preload()
+            assert_equals(XBlock.tagged_plugin_names("nosuchtag"), [])
+        assert_true(locked)
+        assert_equals(set(locked), set([False]))
@@ -5,7 +5,10 @@ Tests of the Problem XBlock, and its components.
 import json
 
 import webob
+from mock import Mock
 
+from xblock.field_data import DictFieldData
+from xblock.problem import AttemptsScoreboardBlock
 from xblock.test.tools import assert_equals
 
 from workbench.runtime import WorkbenchRuntime
@@ -42,3 +45,15 @@ def test_problem_submission():
     resp = runtime.handle(problem, 'check', make_request(json_data))
     resp_data = json.loads(text_of_response(resp))
     assert_equals(resp_data['checkResults']['votes_named'], True)
+
+
+def test_scoreboard_fallback():
+    # A runtime whose queries only produce the attributes of their blocks.
+    runtime = Mock()
+    problems = Mock(spec=['attr'])
+    problems.attr.return_value = iter([True, False, True])
+    runtime.query.return_value.parent.return_value.descendants.return_value = problems
+    scoreboard = AttemptsScoreboardBlock(runtime, DictFieldData({'parent': 'vertical'}), Mock())
+
+    assert_equals(scoreboard.student_view().body_html(), u"Hmm, you've only tried 2 out of 3 problems...")
+    problems.attr.assert_called_once_with("problem_attempted")
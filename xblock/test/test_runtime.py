@@ -2,15 +2,19 @@
 # Allow tests to access private members of classes
 # pylint: disable=W0212
 
+import subprocess
+import sys
 from collections import namedtuple
-from mock import Mock
+from mock import Mock, call, patch
 
 from xblock.core import XBlock
 from xblock.fields import BlockScope, Scope, String, ScopeIds, Integer, List, UserScope, XBlockMixin, Integer
-from xblock.exceptions import NoSuchViewError, NoSuchHandlerError
-from xblock.runtime import KeyValueStore, DbModel, Runtime, ObjectAggregator, Mixologist
+from xblock.exceptions import BadPathError, NoSuchViewError, NoSuchHandlerError, ReadOnlyFieldError
+from xblock import runtime as runtime_module
+from xblock.runtime import KeyValueStore, DbModel, Runtime, ObjectAggregator, Mixologist, compile_querypath
 from xblock.fragment import Fragment
 from xblock.field_data import DictFieldData
+from xblock.instrumentation import StatsCollector
 
 from xblock.test.tools import DictKeyValueStore
 from xblock.test.tools import (
@@ -183,6 +187,47 @@ def test_querypath_parsing():
     assert mrun.mock_query.mock_calls == expected.mock_calls
 
 
+def test_querypath_words():
+    mrun = MockRuntimeForQuerying()
+    mrun.querypath(Mock(), "./checker/@value")
+    expected = Mock()
+    expected.children().tagged("checker").attr("value")
+    assert_equals(mrun.mock_query.mock_calls, expected.mock_calls)
+
+
+def test_compile_querypath():
+    plan = compile_querypath("..//@hello")
+    assert_equals(plan.steps, (("parent", ()), ("descendants", ()), ("attr", ("hello",))))
+    # Compiled plans are cached, and can be run from any query.
+    assert_is(compile_querypath("..//@hello"), plan)
+    for _ in range(2):
+        query = Mock()
+        plan.run(query)
+        assert_equals(
+            query.mock_calls,
+            [call.parent(), call.parent().descendants(), call.parent().descendants().attr("hello")]
+        )
+
+
+def test_compile_querypath_lru():
+    plan = compile_querypath("./a")
+    with patch('xblock.runtime._QUERYPATH_CACHE_SIZE', 2):
+        compile_querypath("./b")
+        # Using "./a" keeps it in the cache as "./b" is dropped.
+        assert_is(compile_querypath("./a"), plan)
+        compile_querypath("./c")
+        assert_is(compile_querypath("./a"), plan)
+        assert_equals(list(runtime_module._QUERYPATH_CACHE), ["./c", "./a"])
+
+
+def test_bad_querypaths():
+    for path in ["./@a/b", "..b", "./a.", "./!"]:
+        with assert_raises(BadPathError):
+            compile_querypath(path)
+    with assert_raises(NotImplementedError):
+        compile_querypath("/a")
+
+
 def test_runtime_handle():
     # Test a simple handler and a fallback handler
 
@@ -241,6 +286,280 @@ def test_runtime_render():
         runtime.render(tester, 'test_nonexistant_view', [update_string])
 
 
+class TreeTester(XBlock):
+    """Test XBlock for rendering trees of blocks"""
+    has_children = True
+    mutable = List(scope=Scope.user_state)
+    immutable = String(scope=Scope.user_state, default=u"default")
+
+    def student_view(self, context=None):
+        """Read fields, and render any children"""
+        frags = self.runtime.render_children(self, context=context)
+        body = u"%s %s" % (self.mutable, self.immutable)
+        return Fragment(body + u"".join(frag.body_html() for frag in frags))
+
+    def writing_view(self, context=None):  # pylint: disable=W0613
+        """Try to change a field"""
+        self.immutable = u"written"
+        return Fragment(self.immutable)
+
+
+class TreeRuntime(Runtime):
+    """A runtime that keeps its TreeTester blocks in a dict"""
+    # OK for this mock class to not override abstract methods
+    # pylint: disable=W0223
+    def __init__(self, read_only_views=(), instrumentation=None):
+        super(TreeRuntime, self).__init__(
+            Mock(), DbModel(DictKeyValueStore()),
+            read_only_views=read_only_views, instrumentation=instrumentation,
+        )
+        self.blocks = {}
+
+    def make_block(self, usage_id, children=()):
+        """Make a TreeTester available as `usage_id`"""
+        block = self.construct_xblock_from_class(TreeTester, ScopeIds('s0', 'tester', usage_id, usage_id))
+        block.children = list(children)
+        block.save()
+        self.blocks[usage_id] = block
+        return block
+
+    def get_block(self, usage_id):
+        return self.blocks[usage_id]
+
+
+def test_instrumented_render():
+    stats = StatsCollector()
+    runtime = TreeRuntime(instrumentation=stats)
+    runtime.make_block('child')
+    parent = runtime.make_block('parent', children=['child'])
+    stats.reset()
+
+    frag = runtime.render(parent, 'student_view')
+    rows = dict(((row['event'], row['name']), row) for row in stats.dump())
+
+    assert_equals(rows['render', 'student_view']['count'], 2)
+    assert_equals(rows['render', 'student_view']['bytes'], 2 * len(frag.body_html()) - len(u"[] default"))
+    assert_equals(rows['render_child', 'student_view']['count'], 1)
+    assert_equals(rows['save', None]['count'], 2)
+    # The renders read the fields, and each save writes the mutable field it read.
+    assert_true(rows['render', 'student_view']['reads'] > 0)
+    assert_equals(rows['save', None]['writes'], 2)
+    assert_true(('has', 'mutable') in rows)
+    # The children's fields were prefetched.
+    assert_equals(rows['get_many', None]['count'], 1)
+    # The child was got, and counted under its block type.
+    assert_equals(rows['get_block', None]['count'], 1)
+    assert_equals(rows['get_block', None]['block_type'], 'tester')
+
+    runtime.render(parent, 'writing_view')
+    rows = dict(((row['event'], row['name']), row) for row in stats.dump())
+    assert_equals(rows['save', None]['writes'], 3)
+
+
+def test_read_only_views():
+    runtime = TreeRuntime(read_only_views=['student_view'])
+    child = runtime.make_block('child')
+    parent = runtime.make_block('parent', children=['child'])
+    parent.save = Mock()
+    child.save = Mock()
+
+    frag = runtime.render(parent, 'student_view')
+    assert_equals(frag.body_html(), u"[] default[] default")
+
+    # Nothing was tracked and nothing was saved, in the block or its children.
+    for block in (parent, child):
+        assert_equals(block._dirty_fields, {})
+        assert_false(block.save.called)
+        assert_false(block._read_only)
+
+    # Other views are still tracked and saved.
+    runtime.render(parent, 'writing_view')
+    assert_true(parent.save.called)
+    assert_equals(parent.immutable, u"written")
+
+
+def test_read_only_write_raises():
+    runtime = TreeRuntime(read_only_views=['writing_view'])
+    tester = runtime.make_block('u0')
+
+    with assert_raises(ReadOnlyFieldError):
+        runtime.render(tester, 'writing_view')
+    assert_equals(tester.immutable, u"default")
+    assert_false(tester._read_only)
+
+
+def test_read_only_runtime():
+    runtime = TreeRuntime()
+    tester = runtime.make_block('u0')
+    tester.save = Mock()
+
+    runtime.read_only = True
+    runtime.render(tester, 'student_view')
+    assert_false(tester.save.called)
+    with assert_raises(ReadOnlyFieldError):
+        runtime.render(tester, 'writing_view')
+
+    # Outside of a read-only render, the block can be changed as usual.
+    runtime.read_only = False
+    tester.immutable = u"changed"
+    del tester.immutable
+    assert_equals(tester.immutable, u"default")
+
+
+def test_render_stream():
+    runtime = TreeRuntime()
+    leaf1 = runtime.make_block('leaf1')
+    leaf1.student_view = Mock(wraps=leaf1.student_view)
+    runtime.make_block('leaf2')
+    runtime.make_block('middle', children=['leaf2'])
+    root = runtime.make_block('root', children=['leaf1', 'middle'])
+    root.mutable = ['root']
+    root.save()
+
+    # Children aren't rendered until the stream reaches them.
+    stream = runtime.render_stream(root, 'student_view')
+    assert_equals(next(stream).body_html(), u"['root'] default")
+    assert_false(leaf1.student_view.called)
+    assert_equals(next(stream).body_html(), u"[] default")
+    assert_true(leaf1.student_view.called)
+
+    expected = runtime.render(root, 'student_view').body_html()
+    frags = list(runtime.render_stream(root, 'student_view'))
+    assert_equals(u"".join(frag.body_html() for frag in frags), expected)
+    # One piece for the root, and one for each block below it
+    assert_equals(
+        [frag.body_html() for frag in frags],
+        [u"['root'] default", u"[] default", u"[] default", u"[] default"]
+    )
+
+
+class CountingKVS(DictKeyValueStore):
+    """A DictKeyValueStore that counts the calls made to it"""
+    def __init__(self):
+        super(CountingKVS, self).__init__()
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append('get')
+        return super(CountingKVS, self).get(key)
+
+    def has(self, key):
+        self.calls.append('has')
+        return super(CountingKVS, self).has(key)
+
+    def get_many(self, keys):
+        self.calls.append('get_many')
+        return dict((key, self.db_dict[key]) for key in keys if key in self.db_dict)
+
+
+def test_kvs_get_many():
+    key_store = DictKeyValueStore()
+    key1 = KeyValueStore.Key(Scope.settings, None, 'u0', 'field1')
+    key2 = KeyValueStore.Key(Scope.settings, None, 'u0', 'field2')
+    key_store.set(key1, 'value1')
+    assert_equals(key_store.get_many([key1, key2]), {key1: 'value1'})
+
+
+def test_db_model_get_many():
+    key_store = CountingKVS()
+    db_model = DbModel(key_store)
+    tester = TestXBlock(Mock(), db_model, ScopeIds('s0', 'TestXBlock', 'd0', 'u0'))
+    tester.content = 'new content'
+    tester.user_state = 'new user_state'
+    tester.save()
+
+    values = db_model.get_many(tester, ['content', 'user_state', 'settings'])
+    assert_equals(values, {'content': 'new content', 'user_state': 'new user_state'})
+    assert_equals(key_store.calls, ['get_many'])
+
+
+def test_db_get_many_for_blocks():
+    key_store = CountingKVS()
+    db_model = DbModel(key_store)
+    testers = [TestXBlock(Mock(), db_model, ScopeIds('s0', 'TestXBlock', 'd0', usage_id)) for usage_id in 'u0', 'u1']
+    testers[0].user_state = 'first'
+    testers[1].user_state = 'second'
+    testers[1].content = 'shared'
+    for tester in testers:
+        tester.save()
+
+    del key_store.calls[:]
+    values = db_model.get_many_for_blocks([(tester, ['content', 'user_state']) for tester in testers])
+    assert_equals(values, [
+        {'content': 'shared', 'user_state': 'first'},
+        {'content': 'shared', 'user_state': 'second'},
+    ])
+    assert_equals(key_store.calls, ['get_many'])
+
+
+def test_db_set_many_for_blocks():
+    key_store = DictKeyValueStore()
+    key_store.set_many = Mock(wraps=key_store.set_many)
+    db_model = DbModel(key_store)
+    testers = [TestXBlock(Mock(), db_model, ScopeIds('s0', 'TestXBlock', 'd' + usage_id, usage_id))
+               for usage_id in ['u0', 'u1']]
+    db_model.set_many_for_blocks([
+        (testers[0], {'content': 'c0', 'user_state': 's0'}),
+        (testers[1], {'content': 'c1'}),
+    ])
+    assert_equals(key_store.set_many.call_count, 1)
+    assert_equals([tester.content for tester in testers], ['c0', 'c1'])
+    assert_equals(testers[0].user_state, 's0')
+
+
+def test_prefetch_named_fields():
+    key_store = CountingKVS()
+    db_model = DbModel(key_store)
+    runtime = Runtime(Mock(), db_model)
+    testers = []
+    for usage_id, content, user_state in [('u0', 'c0', 's0'), ('u1', 'c1', None)]:
+        tester = TestXBlock(runtime, db_model, ScopeIds('fred', 'TestXBlock', 'd' + usage_id, usage_id))
+        tester.content = content
+        if user_state:
+            tester.user_state = user_state
+        tester.save()
+        testers.append(TestXBlock(runtime, db_model, tester.scope_ids))
+    key_store.calls = []
+
+    # Only the named fields are read, whatever their scope, with one read for all the blocks.
+    runtime.prefetch_fields(testers, every_scope=True, names=['content', 'user_state'])
+    assert_equals(key_store.calls, ['get_many'])
+    assert_equals([tester.content for tester in testers], ['c0', 'c1'])
+    assert_equals([tester.user_state for tester in testers], ['s0', TestXBlock.user_state.default])
+    assert_equals(key_store.calls, ['get_many'])
+    for tester in testers:
+        assert_false('settings' in tester._field_data_cache)
+
+
+def check_render_children(prefetch):
+    """Check that children render the same, prefetching their fields or not"""
+    runtime = TreeRuntime()
+    runtime.prefetch_children = prefetch
+    key_store = runtime.field_data._kvs = CountingKVS()
+    leaves = [runtime.make_block('leaf1'), runtime.make_block('leaf2')]
+    leaves[0].mutable = ['leaf1']
+    leaves[1].immutable = u'leaf2'
+    root = runtime.make_block('root', children=['leaf1', 'leaf2'])
+    for leaf in leaves:
+        leaf.save()
+        # Start with empty caches, as if the blocks had just been loaded
+        leaf._field_data_cache.clear()
+
+    del key_store.calls[:]
+    frags = runtime.render_children(root, 'student_view')
+    assert_equals([frag.body_html() for frag in frags], [u"['leaf1'] default", u"[] leaf2"])
+    if prefetch:
+        # One read for all the children
+        assert_equals(key_store.calls, ['get_many'])
+    else:
+        assert_true(len(key_store.calls) > 2)
+
+
+def test_render_children():
+    for prefetch in (True, False):
+        yield check_render_children, prefetch
+
+
 class SerialDefaultKVS(DictKeyValueStore):
     """
     A kvs which gives each call to default the next int (nonsensical but for testing default fn)
@@ -454,3 +773,85 @@ class TestMixologist(object):
 
         assert_equals(4, len(pre_mixed.__bases__))  # 1 for the original class + 3 mixin classes
         assert_equals(4, len(post_mixed.__bases__))
+
+
+class TestBlockClassCache(object):
+    """Test that runtimes remember the classes of the blocks they construct."""
+    # OK for this mock class to not override abstract methods
+    # pylint: disable=W0223
+    class CachingRuntime(Runtime):
+        """A runtime mixing FirstMixin into its blocks"""
+        def __init__(self):
+            super(TestBlockClassCache.CachingRuntime, self).__init__(
+                Mock(), DictFieldData({}), mixins=[FirstMixin]
+            )
+
+    def setUp(self):
+        self.runtime = self.CachingRuntime()
+
+    @XBlock.register_temp_plugin(FieldTester, "fieldtester")
+    def test_block_class(self):
+        block_class = self.runtime.block_class("fieldtester")
+        assert_is(FieldTester, block_class.unmixed_class)
+        assert_is(1, block_class.number)
+
+        with patch.object(XBlock, "load_class") as load_class:
+            assert_is(block_class, self.runtime.block_class("fieldtester"))
+            block = self.runtime.construct_xblock("fieldtester", ScopeIds("s0", "fieldtester", "d0", "u0"))
+        assert_equals(load_class.call_count, 0)
+        assert_is(block_class, type(block))
+        assert_is(self.runtime, block.runtime)
+        assert_equals("u0", block.scope_ids.usage_id)
+
+    def test_construct_from_class(self):
+        block = self.runtime.construct_xblock_from_class(FieldTester, ScopeIds("s0", "fieldtester", "d0", "u0"))
+        with patch.object(Mixologist, "mix") as mix:
+            again = self.runtime.construct_xblock_from_class(FieldTester, ScopeIds("s0", "fieldtester", "d0", "u1"))
+        assert_equals(mix.call_count, 0)
+        assert_is(type(block), type(again))
+
+    def test_default_class_not_remembered(self):
+        keys = ScopeIds("s0", "nosuchtype", "d0", "u0")
+        block = self.runtime.construct_xblock("nosuchtype", keys, default_class=FieldTester)
+        assert_is(FieldTester, type(block).unmixed_class)
+        block = self.runtime.construct_xblock("nosuchtype", keys, default_class=TestXBlock)
+        assert_is(TestXBlock, type(block).unmixed_class)
+
+    @XBlock.register_temp_plugin(FieldTester, "fieldtester")
+    def test_construct_from_class_overridden(self):
+        # Runtimes that construct blocks their own way see every block constructed.
+        with patch.object(self.CachingRuntime, "construct_xblock_from_class") as construct_xblock_from_class:
+            for usage_id in ("u0", "u1"):
+                keys = ScopeIds("s0", "fieldtester", "d0", usage_id)
+                block = self.runtime.construct_xblock("fieldtester", keys)
+                assert_is(construct_xblock_from_class.return_value, block)
+                construct_xblock_from_class.assert_called_with(FieldTester, keys, None)
+        assert_equals(construct_xblock_from_class.call_count, 2)
+
+    @XBlock.register_temp_plugin(FieldTester, "fieldtester")
+    def test_warm_up(self):
+        self.runtime.warm_up()
+        with patch.object(XBlock, "load_class") as load_class:
+            block = self.runtime.construct_xblock("fieldtester", ScopeIds("s0", "fieldtester", "d0", "u0"))
+        assert_equals(load_class.call_count, 0)
+        assert_is(FieldTester, type(block).unmixed_class)
+
+    def test_plugins_changed(self):
+        # A block type's class is loaded again once the plugins have changed.
+        def block_class_of(cls):
+            """The class the runtime finds for "fieldtester", with `cls` registered as it."""
+            @XBlock.register_temp_plugin(cls, "fieldtester")
+            def block_class():  # pylint: disable=C0111
+                return self.runtime.block_class("fieldtester").unmixed_class
+            return block_class()
+
+        assert_is(FieldTester, block_class_of(FieldTester))
+        assert_is(TestXBlock, block_class_of(TestXBlock))
+
+
+def test_lazy_imports():
+    # Importing the runtime doesn't load what only XML, handlers and plugin scanning need.
+    heavy_modules = ["lxml.etree", "webob", "json", "pkg_resources", "multiprocessing"]
+    code = "import sys, xblock.core, xblock.runtime; print [name for name in {!r} if name in sys.modules]"
+    output = subprocess.check_output([sys.executable, "-c", code.format(heavy_modules)])
+    assert_equals(output.strip(), "[]")
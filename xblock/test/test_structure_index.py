@@ -0,0 +1,91 @@
+"""Tests of the structure index of trees of blocks"""
+
+from mock import Mock
+
+from xblock.core import XBlock
+from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
+from xblock.structure_index import IndexingFieldData, StructureIndex
+
+from xblock.test.tools import assert_equals, assert_false, assert_true
+
+
+def make_tree():
+    """A StructureIndex of a small tree."""
+    index = StructureIndex()
+    for usage_id, parent_id, children in [
+            ('root', None, ['a', 'b']),
+            ('a', 'root', ['a1', 'a2']),
+            ('a1', 'a', []),
+            ('a2', 'a', []),
+            ('b', 'root', []),
+    ]:
+        index.add_usage(usage_id, class_tags=['container'] if children else [])
+        index.set_parent(usage_id, parent_id)
+        index.set_children(usage_id, children)
+    return index
+
+
+def test_structure():
+    index = make_tree()
+    assert_true(index.knows('a1'))
+    assert_false(index.knows('c'))
+    assert_equals(index.parent('a1'), 'a')
+    assert_equals(index.parent('root'), None)
+    assert_equals(list(index.children('root')), ['a', 'b'])
+    assert_equals(list(index.children('a1')), [])
+    assert_equals(list(index.descendants('root')), ['a', 'a1', 'a2', 'b'])
+
+
+def test_tags():
+    index = make_tree()
+    assert_equals(index.tagged('container'), set(['root', 'a']))
+
+    index.set_name('a1', 'first')
+    index.set_tags('a1', ['leafy', 'green'])
+    index.set_tags('a2', ['leafy'])
+    assert_equals(index.tagged('leafy'), set(['a1', 'a2']))
+    assert_true(index.has_tag('a1', 'first'))
+    assert_true(index.has_tag('a1', 'green'))
+    assert_false(index.has_tag('a2', 'green'))
+
+    # New values replace the old ones.
+    index.set_name('a1', 'renamed')
+    index.set_tags('a1', [])
+    assert_equals(index.tagged('first'), set())
+    assert_equals(index.tagged('leafy'), set(['a2']))
+    assert_equals(index.tagged('renamed'), set(['a1']))
+
+    index.clear()
+    assert_false(index.knows('root'))
+    assert_equals(index.tagged('leafy'), set())
+
+
+@XBlock.tag("indexed")
+class IndexedBlock(XBlock):
+    """A block with children and a class tag."""
+    has_children = True
+
+
+def test_indexing_field_data():
+    index = StructureIndex()
+    field_data = IndexingFieldData(DictFieldData({}), index)
+    block = IndexedBlock(Mock(), field_data, ScopeIds('user', 'indexed', 'def', 'usage'))
+
+    block.parent = 'top'
+    block.children = ['c1', 'c2']
+    block.name = 'mine'
+    block.save()
+    assert_equals(index.parent('usage'), 'top')
+    assert_equals(list(index.children('usage')), ['c1', 'c2'])
+    assert_equals(index.tagged('mine'), set(['usage']))
+    assert_equals(index.tagged('indexed'), set(['usage']))
+
+    field_data.set(block, 'tags', ['extra'])
+    assert_true(index.has_tag('usage', 'extra'))
+
+    del block.children
+    block.save()
+    assert_equals(list(index.children('usage')), [])
+    field_data.delete(block, 'name')
+    assert_equals(index.tagged('mine'), set())
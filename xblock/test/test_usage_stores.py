@@ -0,0 +1,196 @@
+"""
+Tests of the UsageStore implementations
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from workbench.runtime import WorkbenchKeyValueStore, WorkbenchRuntime
+from xblock.runtime import DbModel, UsageStore
+from xblock.test.tools import assert_equals, assert_raises
+from xblock.usage_stores import CompactUsageStore, SqliteUsageStore
+
+
+class ListUsageStore(UsageStore):
+    """A UsageStore with only the single-item methods."""
+    # pylint: disable=W0223
+    def __init__(self):
+        self.items = []
+
+    def create_definition(self, block_type):
+        self.items.append(block_type)
+        return str(len(self.items) - 1)
+
+    def create_usage(self, def_id):
+        self.items.append(def_id)
+        return str(len(self.items) - 1)
+
+
+def test_default_bulk_creation():
+    store = ListUsageStore()
+    assert_equals(store.create_definitions(["a", "b"]), ["0", "1"])
+    assert_equals(store.create_usages(["1", "0"]), ["2", "3"])
+    assert_equals(store.items, ["a", "b", "1", "0"])
+    with assert_raises(NotImplementedError):
+        store.set_definition_id("2", "0")
+
+
+class TestSqliteUsageStore(object):
+    """Tests of SqliteUsageStore."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "usages.db")
+        self.store = SqliteUsageStore(self.filename, id_range_size=3)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_create_and_get(self):
+        def_id = self.store.create_definition("html")
+        usage_id = self.store.create_usage(def_id)
+        assert_equals((def_id, usage_id), ("0", "1"))
+        assert_equals(self.store.get_definition_id(usage_id), def_id)
+        assert_equals(self.store.get_block_type(def_id), "html")
+        with assert_raises(KeyError):
+            self.store.get_definition_id("100")
+        with assert_raises(KeyError):
+            self.store.get_block_type("not an id")
+
+    def test_bulk_create(self):
+        def_ids = self.store.create_definitions(["html", "problem", "html", "video"])
+        usage_ids = self.store.create_usages(def_ids)
+        # Claimed past the end of a range of 3 in one go, then a new range.
+        assert_equals(def_ids, ["0", "1", "2", "3"])
+        assert_equals(usage_ids, ["4", "5", "6", "7"])
+        assert_equals(
+            [self.store.get_block_type(self.store.get_definition_id(usage_id)) for usage_id in usage_ids],
+            ["html", "problem", "html", "video"]
+        )
+
+    def test_persistent(self):
+        usage_id = self.store.create_usage(self.store.create_definition("html"))
+        self.store.close()
+        self.store = SqliteUsageStore(self.filename)
+        assert_equals(self.store.get_block_type(self.store.get_definition_id(usage_id)), "html")
+        # New ids don't reuse the ones claimed before.
+        assert_equals(self.store.create_definition("video"), "3")
+
+    def test_shared_database(self):
+        other = SqliteUsageStore(self.filename, id_range_size=3)
+        ids = [
+            self.store.create_definition("one"),
+            other.create_definition("two"),
+            self.store.create_definition("one"),
+            other.create_definition("two"),
+        ]
+        # Each store hands out ids from its own range.
+        assert_equals(ids, ["0", "3", "1", "4"])
+        assert_equals(other.get_block_type("0"), "one")
+        assert_equals(self.store.get_block_type("4"), "two")
+        other.close()
+
+    def test_cache(self):
+        self.store.cache_size = 2
+        def_ids = self.store.create_definitions(["a", "b", "c"])
+        # Take the definitions out of the database behind the store's back.
+        database = sqlite3.connect(self.filename)
+        database.execute("DELETE FROM definitions")
+        database.commit()
+        database.close()
+        # The two most recent are still known; the first has been forgotten.
+        assert_equals(self.store.get_block_type(def_ids[1]), "b")
+        assert_equals(self.store.get_block_type(def_ids[2]), "c")
+        with assert_raises(KeyError):
+            self.store.get_block_type(def_ids[0])
+
+    def test_runtime(self):
+        runtime = WorkbenchRuntime()
+        runtime.usage_store = self.store
+        runtime.field_data = DbModel(WorkbenchKeyValueStore({}))
+        usage_id = runtime.parse_xml_string("<vertical><html>Hi</html></vertical>")
+        vertical = runtime.get_block(usage_id)
+        assert_equals(runtime.get_block(vertical.children[0]).content, "Hi")
+
+    def test_set_definition_id(self):
+        html, video = self.store.create_definitions(["html", "video"])
+        usage_id = self.store.create_usage(html)
+        self.store.set_definition_id(usage_id, video)
+        assert_equals(self.store.get_definition_id(usage_id), video)
+        # The change is in the database, not just the store's cache.
+        other = SqliteUsageStore(self.filename)
+        assert_equals(other.get_definition_id(usage_id), video)
+        other.close()
+        for bad_id in [html, "100", "not an id"]:
+            with assert_raises(KeyError):
+                self.store.set_definition_id(bad_id, video)
+
+    def test_set_definition_id_elsewhere(self):
+        html, video = self.store.create_definitions(["html", "video"])
+        usage_id = self.store.create_usage(html)
+        assert_equals(self.store.get_definition_id(usage_id), html)
+        # Another store on the database changes the usage this one remembers.
+        other = SqliteUsageStore(self.filename)
+        other.set_definition_id(usage_id, video)
+        other.close()
+        assert_equals(self.store.get_definition_id(usage_id), video)
+
+    def test_failed_transaction(self):
+        with assert_raises(sqlite3.IntegrityError):
+            self.store.create_definitions([None])
+        # The range of ids claimed in the failed transaction is claimed again.
+        assert_equals(self.store.create_definition("html"), "0")
+
+
+class TestCompactUsageStore(object):
+    """Tests of CompactUsageStore."""
+    def setUp(self):
+        self.store = CompactUsageStore()
+
+    def test_create_and_get(self):
+        html = self.store.create_definition("html")
+        video = self.store.create_definition("video")
+        usage_ids = [self.store.create_usage(html), self.store.create_usage(video), self.store.create_usage(html)]
+        assert_equals((html, video), ("0", "1"))
+        assert_equals(usage_ids, ["2", "3", "4"])
+        assert_equals([self.store.get_definition_id(usage_id) for usage_id in usage_ids], [html, video, html])
+        assert_equals(self.store.get_block_type(video), "video")
+
+    def test_bulk_create(self):
+        def_ids = self.store.create_definitions(["html", "problem", "html"])
+        usage_ids = self.store.create_usages(def_ids)
+        assert_equals(
+            [self.store.get_block_type(self.store.get_definition_id(usage_id)) for usage_id in usage_ids],
+            ["html", "problem", "html"]
+        )
+
+    def test_unknown_ids(self):
+        def_id = self.store.create_definition("html")
+        usage_id = self.store.create_usage(def_id)
+        for bad_id in [usage_id, "7", "-1", "html", None]:
+            with assert_raises(KeyError):
+                self.store.get_block_type(bad_id)
+        for bad_id in [def_id, "7", None]:
+            with assert_raises(KeyError):
+                self.store.get_definition_id(bad_id)
+        with assert_raises(KeyError):
+            self.store.create_usage(usage_id)
+
+    def test_set_definition_id(self):
+        html, video = self.store.create_definitions(["html", "video"])
+        usage_id = self.store.create_usage(html)
+        self.store.set_definition_id(usage_id, video)
+        assert_equals(self.store.get_definition_id(usage_id), video)
+        for bad_usage_id, bad_def_id in [(html, video), ("7", video), (usage_id, usage_id), (usage_id, None)]:
+            with assert_raises(KeyError):
+                self.store.set_definition_id(bad_usage_id, bad_def_id)
+        assert_equals(self.store.get_definition_id(usage_id), video)
+
+    def test_clear(self):
+        self.store.create_usage(self.store.create_definition("html"))
+        self.store.clear()
+        with assert_raises(KeyError):
+            self.store.get_block_type("0")
+        assert_equals(self.store.create_definition("video"), "0")
@@ -2,7 +2,9 @@
 Tools for testing XBlocks
 """
 
-from xblock.runtime import KeyValueStore
+import os
+import shutil
+import tempfile
 
 # nose.tools has convenient assert methods, but it defines them in a clever way
 # that baffles pylint.  Import them all here so we can keep the pylint clutter
@@ -16,6 +18,9 @@ from nose.tools import (                        # pylint: disable=W0611,E0611
     assert_raises, assert_raises_regexp,
 )
 
+from xblock.entry_point_index import ENTRY_POINTS
+from xblock.runtime import KeyValueStore
+
 
 class DictKeyValueStore(KeyValueStore):
     """
@@ -78,3 +83,25 @@ def blocks_are_equivalent(block1, block2):
                 return False
 
     return True
+
+
+# The temporary directories of the entry point index, and the files it used before.
+_TEMP_INDEXES = []
+
+
+def use_temp_entry_point_index():
+    """
+    Keep the plugins' entry point index in a temporary directory, rather
+    than the user's cache, until :func:`restore_entry_point_index`.
+    """
+    directory = tempfile.mkdtemp()
+    _TEMP_INDEXES.append((directory, ENTRY_POINTS.filename))
+    ENTRY_POINTS.filename = os.path.join(directory, "entry-points.json")
+    ENTRY_POINTS.refresh()
+
+
+def restore_entry_point_index():
+    """Go back to the entry point index used before :func:`use_temp_entry_point_index`."""
+    directory, ENTRY_POINTS.filename = _TEMP_INDEXES.pop()
+    ENTRY_POINTS.refresh()
+    shutil.rmtree(directory)
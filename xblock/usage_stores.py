@@ -0,0 +1,280 @@
+"""
+Implementations of :class:`~xblock.runtime.UsageStore`.
+
+This code is in the Runtime layer.
+
+"""
+
+import sqlite3
+from array import array
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from xblock.runtime import UsageStore
+
+
+class CompactUsageStore(UsageStore):
+    """
+    A `UsageStore` kept in memory, in as little of it as possible.
+
+    Ids are numbers, as strings, as in the workbench's `MemoryUsageStore`,
+    but they are only strings at the edges: inside, each id indexes two
+    arrays of integers, one holding the definition of each usage, and the
+    other the block type of each definition, as an index into a table of
+    the block types seen.  That is eight bytes for each id, rather than a
+    pair of strings in a dict.
+
+    """
+    # Marks the ids that aren't a usage, or aren't a definition.
+    _NONE = -1
+
+    def __init__(self):
+        self._usage_defs = array("i")
+        self._definition_types = array("i")
+        self._block_types = []
+        self._block_type_indexes = {}
+
+    def clear(self):
+        """Remove all entries, starting the ids again."""
+        del self._usage_defs[:]
+        del self._definition_types[:]
+        del self._block_types[:]
+        self._block_type_indexes.clear()
+
+    def _index(self, some_id, column):
+        """The index in the array `column` for the id `some_id`, or KeyError."""
+        try:
+            index = int(some_id)
+        except (TypeError, ValueError):
+            raise KeyError(some_id)
+        if not 0 <= index < len(column) or column[index] == self._NONE:
+            raise KeyError(some_id)
+        return index
+
+    def _block_type_index(self, block_type):
+        """The index of `block_type` in the table of block types."""
+        index = self._block_type_indexes.get(block_type)
+        if index is None:
+            index = self._block_type_indexes[block_type] = len(self._block_types)
+            self._block_types.append(block_type)
+        return index
+
+    def create_definitions(self, block_types):
+        """Make a definition of each of `block_types`, returning their ids."""
+        first = len(self._definition_types)
+        self._definition_types.extend(self._block_type_index(block_type) for block_type in block_types)
+        self._usage_defs.extend([self._NONE] * len(block_types))
+        return [str(def_id) for def_id in xrange(first, len(self._definition_types))]
+
+    def create_usages(self, def_ids):
+        """Make a usage of each of `def_ids`, returning their ids."""
+        indexes = [self._index(def_id, self._definition_types) for def_id in def_ids]
+        first = len(self._usage_defs)
+        self._usage_defs.extend(indexes)
+        self._definition_types.extend([self._NONE] * len(indexes))
+        return [str(usage_id) for usage_id in xrange(first, len(self._usage_defs))]
+
+    def create_definition(self, block_type):
+        """Make a definition, storing its block type."""
+        return self.create_definitions([block_type])[0]
+
+    def create_usage(self, def_id):
+        """Make a usage, storing its definition id."""
+        return self.create_usages([def_id])[0]
+
+    def set_definition_id(self, usage_id, def_id):
+        """Point the usage `usage_id` at the definition `def_id`."""
+        self._usage_defs[self._index(usage_id, self._usage_defs)] = self._index(def_id, self._definition_types)
+
+    # get_block calls these two for every block, so they check the ids
+    # themselves, rather than calling _index.
+
+    def get_definition_id(self, usage_id):
+        """Get a definition_id by its usage id."""
+        try:
+            index = int(usage_id)
+            def_index = self._usage_defs[index] if index >= 0 else self._NONE
+        except (TypeError, ValueError, IndexError):
+            raise KeyError(usage_id)
+        if def_index == self._NONE:
+            raise KeyError(usage_id)
+        return str(def_index)
+
+    def get_block_type(self, def_id):
+        """Get a block_type by its definition id."""
+        try:
+            index = int(def_id)
+            type_index = self._definition_types[index] if index >= 0 else self._NONE
+        except (TypeError, ValueError, IndexError):
+            raise KeyError(def_id)
+        if type_index == self._NONE:
+            raise KeyError(def_id)
+        return self._block_types[type_index]
+
+
+class SqliteUsageStore(UsageStore):
+    """
+    A `UsageStore` kept in an SQLite database, so that it lasts between
+    runs, and can be shared by several processes.
+
+    Ids are numbers, as strings.  Rather than asking the database for each
+    new id, a store claims ranges of `id_range_size` ids at a time, and hands
+    them out itself.  Stores sharing a database claim different ranges, so
+    their ids never clash, but they are only in order within one store.
+
+    The most recently used `cache_size` usages and definitions are
+    remembered, rather than looked up each time.  Definitions never change
+    once made, but :func:`set_definition_id` can point a usage at another
+    one, so the remembered usages are forgotten whenever another connection
+    to the database (another store, or another process) has changed it.
+
+    """
+    def __init__(self, filename, id_range_size=1000, cache_size=10000):
+        """
+        :param filename: The SQLite database to use, created if need be.
+            ":memory:" gives a private database, lost when the store is.
+        """
+        self.id_range_size = id_range_size
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        # The ids claimed but not yet handed out: [next, end).
+        self._next_id = self._end_id = 0
+        self._usages = OrderedDict()
+        self._definitions = OrderedDict()
+        # SQLite's count of the changes to the database made by other connections,
+        # when the usages were remembered.
+        self._data_version = None
+        # Transactions are begun explicitly.
+        self._db = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self._db.text_factory = str
+        with self._transaction() as cursor:
+            cursor.execute("CREATE TABLE IF NOT EXISTS id_ranges (next_id INTEGER NOT NULL)")
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS definitions (def_id INTEGER PRIMARY KEY, block_type TEXT NOT NULL)"
+            )
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS usages (usage_id INTEGER PRIMARY KEY, def_id INTEGER NOT NULL)"
+            )
+            if cursor.execute("SELECT COUNT(*) FROM id_ranges").fetchone()[0] == 0:
+                cursor.execute("INSERT INTO id_ranges (next_id) VALUES (0)")
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """A context manager for a transaction, giving a cursor."""
+        with self._lock:
+            cursor = self._db.cursor()
+            # Take the write lock now, so that ranges of ids are claimed one store at a time.
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except:
+                cursor.execute("ROLLBACK")
+                # Any range claimed in the transaction is unclaimed again.
+                self._next_id = self._end_id = 0
+                raise
+            cursor.execute("COMMIT")
+
+    def _new_ids(self, cursor, count):
+        """Hand out `count` new ids, claiming more as needed, in the transaction of `cursor`."""
+        ids = []
+        while len(ids) < count:
+            if self._next_id == self._end_id:
+                # Claim enough for the rest of these, at least.
+                size = max(self.id_range_size, count - len(ids))
+                cursor.execute("UPDATE id_ranges SET next_id = next_id + ?", (size,))
+                self._end_id = cursor.execute("SELECT next_id FROM id_ranges").fetchone()[0]
+                self._next_id = self._end_id - size
+            taken = min(count - len(ids), self._end_id - self._next_id)
+            ids.extend(xrange(self._next_id, self._next_id + taken))
+            self._next_id += taken
+        return ids
+
+    def _remember(self, cache, key, value):
+        """Remember `value` for `key` in the LRU `cache`."""
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _look_up(self, cache, key, query):
+        """Find `key` in the LRU `cache`, or else with the SQL `query`."""
+        with self._lock:
+            value = cache.pop(key, None)
+            if value is None:
+                try:
+                    row = self._db.execute(query, (int(key),)).fetchone()
+                except (TypeError, ValueError):
+                    # Not one of our ids.
+                    row = None
+                if row is None:
+                    raise KeyError(key)
+                value = row[0]
+                if isinstance(value, (int, long)):
+                    value = str(value)
+            # Most recently used last.
+            self._remember(cache, key, value)
+            return value
+
+    def create_definitions(self, block_types):
+        """Make a definition of each of `block_types`, returning their ids."""
+        with self._transaction() as cursor:
+            def_ids = self._new_ids(cursor, len(block_types))
+            cursor.executemany(
+                "INSERT INTO definitions (def_id, block_type) VALUES (?, ?)", zip(def_ids, block_types)
+            )
+            def_ids = [str(def_id) for def_id in def_ids]
+            for def_id, block_type in zip(def_ids, block_types):
+                self._remember(self._definitions, def_id, block_type)
+        return def_ids
+
+    def create_usages(self, def_ids):
+        """Make a usage of each of `def_ids`, returning their ids."""
+        with self._transaction() as cursor:
+            usage_ids = self._new_ids(cursor, len(def_ids))
+            cursor.executemany(
+                "INSERT INTO usages (usage_id, def_id) VALUES (?, ?)",
+                zip(usage_ids, [int(def_id) for def_id in def_ids])
+            )
+            usage_ids = [str(usage_id) for usage_id in usage_ids]
+            for usage_id, def_id in zip(usage_ids, def_ids):
+                self._remember(self._usages, usage_id, def_id)
+        return usage_ids
+
+    def create_definition(self, block_type):
+        """Make a definition, storing its block type."""
+        return self.create_definitions([block_type])[0]
+
+    def create_usage(self, def_id):
+        """Make a usage, storing its definition id."""
+        return self.create_usages([def_id])[0]
+
+    def set_definition_id(self, usage_id, def_id):
+        """Point the usage `usage_id` at the definition `def_id`."""
+        try:
+            params = (int(def_id), int(usage_id))
+        except (TypeError, ValueError):
+            raise KeyError(usage_id)
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE usages SET def_id = ? WHERE usage_id = ?", params)
+            if cursor.rowcount != 1:
+                raise KeyError(usage_id)
+            self._usages.pop(usage_id, None)
+            self._remember(self._usages, usage_id, def_id)
+
+    def get_definition_id(self, usage_id):
+        """Get a definition_id by its usage id."""
+        with self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                # The remembered usages may have been changed elsewhere.
+                self._usages.clear()
+                self._data_version = data_version
+            return self._look_up(self._usages, usage_id, "SELECT def_id FROM usages WHERE usage_id = ?")
+
+    def get_block_type(self, def_id):
+        """Get a block_type by its definition id."""
+        return self._look_up(self._definitions, def_id, "SELECT block_type FROM definitions WHERE def_id = ?")